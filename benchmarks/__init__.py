@@ -0,0 +1 @@
+"""Performance benchmarks for the hep_mjerenje integration (run with ``python -m benchmarks``)."""
@@ -0,0 +1,82 @@
+"""Run benchmark scenarios and store the results as JSON.
+
+    python -m benchmarks                       # all scenarios
+    python -m benchmarks parse update_cycle --latency 0.05 --p429 0.02
+    python -m benchmarks --out results/base.json
+
+Requires Home Assistant in the environment (the integration imports it).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def _run(names, opts):
+    from .scenarios import SCENARIOS
+
+    results = {}
+    for name in names:
+        t0 = time.perf_counter()
+        results[name] = await SCENARIOS[name](opts)
+        results[name]["wall_seconds"] = round(time.perf_counter() - t0, 3)
+        print(f"{name}: {json.dumps(results[name])}", flush=True)
+    return results
+
+
+def main(argv=None) -> int:
+    sys.path.insert(0, ROOT)
+    import homeassistant.core  # noqa: F401  (import order expected by the integration)
+    from .scenarios import SCENARIOS
+
+    ap = argparse.ArgumentParser(prog="python -m benchmarks")
+    ap.add_argument("scenarios", nargs="*", choices=[[]] + list(SCENARIOS), default=[])
+    ap.add_argument("--repeat", type=int, default=3, help="repetitions for CPU scenarios (best is kept)")
+    ap.add_argument("--omms", type=int, default=2, help="meters in update_cycle")
+    ap.add_argument("--concurrency", type=int, default=8, help="request window ceiling (max_concurrency)")
+    ap.add_argument("--process-pool", action="store_true", help="import_years parses in worker processes")
+    ap.add_argument("--tou", action="store_true", help="enable the VT/NT tariff split and peak demand")
+    ap.add_argument("--latency", type=float, default=0.02, help="fake portal latency per request (s)")
+    ap.add_argument("--p401", type=float, default=0.0)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--p404", type=float, default=0.0)
+    ap.add_argument("--out", help="JSON file (default: benchmarks/results/<timestamp>.json)")
+    args = ap.parse_args(argv)
+    names = args.scenarios or list(SCENARIOS)
+    opts = {k: getattr(args, k) for k in ("repeat", "omms", "concurrency", "latency", "p401", "p429", "p404", "process_pool", "tou")}
+
+    results = asyncio.run(_run(names, opts))
+    doc = {
+        "meta": {
+            "git": _git_rev(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "options": opts,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(doc, fh, indent=2)
+    print(f"results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
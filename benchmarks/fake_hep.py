@@ -0,0 +1,86 @@
+"""Local aiohttp stand-in for the HEP Mjerenje API."""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date
+import asyncio
+import random
+from typing import Dict, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from .synth import PayloadCache, SynthConfig
+
+
+@dataclass
+class Faults:
+    latency: float = 0.0  # seconds per request
+    jitter: float = 0.0
+    p401: float = 0.0  # share of data requests answered 401
+    p429: float = 0.0  # share answered 429 with Retry-After
+    retry_after: float = 0.0
+    p404: float = 0.0  # share answered 404 (month not published)
+    seed: int = 7
+
+
+class FakeHep:
+    """Serves ``/user/login`` and ``/data/file/oib/{oib}/omm/{omm}/krivulja/mjesec/{m}/smjer/{P|R}``."""
+
+    def __init__(self, cfg: Optional[SynthConfig] = None, faults: Optional[Faults] = None):
+        self.payloads = PayloadCache(cfg or SynthConfig())
+        self.faults = faults or Faults()
+        self._rnd = random.Random(self.faults.seed)
+        self._tokens = 0
+        self.counters: Dict[str, int] = {"login": 0, "data": 0, "200": 0, "401": 0, "404": 0, "429": 0}
+        self._server: Optional[TestServer] = None
+
+    async def _delay(self) -> None:
+        f = self.faults
+        if f.latency or f.jitter:
+            await asyncio.sleep(max(0.0, f.latency + self._rnd.uniform(-f.jitter, f.jitter)))
+
+    async def _login(self, request: web.Request) -> web.Response:
+        self.counters["login"] += 1
+        await self._delay()
+        self._tokens += 1
+        return web.json_response({"Token": f"bench-token-{self._tokens}"})
+
+    async def _data(self, request: web.Request) -> web.Response:
+        self.counters["data"] += 1
+        await self._delay()
+        f = self.faults
+        roll = self._rnd.random()
+        if roll < f.p401 or not request.headers.get("Authorization", "").startswith("Bearer "):
+            self.counters["401"] += 1
+            return web.Response(status=401)
+        roll -= f.p401
+        if roll < f.p429:
+            self.counters["429"] += 1
+            return web.Response(status=429, headers={"Retry-After": f"{f.retry_after:g}"})
+        roll -= f.p429
+        month = request.match_info["month"]
+        m, y = (int(x) for x in month.split("."))
+        if roll < f.p404 or date(y, m, 1) > date.today():
+            self.counters["404"] += 1
+            return web.Response(status=404)
+        self.counters["200"] += 1
+        body = self.payloads.get(request.match_info["omm"], month, request.match_info["direction"])
+        return web.Response(body=body, content_type="application/json")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/user/login", self._login)
+        app.router.add_get(
+            "/data/file/oib/{oib}/omm/{omm}/krivulja/mjesec/{month}/smjer/{direction}", self._data)
+        return app
+
+    async def start(self) -> str:
+        """Start on a free local port; returns the base URL to use in place of ``HEP_BASE``."""
+        self._server = TestServer(self.app())
+        await self._server.start_server()
+        return str(self._server.make_url("")).rstrip("/")
+
+    async def close(self) -> None:
+        if self._server is not None:
+            await self._server.close()
+            self._server = None
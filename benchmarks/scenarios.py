@@ -0,0 +1,144 @@
+"""Benchmark scenarios; each returns a flat dict of metrics."""
+from __future__ import annotations
+from datetime import date
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from aiohttp import ClientSession
+
+from .fake_hep import Faults, FakeHep
+from .synth import TZ, SynthConfig, month_csv, months_back
+
+PARSE_KW = dict(date_col=1, time_col=2, kw_col=7, time_fmt="%H:%M:%S", date_fmt="%d.%m.%Y")
+
+
+def _timed(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+async def parse_throughput(opts: Dict) -> Dict:
+    """parse_csv / parse_csv_auto over 12 months of ';' and tab-delimited data."""
+    from custom_components.hep_mjerenje.api import HepMjerenjeClient
+
+    out: Dict = {}
+    months = months_back(12)
+    for label, delim in (("semicolon", ";"), ("tab", "\t")):
+        cfg = SynthConfig(delimiter=delim)
+        raws = [month_csv(cfg.omms[0], m, "P", cfg).encode() for m in months]
+        rows = sum(len(HepMjerenjeClient.parse_csv(r, tz=TZ, **PARSE_KW)[0]) for r in raws)
+        fast = _timed(lambda: [HepMjerenjeClient.parse_csv(r, tz=TZ, **PARSE_KW) for r in raws], opts["repeat"])
+        auto = _timed(lambda: [HepMjerenjeClient.parse_csv_auto(r, time_fmt=PARSE_KW["time_fmt"],
+                                                                date_fmt=PARSE_KW["date_fmt"], tz=TZ)
+                               for r in raws], opts["repeat"])
+        out[f"{label}_rows"] = rows
+        out[f"{label}_parse_csv_rows_per_s"] = round(rows / fast)
+        out[f"{label}_parse_csv_auto_rows_per_s"] = round(rows / auto)
+    return out
+
+
+async def export_payload(opts: Dict) -> Dict:
+    """build_lines + batching + gzip for 12 months of P/R."""
+    from custom_components.hep_mjerenje.api import HepMjerenjeClient
+    from custom_components.hep_mjerenje.exporter import _encode, build_lines
+
+    cfg = SynthConfig()
+    months = []
+    for m in months_back(12):
+        p, _ = HepMjerenjeClient.parse_csv(month_csv(cfg.omms[0], m, "P", cfg).encode(), tz=TZ, **PARSE_KW)
+        r, _ = HepMjerenjeClient.parse_csv(month_csv(cfg.omms[0], m, "R", cfg).encode(), tz=TZ, **PARSE_KW)
+        months.append((p, r))
+    result: Dict = {}
+
+    def run():
+        lines = [ln for p, r in months for ln in build_lines({}, cfg.omms[0], p, r, lambda v: v, tz=TZ)]
+        bodies = _encode(lines)
+        result.update(lines=len(lines), batches=len(bodies), gzip_bytes=sum(map(len, bodies)),
+                      raw_bytes=sum(len(ln) + 1 for ln in lines))
+
+    secs = _timed(run, opts["repeat"])
+    return {**result, "seconds": round(secs, 4), "lines_per_s": round(result["lines"] / secs)}
+
+
+@contextlib.asynccontextmanager
+async def _integration(opts: Dict, omms: List[str]):
+    """A throwaway HomeAssistant, fake portal and one coordinator per OMM."""
+    from homeassistant.core import HomeAssistant
+    from homeassistant.util import dt as dt_util
+    import custom_components.hep_mjerenje.api as api
+    from custom_components.hep_mjerenje.coordinator import HepCoordinator
+    from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+    faults = Faults(latency=opts["latency"], p401=opts["p401"], p429=opts["p429"], p404=opts["p404"])
+    fake = FakeHep(SynthConfig(omms=omms), faults)
+    base = await fake.start()
+    saved_base, api.HEP_BASE = api.HEP_BASE, base
+    config_dir = tempfile.mkdtemp(prefix="hep_bench_")
+    hass = HomeAssistant(config_dir)
+    dt_util.set_default_time_zone(TZ)
+    session = ClientSession()
+    tsdb = IntervalStore(hass, os.path.join(config_dir, "hep_mjerenje.db"))
+    client = api.HepMjerenjeClient("bench", "bench", session, max_concurrency=opts["concurrency"])
+    coordinators = []
+    for omm in omms:
+        c = HepCoordinator(hass, client, omm, store_key=f"bench_{omm}", oib="00000000000", tsdb=tsdb)
+        c.set_options({"max_concurrency": opts["concurrency"], "tou_enabled": opts.get("tou", False)})
+        coordinators.append(c)
+    try:
+        yield fake, client, coordinators
+    finally:
+        await session.close()
+        tsdb.close()
+        await fake.close()
+        api.HEP_BASE = saved_base
+        await hass.async_stop(force=True)
+
+
+async def update_cycle(opts: Dict) -> Dict:
+    """Cold and warm ``_async_update_data`` for ``--omms`` meters sharing one account."""
+    omms = [f"00000{i:05d}" for i in range(opts["omms"])]
+    async with _integration(opts, omms) as (fake, client, coordinators):
+        out: Dict = {}
+        for phase in ("cold", "warm"):
+            before = dict(fake.counters)
+            t0 = time.perf_counter()
+            await asyncio.gather(*[c._async_update_data() for c in coordinators])
+            out[f"{phase}_seconds"] = round(time.perf_counter() - t0, 4)
+            out[f"{phase}_requests"] = fake.counters["data"] - before["data"]
+            out[f"{phase}_phases_ms"] = coordinators[0].metrics.last.as_dict()["phases_ms"]
+            out[f"{phase}_loop_lag_ms"] = coordinators[0].metrics.last.loop_lag_ms()
+        out["logins"] = fake.counters["login"]
+        out["payloads_reused"] = client.payloads_reused
+        return out
+
+
+async def import_years(opts: Dict) -> Dict:
+    """``import_years`` over the last five years for one meter."""
+    this_year = date.today().year
+    years = [str(y) for y in range(this_year - 4, this_year + 1)]
+    async with _integration(opts, ["0000000001"]) as (fake, client, (coordinator,)):
+        t0 = time.perf_counter()
+        await (await coordinator.import_years(years, force=True, process_pool=opts["process_pool"]))
+        secs = time.perf_counter() - t0
+        rows = sum(e.get("rows", 0) for e in coordinator._ledger.months.values())
+        return {"seconds": round(secs, 3), "months": len(coordinator._ledger.months), "rows": rows,
+                "phases_ms": coordinator.import_metrics.last.as_dict()["phases_ms"],
+                "loop_lag_ms": coordinator.import_metrics.last.loop_lag_ms(),
+                "rows_per_s": round(rows / secs), "requests": fake.counters["data"],
+                "429s": fake.counters["429"], "401s": fake.counters["401"]}
+
+
+SCENARIOS: Dict[str, Callable[[Dict], Awaitable[Dict]]] = {
+    "parse": parse_throughput,
+    "export_payload": export_payload,
+    "update_cycle": update_cycle,
+    "import_years": import_years,
+}
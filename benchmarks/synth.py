@@ -0,0 +1,97 @@
+"""Synthetic HEP-format 15-minute CSV data."""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import base64
+import json
+import math
+import random
+from zoneinfo import ZoneInfo
+
+TZ = ZoneInfo("Europe/Zagreb")
+HEADER = ["OMM", "Datum", "Vrijeme", "Tarifa", "Faktor", "Jedinica", "Snaga kW", "Energija kWh", "Status"]
+
+
+@dataclass
+class SynthConfig:
+    omms: List[str] = field(default_factory=lambda: ["0000123456"])
+    delimiter: str = ";"  # or "\t"
+    missing_rate: float = 0.002  # share of intervals dropped at random
+    solar: bool = True  # non-empty R (export) curve
+    seed: int = 1
+
+
+def _month_bounds(month_str: str) -> Tuple[date, date]:
+    m, y = (int(x) for x in month_str.split("."))
+    first = date(y, m, 1)
+    nxt = date(y + (m == 12), m % 12 + 1, 1)
+    return first, nxt
+
+
+def interval_ends(month_str: str) -> Iterator[datetime]:
+    """Local wall-clock interval ends of a month (00:15 .. 00:00 of the next month), DST included.
+
+    Iterating in UTC yields 92 intervals on spring-forward and 100 on fall-back days,
+    with the repeated 02:xx hour exactly as the portal writes it.
+    """
+    first, nxt = _month_bounds(month_str)
+    t = datetime(first.year, first.month, first.day, tzinfo=TZ).astimezone(timezone.utc)
+    end = datetime(nxt.year, nxt.month, nxt.day, tzinfo=TZ).astimezone(timezone.utc)
+    step = timedelta(minutes=15)
+    while t < end:
+        t += step
+        yield t.astimezone(TZ)
+
+
+def _value(ts: datetime, direction: str, rnd: random.Random) -> float:
+    hour = ts.hour + ts.minute / 60
+    if direction == "P":
+        base = 0.08 + 0.12 * (math.sin((hour - 6) / 24 * 2 * math.pi) + 1)
+        return round(base * rnd.uniform(0.7, 1.3), 3)
+    sun = max(0.0, math.sin((hour - 6) / 14 * math.pi)) if 6 <= hour <= 20 else 0.0
+    return round(0.6 * sun * rnd.uniform(0.5, 1.0), 3)
+
+
+def month_csv(omm: str, month_str: str, direction: str, cfg: SynthConfig) -> str:
+    rnd = random.Random(f"{cfg.seed}/{omm}/{month_str}/{direction}")
+    d = cfg.delimiter
+    out = [d.join(HEADER)]
+    for ts in interval_ends(month_str):
+        if rnd.random() < cfg.missing_rate:
+            continue
+        kwh = _value(ts, direction, rnd) if direction == "P" or cfg.solar else 0.0
+        out.append(d.join((omm, f"{ts:%d.%m.%Y}", f"{ts:%H:%M:%S}", "VT", "1", "kWh",
+                           f"{kwh * 4:.3f}".replace(".", ","), f"{kwh:.3f}".replace(".", ","), "OK")))
+    return "\n".join(out) + "\n"
+
+
+def month_payload(omm: str, month_str: str, direction: str, cfg: SynthConfig) -> bytes:
+    """JSON body as served by the portal: the CSV base64-encoded in ``data``."""
+    raw = month_csv(omm, month_str, direction, cfg).encode("utf-8")
+    return json.dumps({"data": base64.b64encode(raw).decode("ascii")}).encode("utf-8")
+
+
+def months_back(n: int, today: Optional[date] = None) -> List[str]:
+    """The last ``n`` months up to and including the current one, oldest first."""
+    today = today or date.today()
+    y, m = today.year, today.month
+    out = []
+    for _ in range(n):
+        out.append(f"{m:02d}.{y}")
+        y, m = (y - 1, 12) if m == 1 else (y, m - 1)
+    return out[::-1]
+
+
+class PayloadCache:
+    """Memoizes generated payloads so server latency is not dominated by generation."""
+
+    def __init__(self, cfg: SynthConfig):
+        self.cfg = cfg
+        self._data: Dict[Tuple[str, str, str], bytes] = {}
+
+    def get(self, omm: str, month_str: str, direction: str) -> bytes:
+        key = (omm, month_str, direction)
+        if key not in self._data:
+            self._data[key] = month_payload(omm, month_str, direction, self.cfg)
+        return self._data[key]
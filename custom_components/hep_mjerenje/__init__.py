@@ -1,97 +1,197 @@
 from __future__ import annotations
+import hashlib
 import logging
 from datetime import datetime, timedelta
+from typing import Tuple
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.helpers import aiohttp_client
 from homeassistant.helpers.device_registry import async_get as async_get_device_registry
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
 from .const import (
     DOMAIN, CONF_USERNAME, CONF_PASSWORD, CONF_OIB, CONF_OMM, SERVICE_IMPORT_HISTORY,
     CONF_BACKFILL_N_MONTHS, CONF_BACKFILL_DONE,
     CONF_RESET_ON_INSTALL,
+    DATA_CLIENTS, DATA_COORDINATORS, DATA_TSDB, TSDB_FILENAME,
 )
 
 _LOGGER = logging.getLogger(__name__)
 PLATFORMS = [Platform.SENSOR]
+SERVICES = (SERVICE_IMPORT_HISTORY, "import_years", "reset_totals", "clear_import_cache", "reexport_range")
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
+
+def _user_hash(username: str) -> str:
+    # Stable per account without putting the username into file names or identifiers
+    return hashlib.sha1(username.encode()).hexdigest()[:12]
+
+
+def account_identifier(username: str) -> Tuple[str, str]:
+    """Device registry identifier of the account device the meters hang off."""
+    return DOMAIN, f"account_{_user_hash(username)}"
+
+
+def _get_client(hass: HomeAssistant, entry: ConfigEntry):
+    """One client (and login) per username, shared by all OMM entries of that account."""
     from .api import HepMjerenjeClient
-    from .coordinator import HepCoordinator
 
-    session = aiohttp_client.async_get_clientsession(hass)
     data = entry.data
-    client = HepMjerenjeClient(
-        username=data[CONF_USERNAME],
-        password=data[CONF_PASSWORD],
-        oib=data[CONF_OIB],
-        omm=data[CONF_OMM],
-        session=session,
-    )
-    store_key = entry.unique_id or f"{data[CONF_OIB]}_{data[CONF_OMM]}"
-    coordinator = HepCoordinator(hass, client, data[CONF_OMM], store_key=store_key)
-    coordinator.set_options(entry.options)
+    clients = hass.data[DOMAIN][DATA_CLIENTS]
+    slot = clients.get(data[CONF_USERNAME])
+    if slot is None:
+        session = aiohttp_client.async_get_clientsession(hass)
+        # Token survives restarts; the file name must not leak the username
+        user_hash = _user_hash(data[CONF_USERNAME])
+        slot = clients[data[CONF_USERNAME]] = {
+            "client": HepMjerenjeClient(
+                username=data[CONF_USERNAME],
+                password=data[CONF_PASSWORD],
+                session=session,
+                token_store=Store(hass, 1, f"hep_mjerenje_token_{user_hash}", private=True),
+            ),
+            "entries": set(),
+        }
+    slot["entries"].add(entry.entry_id)
+    return slot["client"]
 
-    # Reset/backfill BEFORE first refresh
-    opts = dict(entry.options)
-    if bool(opts.get(CONF_RESET_ON_INSTALL, True)) and not opts.get(CONF_BACKFILL_DONE, False):
-        try:
-            await coordinator.reset_persist()
-        except Exception as ex:
-            _LOGGER.warning("Reset persist failed: %s", ex)
 
-    # No backfill_n_months in login; first refresh happens immediately
-    await coordinator.async_config_entry_first_refresh()
+def _release_client(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    clients = hass.data[DOMAIN][DATA_CLIENTS]
+    slot = clients.get(entry.data[CONF_USERNAME])
+    if slot is None:
+        return
+    slot["entries"].discard(entry.entry_id)
+    if not slot["entries"]:
+        clients.pop(entry.data[CONF_USERNAME], None)
 
-    # Device hierarchy
-    dev_reg = async_get_device_registry(hass)
-    dev_reg.async_get_or_create(
-        config_entry_id=entry.entry_id,
-        identifiers={(DOMAIN, "hep_account")},
-        name="HEP ODS Account",
-        manufacturer="HEP ODS",
-        model="Mjerenje Portal",
-    )
-    dev_reg.async_get_or_create(
-        config_entry_id=entry.entry_id,
-        identifiers={(DOMAIN, data[CONF_OMM])},
-        name=f"HEP {data[CONF_OMM]}",
-        manufacturer="HEP ODS",
-        model="Smart Meter",
-        via_device=(DOMAIN, "hep_account"),
-    )
 
-    hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN]["coordinator"] = coordinator
+def _targets(hass: HomeAssistant, call):
+    """Coordinators addressed by a service call (all meters unless `omm` is given)."""
+    omm = call.data.get("omm")
+    coordinators = hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).values()
+    return [c for c in coordinators if not omm or c.omm == str(omm)]
+
+
+def _register_services(hass: HomeAssistant) -> None:
+    if hass.services.has_service(DOMAIN, SERVICE_IMPORT_HISTORY):
+        return
 
     async def handle_import_history(call):
         months = call.data.get("months", [])
         force = bool(call.data.get("force", False))
+        export = bool(call.data.get("export", False))
+        process_pool = bool(call.data.get("process_pool", False))
         if not isinstance(months, list):
             return
-        await coordinator.import_history(months, force=force)
-        await coordinator.async_request_refresh()
+        # Runs in the background; progress is reported via diag_import_progress and events
+        for coordinator in _targets(hass, call):
+            await coordinator.import_history(months, force=force, export=export, process_pool=process_pool)
 
     async def handle_import_years(call):
         years = call.data.get("years", [])
         force = bool(call.data.get("force", False))
+        export = bool(call.data.get("export", False))
+        process_pool = bool(call.data.get("process_pool", False))
         if not isinstance(years, list):
             return
-        await coordinator.import_years(years, force=force)
-        await coordinator.async_request_refresh()
+        for coordinator in _targets(hass, call):
+            await coordinator.import_years(years, force=force, export=export, process_pool=process_pool)
 
     async def handle_reset_totals(call):
-        await coordinator.reset_persist()
-        await coordinator.async_request_refresh()
+        for coordinator in _targets(hass, call):
+            await coordinator.reset_persist()
+            await coordinator.async_request_refresh()
 
     async def handle_clear_import_cache(call):
-        await coordinator.clear_import_cache()
-        await coordinator.async_request_refresh()
+        for coordinator in _targets(hass, call):
+            await coordinator.clear_import_cache()
+            await coordinator.async_request_refresh()
+
+    async def handle_reexport_range(call):
+        start = dt_util.parse_date(str(call.data.get("start", "")))
+        end = dt_util.parse_date(str(call.data.get("end", ""))) if call.data.get("end") else dt_util.now().date()
+        if start is None or end is None or start > end:
+            _LOGGER.warning("reexport_range: invalid range %s..%s", call.data.get("start"), call.data.get("end"))
+            return
+        for coordinator in _targets(hass, call):
+            written = await coordinator.reexport_range(start, end)
+            _LOGGER.info("Re-exported %s..%s for %s (%d batches)", start, end, coordinator.omm, written)
 
     hass.services.async_register(DOMAIN, SERVICE_IMPORT_HISTORY, handle_import_history)
     hass.services.async_register(DOMAIN, "import_years", handle_import_years)
     hass.services.async_register(DOMAIN, "reset_totals", handle_reset_totals)
     hass.services.async_register(DOMAIN, "clear_import_cache", handle_clear_import_cache)
+    hass.services.async_register(DOMAIN, "reexport_range", handle_reexport_range)
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
+    from .coordinator import HepCoordinator
+
+    data = entry.data
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    domain_data.setdefault(DATA_CLIENTS, {})
+    domain_data.setdefault(DATA_COORDINATORS, {})
+    if DATA_TSDB not in domain_data:
+        from .tsdb import IntervalStore
+        domain_data[DATA_TSDB] = IntervalStore(hass, hass.config.path(TSDB_FILENAME))
+    client = _get_client(hass, entry)
+    store_key = entry.unique_id or f"{data[CONF_OIB]}_{data[CONF_OMM]}"
+    coordinator = HepCoordinator(hass, client, data[CONF_OMM], store_key=store_key, oib=data[CONF_OIB],
+                                 tsdb=domain_data[DATA_TSDB])
+    coordinator.set_options(entry.options)
+
+    # Reset/backfill BEFORE first refresh, once per install. The flag lives in the entry data,
+    # since saving the options form replaces the options
+    opts = dict(entry.options)
+    if bool(opts.get(CONF_RESET_ON_INSTALL, True)) and not (opts.get(CONF_BACKFILL_DONE, False)
+                                                            or data.get(CONF_BACKFILL_DONE, False)):
+        try:
+            # A checkpointed import left by an earlier run resumes on top of its ledger
+            if not await coordinator.async_import_pending():
+                await coordinator.reset_persist()
+        except Exception as ex:
+            _LOGGER.warning("Reset persist failed: %s", ex)
+        else:
+            hass.config_entries.async_update_entry(entry, data={**data, CONF_BACKFILL_DONE: True})
+
+    # The last snapshot (if any) gives the sensors values at once and the portal refresh runs in
+    # the background, so setup never waits on HEP; without one, the first refresh happens here
+    if await coordinator.async_restore_snapshot():
+        entry.async_create_background_task(hass, coordinator.async_refresh(),
+                                           f"hep_mjerenje refresh {data[CONF_OMM]}")
+    else:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except Exception:
+            _release_client(hass, entry)
+            raise
+
+    # Device hierarchy
+    dev_reg = async_get_device_registry(hass)
+    account = account_identifier(data[CONF_USERNAME])
+    dev_reg.async_get_or_create(
+        config_entry_id=entry.entry_id,
+        identifiers={account},
+        name=f"HEP ODS Account {data[CONF_USERNAME]}",
+        manufacturer="HEP ODS",
+        model="Mjerenje Portal",
+    )
+    dev_reg.async_get_or_create(
+        config_entry_id=entry.entry_id,
+        identifiers={(DOMAIN, data[CONF_OMM])},
+        name=f"HEP {data[CONF_OMM]}",
+        manufacturer="HEP ODS",
+        model="Smart Meter",
+        via_device=account,
+    )
+    # Earlier versions put every account's meters under one shared device
+    legacy = dev_reg.async_get_device(identifiers={(DOMAIN, "hep_account")})
+    if legacy is not None:
+        dev_reg.async_remove_device(legacy.id)
+
+    domain_data[DATA_COORDINATORS][entry.entry_id] = coordinator
+    _register_services(hass)
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
@@ -99,5 +199,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unloaded:
-        hass.data.pop(DOMAIN, None)
+        domain_data = hass.data.get(DOMAIN, {})
+        domain_data.get(DATA_COORDINATORS, {}).pop(entry.entry_id, None)
+        _release_client(hass, entry)
+        if not domain_data.get(DATA_COORDINATORS):
+            for service in SERVICES:
+                hass.services.async_remove(DOMAIN, service)
+            tsdb = domain_data.get(DATA_TSDB)
+            if tsdb is not None:
+                await tsdb.async_close()
+            hass.data.pop(DOMAIN, None)
     return unloaded
@@ -1,10 +1,23 @@
 from __future__ import annotations
-import base64, csv, io
-from datetime import datetime
-from typing import List, Dict, Tuple, Optional
-import aiohttp, asyncio, logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import tzinfo
+from typing import Any, List, Dict, Tuple, Optional
+from urllib.parse import urlparse
+import aiohttp, asyncio, hashlib, logging, time
+from homeassistant.util import dt as dt_util
+from . import metrics, offload
+from .auth import TokenManager
+from .const import DEFAULT_MAX_CONCURRENCY
+from .month_cache import month_is_final
+from .parser import HepCsvParser, ParseStats
+from .retry import RETRYABLE_STATUSES, AdaptiveLimiter, CircuitBreaker, CircuitOpenError, RetryPolicy, get_breaker, parse_retry_after
+from .series import IntervalSeries
+from .stream import JsonBase64LineDecoder
 
 HEP_BASE = "https://mjerenje.hep.hr/mjerenja/v1/api"
+STREAM_CHUNK_SIZE = 64 * 1024
+PAYLOAD_CACHE_SIZE = 32  # month/direction payloads remembered per account
 _LOGGER = logging.getLogger(__name__)
 
 class MonthNotFound(Exception):
@@ -12,201 +25,315 @@ class MonthNotFound(Exception):
         super().__init__(f"Month not found: {month}")
         self.month = month
 
+@dataclass
+class _Payload:
+    """Last parsed result of one month/direction and what identifies its raw body."""
+    digest: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    rows: IntervalSeries
+    fallback: bool
+
 class HepMjerenjeClient:
-    def __init__(self, username: str, password: str, oib: str, omm: str,
-                 session: aiohttp.ClientSession, *, request_timeout: float = 30.0, max_retries: int = 3):
+    """One HEP account (username); shared by every OMM metered under it."""
+
+    def __init__(self, username: str, password: str,
+                 session: aiohttp.ClientSession, *, request_timeout: float = 30.0, max_retries: int = 3,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, token_store: Any = None):
         self._username = username
         self._password = password
-        self._oib = oib
-        self._omm = omm
         self._session = session
-        self._token: str | None = None
+        self._tokens = TokenManager(self._login_request, store=token_store)
         self._timeout = aiohttp.ClientTimeout(total=request_timeout)
         self._max_retries = max_retries
+        self._limiter = AdaptiveLimiter(max_concurrency)
+        self._parser: Optional[HepCsvParser] = None
+        self._breaker = get_breaker(urlparse(HEP_BASE).netloc)
+        self._payloads: "OrderedDict[Tuple[str, str, str], _Payload]" = OrderedDict()
+        self.payloads_reused = 0
 
     def set_timeout(self, seconds: float):
         self._timeout = aiohttp.ClientTimeout(total=seconds)
 
-    async def login(self) -> None:
+    def set_max_concurrency(self, limit: int):
+        # Ceiling of the adaptive window shared by all meters of this account
+        self._limiter.set_ceiling(limit)
+
+    @property
+    def username(self) -> str:
+        return self._username
+
+    @property
+    def tokens(self) -> TokenManager:
+        return self._tokens
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    @property
+    def limiter(self) -> AdaptiveLimiter:
+        return self._limiter
+
+    @property
+    def payloads_cached(self) -> int:
+        return len(self._payloads)
+
+    async def _login_request(self) -> str:
         payload = {"Username": self._username, "Password": self._password}
+        m = metrics.cycle()
+        m.count("logins")
+        with m.phase("login"):
+            return await self._post_login(payload)
+
+    async def _post_login(self, payload: Dict[str, str]) -> str:
         async with self._session.post(f"{HEP_BASE}/user/login", json=payload, timeout=self._timeout) as resp:
             resp.raise_for_status()
             data = await resp.json()
-            self._token = data.get("Token")
-            if not self._token:
+            token = data.get("Token")
+            if not token:
                 raise RuntimeError("HEP token missing in login response")
+            return token
 
-    def _auth_hdr(self) -> Dict[str, str]:
-        if not self._token:
-            raise RuntimeError("Not authenticated")
-        return {"Authorization": f"Bearer {self._token}"}
+    async def login(self) -> None:
+        """Force a fresh login (concurrent callers share it)."""
+        await self._tokens.async_force_refresh()
 
-    async def _get_month_csv_b64(self, month_str: str, direction: str) -> bytes:
-        url = (f"{HEP_BASE}/data/file/oib/{self._oib}/omm/{self._omm}/"
+    async def ensure_login(self) -> None:
+        """Make sure a usable token is cached; no network call while it is fresh."""
+        await self._tokens.async_get_token()
+
+    @staticmethod
+    def _auth_hdr(token: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {token}"}
+
+    async def _stream_month(self, oib: str, omm: str, month_str: str, direction: str, parser: HepCsvParser,
+                            tz: Optional[tzinfo]) -> Tuple[IntervalSeries, bool, bool]:
+        """Fetch one month/direction; returns (rows, fallback_used, unchanged).
+
+        New payloads are base64-decoded and parsed chunk by chunk as they arrive. When a
+        previous result is known the body is hashed first (and validators sent), so an
+        identical payload reuses the earlier rows without parsing.
+        """
+        url = (f"{HEP_BASE}/data/file/oib/{oib}/omm/{omm}/"
                f"krivulja/mjesec/{month_str}/smjer/{direction}")
+        policy = RetryPolicy()
         attempt = 0
         last_exc: Optional[Exception] = None
         while attempt < self._max_retries:
+            hint: Optional[float] = None
+            t_req: Optional[float] = None
             try:
-                async with self._session.get(url, headers=self._auth_hdr(), timeout=self._timeout) as resp:
-                    if resp.status == 404:
-                        raise MonthNotFound(month_str)
-                    if resp.status == 401:
-                        _LOGGER.debug("401 for %s %s; refreshing token...", direction, month_str)
-                        await self.login()
-                        continue
-                    if resp.status in (429, 500, 502, 503, 504):
-                        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
-                    resp.raise_for_status()
-                    data = await resp.json()
-                    b64 = data.get("data", "")
-                    return base64.b64decode(b64) if b64 else b""
-            except MonthNotFound:
+                # Fail fast while the circuit is open; the token (maybe a login) comes before the probe is taken
+                self._breaker.check()
+                token = await self._tokens.async_get_token()
+                known = self._payloads.get((omm, month_str, direction))
+                headers = self._auth_hdr(token)
+                if known is not None:
+                    if known.etag:
+                        headers["If-None-Match"] = known.etag
+                    if known.last_modified:
+                        headers["If-Modified-Since"] = known.last_modified
+                m = metrics.cycle()
+                self._breaker.before_request()
+                recorded = False
+                try:
+                    async with self._limiter.slot():
+                        t_req = time.perf_counter()
+                        async with self._session.get(url, headers=headers, timeout=self._timeout) as resp:
+                            latency = time.perf_counter() - t_req
+                            m.add("http_wait", latency)
+                            m.count("requests")
+                            metrics.trace("GET", month=month_str, direction=direction, status=resp.status,
+                                          attempt=attempt + 1, wait_ms=round(latency * 1000, 1),
+                                          window=self._limiter.limit)
+                            if resp.status in RETRYABLE_STATUSES:
+                                if resp.status in (429, 503):
+                                    hint = parse_retry_after(resp.headers.get("Retry-After"))
+                                recorded = True
+                                self._breaker.record_failure(hint)
+                                self._limiter.throttled(t_req)
+                                m.count("throttled")
+                                raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                            # Anything else means the portal answered; count it as healthy
+                            recorded = True
+                            self._breaker.record_success()
+                            self._limiter.succeeded(latency)
+                            if resp.status == 404:
+                                raise MonthNotFound(month_str)
+                            if resp.status == 304 and known is not None:
+                                return self._reuse(omm, month_str, direction, known)
+                            if resp.status != 401:
+                                resp.raise_for_status()
+                                return await self._read_payload(resp, (omm, month_str, direction), known, parser, tz)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if not recorded:
+                        recorded = True
+                        self._breaker.record_failure()
+                        if t_req is not None:
+                            self._limiter.throttled(t_req)
+                    raise
+                finally:
+                    if not recorded:
+                        # Never keep a half-open probe: cancellation and unexpected errors count as failures
+                        self._breaker.record_failure()
+                # 401: one shared re-login (outside the request slot), and it counts as an attempt
+                _LOGGER.debug("401 for %s %s; refreshing token...", direction, month_str)
+                last_exc = RuntimeError(f"Unauthorized for {direction} {month_str}")
+                attempt += 1
+                m.count("retries")
+                await self._tokens.async_invalidate(token)
+                continue
+            except (MonthNotFound, CircuitOpenError):
                 raise
             except Exception as ex:
                 last_exc = ex
-                delay = min(2 ** attempt + 0.1 * attempt, 5.0)
-                _LOGGER.debug("GET %s attempt %d failed: %s; retry in %.1fs", url, attempt + 1, ex, delay)
-                await asyncio.sleep(delay)
-                attempt += 1
+            attempt += 1
+            if attempt >= self._max_retries:
+                break
+            delay = policy.next_delay(hint)
+            if delay is None:
+                _LOGGER.debug("GET %s: server asked to retry after %.0fs; giving up for now", url, hint)
+                break
+            _LOGGER.debug("GET %s attempt %d failed: %s; retry in %.1fs", url, attempt, last_exc, delay)
+            metrics.cycle().count("retries")
+            await asyncio.sleep(delay)
         if last_exc:
-            _LOGGER.error("Failed to fetch %s after %d attempts: %s", url, self._max_retries, last_exc)
+            _LOGGER.error("Failed to fetch %s after %d attempts: %s", url, attempt, last_exc)
             raise last_exc
-        return b""
+        return IntervalSeries(), False, False
 
-    @staticmethod
-    def _pad_time_hms(t: str) -> str:
-        parts = t.split(":")
-        if len(parts) == 3:
-            h, m, s = parts
-            if len(h) == 1:
-                h = h.rjust(2, '0')
-            return f"{h}:{m}:{s}"
-        return t
+    async def _read_payload(self, resp: aiohttp.ClientResponse, key: Tuple[str, str, str], known: Optional[_Payload],
+                            parser: HepCsvParser, tz: Optional[tzinfo]) -> Tuple[IntervalSeries, bool, bool]:
+        """(rows, fallback used, unchanged) of a 200 response; an unchanged body is never parsed."""
+        m = metrics.cycle()
+        digest = hashlib.sha1()
+        decoder = JsonBase64LineDecoder("data")
+        session = parser.session(tz)
+        cpu = {"decode": 0.0, "parse": 0.0}
 
-    @staticmethod
-    def _detect_delim_and_header(text: str):
-        first = next((ln for ln in text.splitlines() if ln.strip()), '')
-        delim = '\t' if ('\t' in first) else ';'
-        reader = csv.reader(io.StringIO(text), delimiter=delim)
-        for row in reader:
-            if row:
-                return delim, row
-        return delim, []
+        def feed(chunks: List[bytes], last: bool) -> Optional[Tuple[IntervalSeries, bool]]:
+            # Runs in the executor, one call at a time per payload
+            for chunk in chunks:
+                t0 = time.perf_counter()
+                lines = decoder.feed(chunk)
+                t1 = time.perf_counter()
+                session.feed(lines)
+                cpu["decode"] += t1 - t0
+                cpu["parse"] += time.perf_counter() - t1
+            if not last:
+                return None
+            t0 = time.perf_counter()
+            lines = decoder.close()
+            t1 = time.perf_counter()
+            session.feed(lines)
+            result = session.finish()
+            cpu["decode"] += t1 - t0
+            cpu["parse"] += time.perf_counter() - t1
+            return result
+
+        pooled = offload.in_process_pool()
+        # With earlier rows to fall back on, or for a pool worker, the body is only hashed while it
+        # arrives and parsed once complete and changed; otherwise each chunk is decoded as it arrives
+        buffered = known is not None or pooled
+        t_body = time.perf_counter()
+        body: List[bytes] = []
+        size = 0
+        offloaded = 0.0
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            if buffered:
+                body.append(chunk)
+                continue
+            t0 = time.perf_counter()
+            await offload.run_cpu(feed, [chunk], False)
+            offloaded += time.perf_counter() - t0
+        m.add("http_body", time.perf_counter() - t_body - offloaded)
+        m.count("bytes_in", size)
+        if known is not None and digest.hexdigest() == known.digest:
+            # Unchanged: hand back the rows parsed last time
+            known.etag = resp.headers.get("ETag") or known.etag
+            known.last_modified = resp.headers.get("Last-Modified") or known.last_modified
+            return self._reuse(*key, known)
+        if pooled:
+            rows, fallback, stats, decoded, cpu["decode"] = await offload.run_cpu(
+                offload.parse_payload, b"".join(body), parser.layout, tz)
+            cpu["parse"] = stats.seconds
+            parser.record(stats)
+        else:
+            rows, fallback = await offload.run_cpu(feed, body, True)
+            decoded = decoder.bytes_out
+        m.add("decode", cpu["decode"])
+        m.add("parse", cpu["parse"])
+        m.count("bytes_decoded", decoded)
+        m.count("rows", len(rows))
+        metrics.trace("parsed", month=key[1], direction=key[2], rows=len(rows), bytes=size, pooled=pooled,
+                      decode_ms=round(cpu["decode"] * 1000, 1), parse_ms=round(cpu["parse"] * 1000, 1))
+        self._remember(key, _Payload(digest.hexdigest(), resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                                     rows, fallback))
+        return rows, fallback, False
+
+    def _remember(self, key: Tuple[str, str, str], payload: _Payload) -> None:
+        # Final months are cached by the coordinator; keep the LRU for ones that can still change
+        if month_is_final(key[1], dt_util.now().date()):
+            return
+        self._payloads[key] = payload
+        self._payloads.move_to_end(key)
+        while len(self._payloads) > PAYLOAD_CACHE_SIZE:
+            self._payloads.popitem(last=False)
+
+    def _reuse(self, omm: str, month_str: str, direction: str,
+               known: _Payload) -> Tuple[IntervalSeries, bool, bool]:
+        self._payloads.move_to_end((omm, month_str, direction))
+        self.payloads_reused += 1
+        metrics.cycle().count("payloads_reused")
+        _LOGGER.debug("%s %s %s unchanged; reusing parsed rows", omm, month_str, direction)
+        return known.rows, known.fallback, True
 
     @staticmethod
     def parse_csv(raw: bytes, *, date_col: int, time_col: int, kw_col: int,
-                  time_fmt: str, date_fmt: str) -> Tuple[List[Dict], bool]:
-        if not raw:
-            return [], False
-        text = raw.decode("utf-8", errors="replace")
-        delim, header = HepMjerenjeClient._detect_delim_and_header(text)
-        reader = csv.reader(io.StringIO(text), delimiter=delim)
-        rows: List[Dict] = []
-        first = True
-        for row in reader:
-            if not row:
-                continue
-            if first:
-                first = False
-                continue
-            try:
-                d = row[date_col].strip()
-                t = HepMjerenjeClient._pad_time_hms(row[time_col].strip())
-                ts = datetime.strptime(f"{d} {t}", f"{date_fmt} {time_fmt}")
-            except Exception:
-                ts = None
-                for fmt in ("%d.%m.%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
-                    try:
-                        ts = datetime.strptime(f"{row[date_col]} {row[time_col]}", fmt)
-                        break
-                    except Exception:
-                        pass
-            if ts is None:
-                continue
-            try:
-                val = float(row[kw_col].replace(',', '.').strip())
-            except Exception:
-                continue
-            rows.append({"ts": ts, "val": val})
-        if rows:
-            return rows, False
-        return HepMjerenjeClient.parse_csv_auto(raw, time_fmt=time_fmt, date_fmt=date_fmt)
+                  time_fmt: str, date_fmt: str, tz: Optional[tzinfo] = None) -> Tuple[IntervalSeries, bool]:
+        parser = HepCsvParser(date_col=date_col, time_col=time_col, kw_col=kw_col,
+                              time_fmt=time_fmt, date_fmt=date_fmt)
+        return parser.parse_bytes(raw, tz)
 
     @staticmethod
-    def parse_csv_auto(raw: bytes, *, time_fmt: str, date_fmt: str) -> Tuple[List[Dict], bool]:
+    def parse_csv_auto(raw: bytes, *, time_fmt: str, date_fmt: str,
+                       tz: Optional[tzinfo] = None) -> Tuple[IntervalSeries, bool]:
         if not raw:
-            return [], True
-        text = raw.decode("utf-8", errors="replace")
-        delim, header = HepMjerenjeClient._detect_delim_and_header(text)
-        reader = csv.reader(io.StringIO(text), delimiter=delim)
-        date_idx = None
-        time_idx = None
-        energy_idx = None
-        power_idx = None
-        status_idx = None
-        hdr = [h.strip().lower() for h in header]
-        for i, h in enumerate(hdr):
-            if h in ("datum", "date"): date_idx = i
-            elif h in ("vrijeme", "time"): time_idx = i
-            elif "energ" in h: energy_idx = i
-            elif "snaga" in h or "power" in h: power_idx = i
-            elif h == "status": status_idx = i
-        val_candidates = [i for i in (energy_idx, power_idx) if i is not None]
-        rows: List[Dict] = []
-        first = True
-        for row in reader:
-            if not row:
-                continue
-            if first:
-                first = False
-                continue
-            ts = None
-            if date_idx is not None and time_idx is not None:
-                d = row[date_idx].strip()
-                t = HepMjerenjeClient._pad_time_hms(row[time_idx].strip())
-                for fmt in (f"{date_fmt} {time_fmt}", "%d.%m.%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
-                    try:
-                        ts = datetime.strptime(f"{d} {t}", fmt)
-                        break
-                    except Exception:
-                        continue
-            if ts is None:
-                continue
-            val = None
-            for idx in val_candidates:
-                try:
-                    val = float(row[idx].replace(',', '.').strip())
-                    break
-                except Exception:
-                    pass
-            if val is None:
-                for idx in range(len(row)-1, -1, -1):
-                    if status_idx is not None and idx == status_idx:
-                        continue
-                    cell = row[idx].replace(',', '.').strip()
-                    try:
-                        val = float(cell)
-                        break
-                    except Exception:
-                        pass
-            if val is None:
-                continue
-            rows.append({"ts": ts, "val": val})
+            return IntervalSeries(), True
+        # Start with the header-detected layout for every row
+        parser = HepCsvParser(date_col=1, time_col=2, kw_col=7, time_fmt=time_fmt, date_fmt=date_fmt,
+                              prefer_auto=True)
+        rows, _ = parser.parse_bytes(raw, tz)
         return rows, True
 
-    async def get_month(self, month_str: str, *, date_col: int, time_col: int, kw_col: int,
-                        time_fmt: str, date_fmt: str) -> Tuple[List[Dict], List[Dict], bool]:
-        fallback_used = False
-        try:
-            p_raw = await self._get_month_csv_b64(month_str, "P")
-        except MonthNotFound:
-            p_raw = b""
+    def _get_parser(self, **layout) -> HepCsvParser:
+        p = self._parser
+        if p is None or any(getattr(p, k) != v for k, v in layout.items()):
+            p = self._parser = HepCsvParser(**layout)
+        return p
+
+    @property
+    def parse_stats(self) -> ParseStats:
+        return self._parser.last_stats if self._parser else ParseStats()
+
+    async def _get_direction(self, oib: str, omm: str, month_str: str, direction: str, parser: HepCsvParser,
+                             tz: Optional[tzinfo]) -> Tuple[IntervalSeries, bool, bool]:
         try:
-            r_raw = await self._get_month_csv_b64(month_str, "R")
+            return await self._stream_month(oib, omm, month_str, direction, parser, tz)
         except MonthNotFound:
-            r_raw = b""
-        p_rows, fb_p = self.parse_csv(p_raw, date_col=date_col, time_col=time_col, kw_col=kw_col, time_fmt=time_fmt, date_fmt=date_fmt)
-        r_rows, fb_r = self.parse_csv(r_raw, date_col=date_col, time_col=time_col, kw_col=kw_col, time_fmt=time_fmt, date_fmt=date_fmt)
-        fallback_used = fb_p or fb_r
-        return p_rows, r_rows, fallback_used
+            return IntervalSeries(), False, False
+
+    async def get_month(self, month_str: str, *, oib: str, omm: str, date_col: int, time_col: int, kw_col: int,
+                        time_fmt: str, date_fmt: str,
+                        tz: Optional[tzinfo] = None) -> Tuple[IntervalSeries, IntervalSeries, bool, bool]:
+        """(P rows, R rows, fallback parser used, both payloads unchanged since the last fetch)."""
+        parser = self._get_parser(date_col=date_col, time_col=time_col, kw_col=kw_col,
+                                  time_fmt=time_fmt, date_fmt=date_fmt)
+        (p_rows, fb_p, same_p), (r_rows, fb_r, same_r) = await asyncio.gather(
+            self._get_direction(oib, omm, month_str, "P", parser, tz),
+            self._get_direction(oib, omm, month_str, "R", parser, tz),
+        )
+        return p_rows, r_rows, fb_p or fb_r, same_p and same_r
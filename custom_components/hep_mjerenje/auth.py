@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import base64
+import json
+import logging
+import time
+
+from .const import TOKEN_REFRESH_SKEW
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """``exp`` claim (epoch seconds) of a JWT, or None when the token is opaque."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class TokenManager:
+    """Caches the HEP bearer token with its expiry and serializes re-logins.
+
+    Any number of concurrent 401s collapse into one in-flight login; callers that
+    raced on the same stale token wait for it and reuse the result.
+    """
+
+    def __init__(self, login: Callable[[], Awaitable[str]], *, store: Any = None,
+                 skew: float = TOKEN_REFRESH_SKEW):
+        self._login = login
+        self._store = store
+        self._skew = skew
+        self._token: Optional[str] = None
+        self._expires_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._loaded = store is None
+        self.logins = 0
+
+    @property
+    def token(self) -> Optional[str]:
+        return self._token
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return self._expires_at
+
+    def _fresh(self) -> bool:
+        if not self._token:
+            return False
+        return self._expires_at is None or time.time() < self._expires_at - self._skew
+
+    async def _load(self) -> None:
+        self._loaded = True
+        try:
+            data: Dict = await self._store.async_load() or {}
+        except Exception as ex:
+            _LOGGER.debug("Could not load cached HEP token: %s", ex)
+            return
+        if data.get("token") and not self._token:
+            self._token = data["token"]
+            self._expires_at = data.get("expires_at")
+
+    async def _save(self) -> None:
+        if self._store is None:
+            return
+        try:
+            await self._store.async_save({"token": self._token, "expires_at": self._expires_at})
+        except Exception as ex:
+            _LOGGER.debug("Could not persist HEP token: %s", ex)
+
+    async def _refresh(self, stale: Optional[str]) -> str:
+        async with self._lock:
+            if not self._loaded:
+                await self._load()
+            # Someone else already replaced the token we saw fail (or it is still fresh)
+            if self._fresh() and self._token != stale:
+                return self._token
+            token = await self._login()
+            self.logins += 1
+            self._token = token
+            self._expires_at = jwt_expiry(token)
+            _LOGGER.debug("HEP login ok; token expires %s", self._expires_at)
+            await self._save()
+            return token
+
+    async def async_get_token(self) -> str:
+        """Valid token, logging in first if missing or about to expire."""
+        if self._loaded and self._fresh():
+            return self._token
+        return await self._refresh(None)
+
+    async def async_invalidate(self, stale: Optional[str]) -> str:
+        """Report a 401 for ``stale`` and return a replacement token."""
+        return await self._refresh(stale)
+
+    async def async_force_refresh(self) -> str:
+        return await self._refresh(self._token)
@@ -15,6 +15,10 @@ from .const import (
     CONF_UPDATE_INTERVAL_MINUTES, DEFAULT_UPDATE_INTERVAL_MINUTES,
     CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT,
     CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY,
+    CONF_TOU_ENABLED, CONF_TOU_VT_WINTER, CONF_TOU_VT_SUMMER,
+    CONF_TOU_WEEKEND_NT, CONF_TOU_HOLIDAY_NT, CONF_TOU_EXTRA_HOLIDAYS,
+    DEFAULT_TOU_ENABLED, DEFAULT_TOU_VT_WINTER, DEFAULT_TOU_VT_SUMMER,
+    DEFAULT_TOU_WEEKEND_NT, DEFAULT_TOU_HOLIDAY_NT,
 )
 
 STEP_USER_DATA_SCHEMA = vol.Schema({
@@ -81,5 +85,11 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             vol.Optional(CONF_EXPORT_SERIES_15M, default=options.get(CONF_EXPORT_SERIES_15M, True)): bool,
             vol.Optional(CONF_EXPORT_SERIES_DAILY, default=options.get(CONF_EXPORT_SERIES_DAILY, True)): bool,
             vol.Optional(CONF_EXPORT_SERIES_MONTHLY, default=options.get(CONF_EXPORT_SERIES_MONTHLY, True)): bool,
+            vol.Optional(CONF_TOU_ENABLED, default=options.get(CONF_TOU_ENABLED, DEFAULT_TOU_ENABLED)): bool,
+            vol.Optional(CONF_TOU_VT_WINTER, default=options.get(CONF_TOU_VT_WINTER, DEFAULT_TOU_VT_WINTER)): str,
+            vol.Optional(CONF_TOU_VT_SUMMER, default=options.get(CONF_TOU_VT_SUMMER, DEFAULT_TOU_VT_SUMMER)): str,
+            vol.Optional(CONF_TOU_WEEKEND_NT, default=options.get(CONF_TOU_WEEKEND_NT, DEFAULT_TOU_WEEKEND_NT)): bool,
+            vol.Optional(CONF_TOU_HOLIDAY_NT, default=options.get(CONF_TOU_HOLIDAY_NT, DEFAULT_TOU_HOLIDAY_NT)): bool,
+            vol.Optional(CONF_TOU_EXTRA_HOLIDAYS, default=options.get(CONF_TOU_EXTRA_HOLIDAYS, "")): str,
         })
         return self.async_show_form(step_id="init", data_schema=schema)
@@ -12,6 +12,12 @@ DEFAULT_SCAN_INTERVAL_MINUTES = 360  # 6 hours
 # Services
 SERVICE_IMPORT_HISTORY = "import_history"
 
+# hass.data[DOMAIN] keys
+DATA_CLIENTS = "clients"            # username -> shared client + entry ids
+DATA_COORDINATORS = "coordinators"  # entry_id -> coordinator
+DATA_TSDB = "tsdb"                  # shared IntervalStore (SQLite)
+TSDB_FILENAME = "hep_mjerenje.db"
+
 # Fixed parser configuration (no longer exposed in Options)
 FIXED_DATE_COL = 1
 FIXED_TIME_COL = 2
@@ -44,6 +50,19 @@ DEFAULT_EXPORTER_ENABLED = False
 DEFAULT_EXPORT_SERIES_15M = True
 DEFAULT_EXPORT_SERIES_DAILY = True
 DEFAULT_EXPORT_SERIES_MONTHLY = True
+# Influx write path: batch bounds (uncompressed), retries, per-OMM on-disk spool for failed batches
+INFLUX_BATCH_MAX_LINES = 5000
+INFLUX_BATCH_MAX_BYTES = 512 * 1024
+INFLUX_WRITE_TIMEOUT = 20  # seconds
+INFLUX_WRITE_RETRIES = 3
+INFLUX_SPOOL_DIR = "hep_mjerenje_spool"
+INFLUX_SPOOL_MAX_BYTES = 16 * 1024 * 1024  # compressed, per OMM
+EXPORT_WATERMARK_SAVE_DELAY = 10  # seconds
+IMPORT_EXPORT_QUEUE_SIZE = 2  # parsed months waiting for the Influx writer during imports
+IMPORT_PROCESS_WORKERS = 2  # worker processes when an import asks for process_pool
+# Import checkpoints: after this many completed months or seconds, whichever comes first, and at the end
+IMPORT_CHECKPOINT_MONTHS = 6
+IMPORT_CHECKPOINT_SECONDS = 30
 
 # Advanced options
 CONF_UPDATE_INTERVAL_MINUTES = "update_interval_minutes"
@@ -51,7 +70,41 @@ CONF_REQUEST_TIMEOUT = "request_timeout"
 CONF_MAX_CONCURRENCY = "max_concurrency"
 DEFAULT_UPDATE_INTERVAL_MINUTES = DEFAULT_SCAN_INTERVAL_MINUTES
 DEFAULT_REQUEST_TIMEOUT = 30  # seconds
-DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Time-of-use tariff (VT/NT) split and peak demand; VT windows as local "HH:MM-HH:MM"
+CONF_TOU_ENABLED = "tou_enabled"
+CONF_TOU_VT_WINTER = "tou_vt_winter"
+CONF_TOU_VT_SUMMER = "tou_vt_summer"
+CONF_TOU_WEEKEND_NT = "tou_weekend_nt"
+CONF_TOU_HOLIDAY_NT = "tou_holiday_nt"
+CONF_TOU_EXTRA_HOLIDAYS = "tou_extra_holidays"  # comma list of YYYY-MM-DD / MM-DD
+DEFAULT_TOU_ENABLED = False
+DEFAULT_TOU_VT_WINTER = "07:00-21:00"
+DEFAULT_TOU_VT_SUMMER = "08:00-22:00"
+DEFAULT_TOU_WEEKEND_NT = False
+DEFAULT_TOU_HOLIDAY_NT = False
+
+# Auth: refresh the cached token this long before its JWT expiry
+TOKEN_REFRESH_SKEW = 120  # seconds
+
+# Adaptive polling: minutes of day / minutes
+SCHED_DEFAULT_WINDOW_START = 6 * 60  # until a publication time has been observed
+SCHED_WINDOW_MARGIN = 30
+SCHED_WINDOW_LENGTH = 12 * 60  # after this, fall back to the configured interval
+SCHED_MIN_BACKOFF = 15
+SCHED_MAX_BACKOFF = 30
+SCHED_HISTORY = 14  # observed publication times kept
+
+# Retry/backoff for portal requests (decorrelated jitter) and the per-host circuit breaker
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 10.0  # seconds; a longer Retry-After hands over to the breaker
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 120  # seconds
+# Adaptive request window (AIMD); max_concurrency is its ceiling
+LIMIT_INITIAL_WINDOW = 2
+LIMIT_LATENCY_TOLERANCE = 2.0  # grow only while latency stays within this factor of the baseline
+LIMIT_DECREASE_FACTOR = 0.5
 
 # Sensor keys
 KEY_CONS_TOTAL = "consumption_total_kwh"  # lifetime
@@ -64,6 +117,15 @@ KEY_CONS_PREV_MONTH = "consumption_prev_month_kwh"
 KEY_EXP_PREV_MONTH  = "export_prev_month_kwh"
 KEY_CONS_YEAR = "consumption_year_kwh"    # YTD
 KEY_EXP_YEAR  = "export_year_kwh"         # YTD
+# Tariff sensors (consumption only; present when the VT/NT split is enabled)
+KEY_CONS_MONTH_VT = "consumption_month_vt_kwh"
+KEY_CONS_MONTH_NT = "consumption_month_nt_kwh"
+KEY_CONS_YESTERDAY_VT = "consumption_yesterday_vt_kwh"
+KEY_CONS_YESTERDAY_NT = "consumption_yesterday_nt_kwh"
+KEY_CONS_YEAR_VT = "consumption_year_vt_kwh"
+KEY_CONS_YEAR_NT = "consumption_year_nt_kwh"
+KEY_PEAK_MONTH = "peak_demand_month_kw"  # highest 15-minute average this month
+KEY_PEAK_MONTH_AT = "peak_demand_month_at"
 
 # Diagnostics keys
 KEY_DIAG_ROWS = "diag_rows_total"
@@ -75,6 +137,39 @@ KEY_DIAG_SKIPPED_MONTHS = "diag_skipped_months"
 KEY_DIAG_FALLBACK_USED = "diag_fallback_used"
 KEY_DIAG_CUR_ROWS = "diag_current_month_rows"
 KEY_DIAG_PREV_ROWS = "diag_prev_month_rows"
+KEY_DIAG_PARSE_RATE = "diag_parse_rows_per_s"
+KEY_DIAG_BREAKER = "diag_breaker_state"
+KEY_DIAG_INFLUX_SPOOL = "diag_influx_spooled_batches"
+# Refreshed with every cycle; excluded from change tracking and the recorder
+KEY_DIAG_NEXT_POLL = "diag_next_poll"
+KEY_DIAG_PUBLISH_WINDOW = "diag_publish_window"
+# Last refresh cycle: wall time, per-phase ms, HEP requests; p50/p95 over recent cycles
+KEY_DIAG_CYCLE_MS = "diag_cycle_ms"
+KEY_DIAG_PHASES = "diag_phase_ms"
+KEY_DIAG_REQUESTS = "diag_requests"
+KEY_DIAG_CYCLE_PCT = "diag_cycle_pct_ms"
+KEY_DIAG_FETCH_WINDOW = "diag_fetch_window"  # current adaptive request window / ceiling
+KEY_DIAG_LOOP_LAG = "diag_loop_lag_ms"  # event-loop stall (p95/max) during the last refresh
+# Background import job: state, months done/total, rows, rows/s, failed months
+KEY_DIAG_IMPORT = "diag_import_progress"
+EVENT_IMPORT_PROGRESS = "hep_mjerenje_import_progress"
+# Values restored from the last snapshot: when they were computed (gone after the first good refresh)
+KEY_DIAG_RESTORED = "diag_restored_from"
+KEY_DIAG_STALE = "diag_stale"  # last good values still shown while refreshes fail
+VOLATILE_DIAG_KEYS = (KEY_DIAG_PARSE_RATE, KEY_DIAG_NEXT_POLL, KEY_DIAG_CYCLE_MS, KEY_DIAG_PHASES,
+                      KEY_DIAG_REQUESTS, KEY_DIAG_CYCLE_PCT, KEY_DIAG_FETCH_WINDOW,
+                      KEY_DIAG_LOOP_LAG, "last_update")
 
 # Persistence keys
-PERSIST_IMPORTED_MONTHS = "imported_months"
+PERSIST_VERSION = 2
+PERSIST_SAVE_DELAY = 10  # seconds
+PERSIST_MONTHS = "months"
+PERSIST_LEGACY_TOTALS = "legacy_totals"
+PERSIST_IMPORTED_MONTHS = "imported_months"  # v1 schema only
+
+# Snapshot of the coordinator data, restored at setup (stale-while-revalidate)
+SNAPSHOT_SAVE_DELAY = 10  # seconds
+SNAPSHOT_STALE_MAX_AGE = 24 * 3600  # seconds entities keep showing the last good values
+
+# Month cache (finalized months served from disk)
+MONTH_FINAL_GRACE_DAYS = 5
@@ -1,10 +1,11 @@
 from __future__ import annotations
 import logging, asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from contextlib import nullcontext, suppress
+from functools import partial
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Set, Tuple, Optional
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.util import dt as dt_util
 from homeassistant.helpers import aiohttp_client
 
@@ -14,49 +15,82 @@ from .const import (
     KEY_CONS_YESTERDAY, KEY_EXP_YESTERDAY,
     KEY_CONS_PREV_MONTH, KEY_EXP_PREV_MONTH,
     KEY_CONS_YEAR, KEY_EXP_YEAR,
+    KEY_CONS_MONTH_VT, KEY_CONS_MONTH_NT, KEY_CONS_YESTERDAY_VT, KEY_CONS_YESTERDAY_NT,
+    KEY_CONS_YEAR_VT, KEY_CONS_YEAR_NT, KEY_PEAK_MONTH, KEY_PEAK_MONTH_AT,
     KEY_DIAG_ROWS, KEY_DIAG_CUR_ROWS, KEY_DIAG_PREV_ROWS, KEY_DIAG_LAST_TS_P, KEY_DIAG_LAST_TS_R, KEY_DIAG_SUM_P, KEY_DIAG_SUM_R, KEY_DIAG_SKIPPED_MONTHS, KEY_DIAG_FALLBACK_USED,
+    KEY_DIAG_PARSE_RATE, KEY_DIAG_BREAKER, KEY_DIAG_INFLUX_SPOOL, KEY_DIAG_NEXT_POLL, KEY_DIAG_PUBLISH_WINDOW,
+    KEY_DIAG_CYCLE_MS, KEY_DIAG_PHASES, KEY_DIAG_REQUESTS, KEY_DIAG_CYCLE_PCT, KEY_DIAG_IMPORT,
+    KEY_DIAG_FETCH_WINDOW, KEY_DIAG_LOOP_LAG, KEY_DIAG_RESTORED,
+    EVENT_IMPORT_PROGRESS,
     DEFAULT_SCAN_INTERVAL_MINUTES,
     FIXED_DATE_COL, FIXED_TIME_COL, FIXED_KW_COL, FIXED_TIME_FMT, FIXED_DATE_FMT, FIXED_VALUE_IS_ENERGY,
-    PERSIST_IMPORTED_MONTHS,
     CONF_SYNC_TOTAL_TO_YTD,
     CONF_UPDATE_INTERVAL_MINUTES, DEFAULT_UPDATE_INTERVAL_MINUTES,
     CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT,
     CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY,
+    CONF_EXPORT_SERIES_15M, CONF_EXPORT_SERIES_DAILY, CONF_EXPORT_SERIES_MONTHLY,
+    IMPORT_EXPORT_QUEUE_SIZE, IMPORT_PROCESS_WORKERS, IMPORT_CHECKPOINT_MONTHS, IMPORT_CHECKPOINT_SECONDS,
+    SNAPSHOT_STALE_MAX_AGE,
 )
 from .api import HepMjerenjeClient
+from .month_cache import MonthCache, month_is_final
+from .ledger import MonthLedger, rows_digest
+from .retry import CircuitBreaker
+from .exporter import InfluxExporter, build_lines
+from .series import SLOT, IntervalSeries, midnight_epoch
+from .tsdb import IntervalStore
+from .statistics import async_push_statistics
+from .scheduler import PollScheduler
+from .metrics import CycleMetrics, Metrics
+from .import_job import ImportJob
+from .rollup import MonthRollup, RollupCache
+from .tariff import TouSchedule
+from .snapshot import DataSnapshot
+from . import offload
 
 _LOGGER = logging.getLogger(__name__)
 
 class HepCoordinator(DataUpdateCoordinator):
-    def __init__(self, hass: HomeAssistant, client: HepMjerenjeClient, omm: str, store_key: str):
+    def __init__(self, hass: HomeAssistant, client: HepMjerenjeClient, omm: str, store_key: str, *, oib: str,
+                 tsdb: IntervalStore):
         super().__init__(
             hass,
             _LOGGER,
-            name="HEP Mjerenje",
+            name=f"HEP Mjerenje {omm}",
             update_interval=timedelta(minutes=DEFAULT_SCAN_INTERVAL_MINUTES),
         )
         self._client = client
+        self._oib = oib
         self._omm = omm
-        self._store = Store(hass, 1, f"hep_mjerenje_totals_{store_key}")
-        self._persist: Dict = {}
+        self._ledger = MonthLedger(hass, store_key)
+        self._month_cache = MonthCache(omm, tsdb)
+        self._exporter = InfluxExporter(hass, omm)
+        self._tsdb = tsdb
+        self._scheduler = PollScheduler(hass, omm)
+        self._poll_ceiling = timedelta(minutes=DEFAULT_UPDATE_INTERVAL_MINUTES)
         self._options: Dict = {}
         self._lock = asyncio.Lock()
-        self._ytd_cache: Optional[Dict[str, float]] = None
-        self._ytd_cache_date: Optional[datetime] = None
         self._max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+        self.changed_keys: Set[str] = set()
+        self.metrics = Metrics()
+        self.import_metrics = Metrics()
+        self._import = ImportJob(hass, omm)
+        self._import_task: Optional[asyncio.Task] = None
+        self._import_error: Optional[str] = None  # why the last run stopped; cleared by import_history
+        self._rollups = RollupCache()
+        self._checkpoint_lock = asyncio.Lock()
+        self._tou: Optional[TouSchedule] = None
+        self._snapshot = DataSnapshot(hass, omm)
+        self._data_at: Optional[datetime] = None  # when the current data was computed
 
     async def _load_persist(self):
-        self._persist = await self._store.async_load() or {"cons_total": 0.0, "exp_total": 0.0, PERSIST_IMPORTED_MONTHS: []}
-        if not isinstance(self._persist.get(PERSIST_IMPORTED_MONTHS), list):
-            self._persist[PERSIST_IMPORTED_MONTHS] = []
+        await self._ledger.async_load()
 
-    async def _save_persist(self):
-        await self._store.async_save(self._persist)
-
-    async def reset_persist(self):
-        self._persist = {"cons_total": 0.0, "exp_total": 0.0, PERSIST_IMPORTED_MONTHS: []}
-        await self._save_persist()
-        self.async_set_updated_data({
+    def _empty_data(self) -> Dict:
+        tou = dict.fromkeys((KEY_CONS_MONTH_VT, KEY_CONS_MONTH_NT, KEY_CONS_YESTERDAY_VT, KEY_CONS_YESTERDAY_NT,
+                             KEY_CONS_YEAR_VT, KEY_CONS_YEAR_NT), 0.0) if self._tou else {}
+        return {
+            **tou,
             KEY_CONS_TOTAL: 0.0,
             KEY_EXP_TOTAL: 0.0,
             KEY_CONS_MONTH: 0.0,
@@ -77,57 +111,211 @@ class HepCoordinator(DataUpdateCoordinator):
             KEY_DIAG_SKIPPED_MONTHS: None,
             KEY_DIAG_FALLBACK_USED: False,
             "last_update": datetime.utcnow().isoformat(),
-        })
+        }
+
+    async def async_restore_snapshot(self) -> bool:
+        """Show the last computed values until the first refresh replaces them."""
+        restored = await self._snapshot.async_load(dt_util.now().date())
+        if restored is None:
+            return False
+        data, saved_at = restored
+        data[KEY_DIAG_RESTORED] = saved_at.isoformat(timespec="seconds")
+        self._data_at = saved_at
+        self.data = self._track_changes(data)
+        _LOGGER.debug("Restored %d values for %s computed at %s", len(data), self._omm, saved_at)
+        return True
+
+    @property
+    def serving_stale(self) -> bool:
+        """Refreshes are failing but the last good values are recent enough to keep showing."""
+        if self.last_update_success or self.data is None or self._data_at is None:
+            return False
+        return dt_util.now() - self._data_at < timedelta(seconds=SNAPSHOT_STALE_MAX_AGE)
+
+    async def async_import_pending(self) -> bool:
+        """An import checkpointed before a restart is waiting to resume."""
+        await self._import.async_load()
+        return self._import.active
+
+    async def reset_persist(self):
+        await self._ledger.async_reset()
+        self.async_set_updated_data(self._track_changes(self._empty_data()))
 
     async def clear_import_cache(self):
-        if not self._persist:
+        if not self._ledger.loaded:
             await self._load_persist()
-        self._persist[PERSIST_IMPORTED_MONTHS] = []
-        await self._save_persist()
+        self._ledger.clear_flags()
+        await self._month_cache.async_clear()
+
+    def _lifetime(self) -> Tuple[float, float]:
+        return self._ledger.lifetime(include_live=bool(self._options.get(CONF_SYNC_TOTAL_TO_YTD, True)))
 
     def set_options(self, options: Dict):
         self._options = options or {}
         # Advanced options
         interval_min = int(self._options.get(CONF_UPDATE_INTERVAL_MINUTES, DEFAULT_UPDATE_INTERVAL_MINUTES))
-        self.update_interval = timedelta(minutes=interval_min)
+        # Upper bound for the adaptive scheduler
+        self._poll_ceiling = timedelta(minutes=interval_min)
+        self.update_interval = self._poll_ceiling
         req_timeout = float(self._options.get(CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT))
         try:
             self._client.set_timeout(req_timeout)
         except Exception:
             pass
         self._max_concurrency = int(self._options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY))
+        try:
+            self._client.set_max_concurrency(self._max_concurrency)
+        except Exception:
+            pass
+        self._tou = TouSchedule.from_options(self._options)
+
+    @property
+    def tou_enabled(self) -> bool:
+        return self._tou is not None
 
     def _conv(self, v: float) -> float:
         # Values are energy (kWh) by design
         return v
 
-    async def _fetch_month(self, month_str: str) -> Tuple[List[Dict], List[Dict], bool, str | None]:
+    async def _fetch_month(self, month_str: str) -> Tuple[IntervalSeries, IntervalSeries, bool, str | None, bool]:
+        """(P rows, R rows, fallback used, month if skipped, unchanged since the last fetch)."""
+        cached = await self._month_cache.async_get(month_str, dt_util.DEFAULT_TIME_ZONE)
+        if cached is not None:
+            return cached[0], cached[1], False, None, True
         try:
-            p_rows, r_rows, fb = await self._client.get_month(
+            p_rows, r_rows, fb, unchanged = await self._client.get_month(
                 month_str,
+                oib=self._oib,
+                omm=self._omm,
                 date_col=FIXED_DATE_COL,
                 time_col=FIXED_TIME_COL,
                 kw_col=FIXED_KW_COL,
                 time_fmt=FIXED_TIME_FMT,
                 date_fmt=FIXED_DATE_FMT,
+                tz=dt_util.DEFAULT_TIME_ZONE,
             )
-            return p_rows, r_rows, fb, None
         except Exception as ex:
             _LOGGER.warning("Skipping month %s due to error: %s", month_str, ex)
-            return [], [], False, month_str
+            return IntervalSeries(), IntervalSeries(), False, month_str, False
+        return p_rows, r_rows, fb, None, unchanged
+
+    async def _fetch_months(self, months: List[str]) -> Dict[str, Tuple[IntervalSeries, IntervalSeries, bool, str | None, bool]]:
+        """Fetch distinct months concurrently; the client bounds in-flight requests."""
+        unique = list(dict.fromkeys(months))
+        results = await asyncio.gather(*[self._fetch_month(m) for m in unique])
+        return dict(zip(unique, results))
+
+    @property
+    def omm(self) -> str:
+        return self._omm
+
+    @property
+    def breaker_state(self) -> str:
+        return self._client.breaker.state
+
+    def diagnostics(self) -> Dict:
+        """Timing and state for the config entry diagnostics download."""
+        client = self._client
+        return {
+            "refresh": self.metrics.as_dict(),
+            "import": self.import_metrics.as_dict(),
+            "client": {
+                "breaker": client.breaker.as_dict(),
+                "limiter": client.limiter.as_dict(),
+                "token_expires_at": client.tokens.expires_at,
+                "logins": client.tokens.logins,
+                "payloads_cached": client.payloads_cached,
+                "payloads_reused": client.payloads_reused,
+                "parse_rows_per_s": round(client.parse_stats.rows_per_s),
+            },
+            "ledger_months": len(self._ledger.months),
+            "publish_window": self._scheduler.window,
+            "update_interval_s": self.update_interval.total_seconds() if self.update_interval else None,
+            "influx_spooled_batches": self._exporter.spooled,
+            "data_computed_at": self._data_at.isoformat() if self._data_at else None,
+            "serving_stale": self.serving_stale,
+        }
 
     @staticmethod
     def _month_string(dt) -> str:
         return dt.strftime("%m.%Y")
 
+    async def _rollup(self, month_str: str, p_rows: IntervalSeries, r_rows: IntervalSeries) -> MonthRollup:
+        """The month's rollup pyramid, built once per payload in the executor."""
+        rollup = self._rollups.get(month_str, p_rows, r_rows, self._tou)
+        if rollup is None:
+            rollup = await self.hass.async_add_executor_job(
+                MonthRollup, p_rows, r_rows, dt_util.DEFAULT_TIME_ZONE, self._tou)
+            self._rollups.put(month_str, rollup)
+        return rollup
+
+    def _record_month(self, month_str: str, rollup: MonthRollup, *, imported: bool = False) -> bool:
+        """Replace a fetched month's ledger entry; returns True when it changed."""
+        conv = self._conv
+        p_rows, r_rows = rollup.p_rows, rollup.r_rows
+        cons = conv(rollup.total("P"))
+        exp = conv(rollup.total("R"))
+        tou = None
+        if rollup.schedule is not None:
+            vt, nt = rollup.tou_range()
+            tou = {"key": rollup.schedule.key, "vt": conv(vt), "nt": conv(nt)}
+        return self._ledger.upsert(
+            month_str,
+            cons=cons,
+            exp=exp,
+            rows=len(p_rows) + len(r_rows),
+            digest=rows_digest(p_rows, r_rows),
+            final=month_is_final(month_str, dt_util.now().date()),
+            imported=imported,
+            tou=tou,
+        )
+
+    def _tou_stale(self, month_str: str) -> bool:
+        """Tariff split missing or made with another schedule."""
+        if self._tou is None:
+            return False
+        return ((self._ledger.get(month_str) or {}).get("tou") or {}).get("key") != self._tou.key
+
+    def _track_changes(self, data: Dict) -> Dict:
+        """Record which keys differ from the current data so entities can skip no-op writes."""
+        old = self.data or {}
+        self.changed_keys = {k for k in set(old) | set(data) if old.get(k) != data.get(k)}
+        return data
+
     async def _async_update_data(self) -> Dict:
+        # A failed refresh changes no values (entities still react to availability)
+        self.changed_keys = set()
+        with self.metrics.measure() as cyc:
+            data = await self._refresh(cyc)
+        last = self.metrics.last
+        data.update({
+            KEY_DIAG_CYCLE_MS: round(last.seconds * 1000),
+            KEY_DIAG_PHASES: {k: round(v * 1000) for k, v in sorted(last.phases.items())},
+            KEY_DIAG_REQUESTS: last.counters.get("requests", 0),
+            KEY_DIAG_CYCLE_PCT: self.metrics.percentiles().get("total"),
+            KEY_DIAG_IMPORT: self._import_progress(),
+            KEY_DIAG_FETCH_WINDOW: f"{self._client.limiter.limit}/{self._client.limiter.ceiling}",
+            KEY_DIAG_LOOP_LAG: last.loop_lag_ms(),
+        })
+        # Picks up an import checkpointed before a restart or paused while the portal was down
+        self._start_import(resume=True)
+        now = dt_util.now()
+        self._data_at = now
+        self._snapshot.save(data, now.date(), now)
+        return self._track_changes(data)
+
+    async def _refresh(self, cyc: CycleMetrics) -> Dict:
         async with self._lock:
             try:
-                await self._client.login()
+                await self._client.ensure_login()
             except Exception as ex:
                 _LOGGER.debug("Initial login failed (will retry on request): %s", ex)
-        if not self._persist:
+        if not self._ledger.loaded:
             await self._load_persist()
+        await self._import.async_load()
+        if self.breaker_state == CircuitBreaker.OPEN:
+            # Keep the last good values instead of zeroing every month against a dead portal
+            raise UpdateFailed("HEP portal unavailable (circuit open)")
 
         local_now = dt_util.now()
         today = local_now.date()
@@ -139,90 +327,81 @@ class HepCoordinator(DataUpdateCoordinator):
         diag_skipped = []
         diag_fallback = False
 
-        # Current month
-        p_rows, r_rows, fb, sk = await self._fetch_month(this_month_str)
-        if sk: diag_skipped.append(sk)
-        diag_fallback = diag_fallback or fb
-        for r in p_rows:
-            if r['ts'].tzinfo is None:
-                r['ts'] = dt_util.as_local(r['ts'])
-        for r in r_rows:
-            if r['ts'].tzinfo is None:
-                r['ts'] = dt_util.as_local(r['ts'])
-        cons_month_kwh = sum(conv(r['val']) for r in p_rows)
-        exp_month_kwh = sum(conv(r['val']) for r in r_rows)
-        cur_rows = len(p_rows) + len(r_rows)
+        tz = dt_util.DEFAULT_TIME_ZONE
+        # One concurrent pass: current, previous and any YTD month not finalized or not yet in the local store
+        present = await self._tsdb.async_months_present(self._omm, local_now.year)
+        if prev_month_dt.year != local_now.year:
+            present.update(await self._tsdb.async_months_present(self._omm, prev_month_dt.year))
+        plan = [this_month_str, prev_month_str]
+        for m in range(1, local_now.month + 1):
+            m_str = f"{m:02d}.{local_now.year}"
+            if not (self._ledger.get(m_str) or {}).get("final") or m_str not in present or self._tou_stale(m_str):
+                plan.append(m_str)
+        with cyc.phase("fetch"):
+            fetched = await self._fetch_months(plan)
+        rollups: Dict[str, MonthRollup] = {}
+        for m_str, (p_m, r_m, fb_m, sk_m, same_m) in fetched.items():
+            if sk_m:
+                diag_skipped.append(sk_m)
+            elif same_m and m_str in present and m_str in self._ledger.months and not self._tou_stale(m_str):
+                # Byte-identical payload: ledger and store already hold its aggregates
+                pass
+            else:
+                with cyc.phase("rollup"):
+                    rollups[m_str] = await self._rollup(m_str, p_m, r_m)
+            diag_fallback = diag_fallback or fb_m
+        # Same lock as the import's per-month writes, so ledger and store change together
+        async with self._lock:
+            for m_str, rollup in rollups.items():
+                with cyc.phase("ledger"):
+                    changed = self._record_month(m_str, rollup)
+                # Written once more when the month turns final; from then on the store stands in for the portal
+                final = month_is_final(m_str, today)
+                if changed or m_str not in present or (final and not present[m_str]):
+                    with cyc.phase("store"):
+                        await self._tsdb.async_write_month(self._omm, m_str, rollup.p_rows, rollup.r_rows, tz,
+                                                           rollup, final)
+        if this_month_str in diag_skipped and self.breaker_state != CircuitBreaker.CLOSED:
+            raise UpdateFailed("HEP portal unavailable (circuit open)")
+        with cyc.phase("statistics"):
+            await self._push_statistics()
 
-        # Yesterday
-        cons_yday_kwh = sum(conv(r['val']) for r in p_rows if r['ts'].date() == yesterday)
-        exp_yday_kwh = sum(conv(r['val']) for r in r_rows if r['ts'].date() == yesterday)
-
-        # Previous month
-        p_prev, r_prev, fb2, sk2 = await self._fetch_month(prev_month_str)
-        if sk2: diag_skipped.append(sk2)
-        diag_fallback = diag_fallback or fb2
-        for r in p_prev:
-            if r['ts'].tzinfo is None:
-                r['ts'] = dt_util.as_local(r['ts'])
-        for r in r_prev:
-            if r['ts'].tzinfo is None:
-                r['ts'] = dt_util.as_local(r['ts'])
-        cons_prev_month_kwh = sum(conv(r['val']) for r in p_prev)
-        exp_prev_month_kwh = sum(conv(r['val']) for r in r_prev)
-        prev_rows = len(p_prev) + len(r_prev)
-
-        # YTD cache (once per day)
-        if self._ytd_cache is None or (self._ytd_cache_date and self._ytd_cache_date.date() != today):
-            cons_year = 0.0
-            exp_year = 0.0
-            y_start = local_now.replace(month=1, day=1)
-            ptr = y_start
-            safety = 0
-            while ptr.month <= local_now.month and safety < 24:
-                m_str = self._month_string(ptr)
-                p_m, r_m, fb_m, sk_m = await self._fetch_month(m_str)
-                if sk_m:
-                    diag_skipped.append(sk_m)
-                else:
-                    for r in p_m:
-                        if r['ts'].tzinfo is None:
-                            r['ts'] = dt_util.as_local(r['ts'])
-                    for r in r_m:
-                        if r['ts'].tzinfo is None:
-                            r['ts'] = dt_util.as_local(r['ts'])
-                    cons_year += sum(conv(r['val']) for r in p_m)
-                    exp_year += sum(conv(r['val']) for r in r_m)
-                diag_fallback = diag_fallback or fb_m
-                if ptr.month == 12:
-                    break
-                ptr = ptr.replace(month=ptr.month+1)
-                safety += 1
-            self._ytd_cache = {"cons": cons_year, "exp": exp_year}
-            self._ytd_cache_date = local_now
-        else:
-            cons_year = self._ytd_cache["cons"]
-            exp_year = self._ytd_cache["exp"]
-
-        # Ensure lifetime totals are never smaller than YTD
-        if self._options.get(CONF_SYNC_TOTAL_TO_YTD, True):
-            lt_cons = float(self._persist.get('cons_total', 0.0))
-            lt_exp = float(self._persist.get('exp_total', 0.0))
-            updated = False
-            if cons_year > lt_cons:
-                self._persist['cons_total'] = cons_year
-                updated = True
-            if exp_year > lt_exp:
-                self._persist['exp_total'] = exp_year
-                updated = True
-            if updated:
-                await self._save_persist()
+        # Adaptive polling: is yesterday complete in every direction that has data?
+        # The reading stamped 00:00 today closes yesterday
+        day_end = midnight_epoch(today, tz)
+        lasts = [max(filter(None, (fetched[prev_month_str][i].last_ts, fetched[this_month_str][i].last_ts)), default=None)
+                 for i in (0, 1)]
+        complete = lasts[0] is not None and all(ts is None or ts >= day_end for ts in lasts)
+        await self._scheduler.async_load()
+        self._scheduler.observe(local_now, complete)
+        self.update_interval = self._scheduler.next_interval(local_now, complete, self._poll_ceiling)
+
+        # Month / yesterday / previous month / YTD are range queries over the daily rollup
+        p_rows, r_rows = fetched[this_month_str][0], fetched[this_month_str][1]
+        cur_rows = len(p_rows) + len(r_rows)
+        month_start = today.replace(day=1)
+        tomorrow = today + timedelta(days=1)
+        with cyc.phase("aggregate"):
+            month_sum, yday_sum, prev_sum, year_sum = await self._tsdb.async_sum_many(self._omm, [
+                (month_start, tomorrow),
+                (yesterday, today),
+                (prev_month_dt.date().replace(day=1), month_start),
+                (today.replace(month=1, day=1), tomorrow),
+            ])
+        cons_month_kwh, exp_month_kwh = conv(month_sum.get("P", 0.0)), conv(month_sum.get("R", 0.0))
+        cons_yday_kwh, exp_yday_kwh = conv(yday_sum.get("P", 0.0)), conv(yday_sum.get("R", 0.0))
+        cons_prev_month_kwh, exp_prev_month_kwh = conv(prev_sum.get("P", 0.0)), conv(prev_sum.get("R", 0.0))
+        cons_year, exp_year = conv(year_sum.get("P", 0.0)), conv(year_sum.get("R", 0.0))
+        prev_rows = int((self._ledger.get(prev_month_str) or {}).get("rows", 0))
+        tou_data = await self._tou_data(fetched, rollups, this_month_str, prev_month_str, today) if self._tou else {}
+        lt_cons, lt_exp = self._lifetime()
 
         diag_rows = cur_rows
-        last_ts_p = p_rows[-1]['ts'].isoformat() if p_rows else None
-        last_ts_r = r_rows[-1]['ts'].isoformat() if r_rows else None
+        last_ts_p = p_rows.last_datetime(tz).isoformat() if p_rows else None
+        last_ts_r = r_rows.last_datetime(tz).isoformat() if r_rows else None
         data = {
-            KEY_CONS_TOTAL: float(self._persist.get('cons_total', 0.0)),
-            KEY_EXP_TOTAL: float(self._persist.get('exp_total', 0.0)),
+            KEY_CONS_TOTAL: lt_cons,
+            KEY_EXP_TOTAL: lt_exp,
             KEY_CONS_MONTH: cons_month_kwh,
             KEY_EXP_MONTH: exp_month_kwh,
             KEY_CONS_YESTERDAY: cons_yday_kwh,
@@ -231,6 +410,7 @@ class HepCoordinator(DataUpdateCoordinator):
             KEY_EXP_PREV_MONTH: exp_prev_month_kwh,
             KEY_CONS_YEAR: cons_year,
             KEY_EXP_YEAR: exp_year,
+            **tou_data,
             KEY_DIAG_ROWS: diag_rows,
             KEY_DIAG_CUR_ROWS: cur_rows,
             KEY_DIAG_PREV_ROWS: prev_rows,
@@ -240,81 +420,288 @@ class HepCoordinator(DataUpdateCoordinator):
             KEY_DIAG_SUM_R: exp_month_kwh,
             KEY_DIAG_SKIPPED_MONTHS: ",".join(sorted(set(diag_skipped))) if diag_skipped else None,
             KEY_DIAG_FALLBACK_USED: diag_fallback,
+            KEY_DIAG_PARSE_RATE: round(self._client.parse_stats.rows_per_s),
+            KEY_DIAG_BREAKER: self.breaker_state,
+            KEY_DIAG_INFLUX_SPOOL: self._exporter.spooled,
+            KEY_DIAG_NEXT_POLL: (local_now + self.update_interval).isoformat(timespec="minutes"),
+            KEY_DIAG_PUBLISH_WINDOW: self._scheduler.window,
             "last_update": datetime.utcnow().isoformat(),
         }
         try:
-            from .exporter import export_influx
             session = aiohttp_client.async_get_clientsession(self.hass)
-            await export_influx(self._options, self._omm, p_rows, r_rows, conv, session)
+            # Previous month first: its last day is published after the month rolls over
+            for m_str in (prev_month_str, this_month_str):
+                p_m, r_m, _, sk_m, same_m = fetched[m_str]
+                if not sk_m and not same_m:
+                    with cyc.phase("export"):
+                        await self._exporter.async_export_delta(
+                            self._options, session, p_m, r_m, conv, tz=tz,
+                            month_final=month_is_final(m_str, today), rollup=rollups.get(m_str))
         except Exception as ex:
             _LOGGER.warning("Influx export failed: %s", ex)
         return data
 
-    async def import_history(self, month_list: List[str], *, force: bool = False) -> Dict:
+    async def _tou_data(self, fetched: Dict, rollups: Dict[str, MonthRollup], this_month_str: str,
+                        prev_month_str: str, today: date) -> Dict:
+        """VT/NT sums and the month's peak demand, all read from the (cached) rollups."""
+        conv = self._conv
+        for m_str in (this_month_str, prev_month_str):
+            p_m, r_m, _, sk_m, _ = fetched[m_str]
+            if m_str not in rollups and not sk_m:
+                rollups[m_str] = await self._rollup(m_str, p_m, r_m)
+        this, prev = rollups.get(this_month_str), rollups.get(prev_month_str)
+        month_start = today.replace(day=1)
+        tomorrow = today + timedelta(days=1)
+        yesterday = today - timedelta(days=1)
+
+        def _span(parts, start, end) -> Tuple[float, float]:
+            sums = [ru.tou_range(start, end) for ru in parts if ru is not None]
+            return sum(s[0] for s in sums), sum(s[1] for s in sums)
+
+        # Each payload holds exactly its month's days; on the 1st yesterday is in the previous one
+        month_vt, month_nt = _span((this,), month_start, tomorrow)
+        yday_vt, yday_nt = _span((prev, this), yesterday, today)
+        # Finished months from the ledger, then this month's days
+        past = [f"{m:02d}.{today.year}" for m in range(1, today.month)]
+        year_vt, year_nt = self._ledger.tou_fold(past, self._tou.key)
+        peak = this.tariff if this is not None else None
+        peak_kw = conv(peak.peak_kwh) * 4 if peak is not None and peak.peak_kwh is not None else None
+        peak_at = (datetime.fromtimestamp(peak.peak_ts - SLOT, dt_util.DEFAULT_TIME_ZONE).isoformat()
+                   if peak_kw is not None else None)
+        return {
+            KEY_CONS_MONTH_VT: conv(month_vt),
+            KEY_CONS_MONTH_NT: conv(month_nt),
+            KEY_CONS_YESTERDAY_VT: conv(yday_vt),
+            KEY_CONS_YESTERDAY_NT: conv(yday_nt),
+            KEY_CONS_YEAR_VT: year_vt + conv(month_vt),
+            KEY_CONS_YEAR_NT: year_nt + conv(month_nt),
+            KEY_PEAK_MONTH: round(peak_kw, 3) if peak_kw is not None else None,
+            KEY_PEAK_MONTH_AT: peak_at,
+        }
+
+    async def _push_statistics(self) -> None:
+        try:
+            async with self._lock:
+                await async_push_statistics(self.hass, self._tsdb, self._omm)
+        except Exception as ex:
+            _LOGGER.warning("Long-term statistics import failed for %s: %s", self._omm, ex)
+
+    async def import_history(self, month_list: List[str], *, force: bool = False, export: bool = False,
+                             process_pool: bool = False) -> Optional[asyncio.Task]:
+        """Queue months for the background import job; returns its task (None if nothing to do)."""
+        if export and not self._exporter.enabled(self._options):
+            _LOGGER.warning("Import with export requested for %s but the Influx exporter is not configured", self._omm)
+            export = False
         async with self._lock:
-            await self._client.login()
-            if not self._persist:
+            if not self._ledger.loaded:
                 await self._load_persist()
-            conv = self._conv
-            imported = set(self._persist.get(PERSIST_IMPORTED_MONTHS, []))
-            todo = month_list if force else [m for m in month_list if m not in imported]
-            sem = asyncio.Semaphore(self._max_concurrency)
-            add_c = 0.0
-            add_r = 0.0
-            async def _fetch(m: str):
-                async with sem:
-                    p_rows, r_rows, fb, sk = await self._fetch_month(m)
-                    if sk:
-                        return None
-                    for r in p_rows:
-                        if r['ts'].tzinfo is None:
-                            r['ts'] = dt_util.as_local(r['ts'])
-                    for r in r_rows:
-                        if r['ts'].tzinfo is None:
-                            r['ts'] = dt_util.as_local(r['ts'])
-                    cons = sum(conv(r['val']) for r in p_rows)
-                    exp = sum(conv(r['val']) for r in r_rows)
-                    return (m, cons, exp)
-            results = await asyncio.gather(*[_fetch(m) for m in todo])
-            for res in results:
-                if not res:
+            await self._import.async_load()
+            if force:
+                todo = list(month_list)
+            else:
+                todo = [m for m in month_list
+                        if not (self._ledger.get(m) or {}).get("imported")
+                        and not (self._ledger.get(m) or {}).get("final")]
+        if self._import.add(dict.fromkeys(todo), export, process_pool):
+            await self._import.async_save()
+        return self._start_import()
+
+    def _start_import(self, *, resume: bool = False) -> Optional[asyncio.Task]:
+        if self._import_task is None or self._import_task.done():
+            if not self._import.active or (resume and self._import_error):
+                # A job that stopped on an error waits for the next import_history call
+                return None
+            self._import_error = None
+            self._import_task = self.hass.async_create_background_task(
+                self._run_import(), f"hep_mjerenje import {self._omm}")
+        return self._import_task
+
+    def _import_progress(self) -> Dict:
+        running = self._import_task is not None and not self._import_task.done()
+        state = ("running" if running else "failed" if self._import_error and self._import.active
+                 else "paused" if self._import.active else "idle")
+        progress = self._import.progress(state)
+        progress["error"] = self._import_error
+        cyc = self.import_metrics.current or self.import_metrics.last
+        progress["loop_lag_ms"] = cyc.loop_lag_ms() if cyc else None
+        return progress
+
+    def _publish_import_progress(self, month: Optional[str] = None) -> None:
+        progress = self._import_progress()
+        self.hass.bus.async_fire(EVENT_IMPORT_PROGRESS, {"omm": self._omm, "month": month, **progress})
+        if self.data is not None:
+            # Only the diagnostics entity reacts; set_updated_data would reschedule the next refresh
+            self.data = {**self.data, KEY_DIAG_IMPORT: progress}
+            self.changed_keys = {KEY_DIAG_IMPORT}
+            self.async_update_listeners()
+
+    async def _checkpoint_import(self) -> None:
+        """Persist the ledger, then the job, so a checkpointed month is never missing from the totals.
+
+        Workers that finish while a save is running are covered by one follow-up save.
+        """
+        async with self._checkpoint_lock:
+            if self._import.unsaved:
+                state = self._import.snapshot()
+                await self._ledger.async_flush()
+                await self._import.async_save(state)
+
+    async def _checkpoint_import_if_due(self) -> None:
+        # Every few months or seconds; a multi-year import would otherwise fsync both stores per month
+        if self._import.checkpoint_due(IMPORT_CHECKPOINT_MONTHS, IMPORT_CHECKPOINT_SECONDS):
+            await self._checkpoint_import()
+
+    async def _run_import(self) -> None:
+        # Measured apart from refreshes so a backfill does not skew the cycle percentiles
+        # CPU work always leaves the loop; a process pool also keeps it off HA's executor threads
+        pool = offload.process_pool(IMPORT_PROCESS_WORKERS) if self._import.process_pool else nullcontext()
+        with self.import_metrics.measure() as cyc, pool:
+            try:
+                await self._import_months(cyc)
+            except Exception as ex:
+                self._import_error = str(ex) or type(ex).__name__
+                _LOGGER.exception("HEP import for %s stopped (%d of %d months done)",
+                                  self._omm, self._import.done, self._import.total)
+                self._publish_import_progress()
+
+    async def _import_months(self, cyc: CycleMetrics) -> None:
+        job = self._import
+        job.begin_run()
+        try:
+            await self._client.ensure_login()
+        except Exception as ex:
+            # Nothing taken yet: the job stays queued and the next refresh resumes it
+            _LOGGER.warning("HEP import for %s paused: login failed: %s", self._omm, ex)
+            return
+        # A few months in flight at a time; months flagged for export flow through a bounded queue
+        # to one writer so Influx writes overlap fetches and memory stays flat for multi-year imports
+        queue: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_EXPORT_QUEUE_SIZE)
+        paused = False
+
+        async def _fetch_worker():
+            nonlocal paused
+            while not paused and (item := job.take()) is not None:
+                m, export = item
+                try:
+                    rollup = await _import_month(m)
+                except Exception as ex:
+                    # One bad month does not stop the job; it is listed as failed and can be forced again
+                    _LOGGER.warning("HEP import of %s for %s failed: %s", m, self._omm, ex)
+                    job.complete(m, 0, failed=True)
+                    rollup = None
+                if rollup is False:
+                    # Portal down: keep the month queued and resume after a successful refresh
+                    paused = True
+                    job.release(m)
+                    break
+                with cyc.phase("checkpoint"):
+                    await self._checkpoint_import_if_due()
+                self._publish_import_progress(m)
+                if rollup and export and self._exporter.enabled(self._options):
+                    await queue.put((m, rollup))
+
+        async def _import_month(m: str):
+            """The month's rollup once it is recorded; None if it could not be fetched, False to pause."""
+            p_rows, r_rows, _, sk, _ = await self._fetch_month(m)
+            if sk:
+                if self.breaker_state != CircuitBreaker.CLOSED:
+                    return False
+                job.complete(m, 0, failed=True)
+                return None
+            with cyc.phase("rollup"):
+                rollup = await self._rollup(m, p_rows, r_rows)
+            # Held per month only, so refreshes interleave with a long import
+            async with self._lock:
+                # Replaces the month's ledger entry, so force re-imports never double-count
+                with cyc.phase("ledger"):
+                    self._record_month(m, rollup, imported=True)
+                with cyc.phase("store"):
+                    await self._tsdb.async_write_month(self._omm, m, p_rows, r_rows, dt_util.DEFAULT_TIME_ZONE,
+                                                       rollup, month_is_final(m, dt_util.now().date()))
+                job.complete(m, len(p_rows) + len(r_rows))
+            return rollup
+
+        async def _export_writer():
+            session = aiohttp_client.async_get_clientsession(self.hass)
+            tz = dt_util.DEFAULT_TIME_ZONE
+            while (item := await queue.get()) is not None:
+                m, rollup = item
+                try:
+                    with cyc.phase("export"):
+                        lines = await self.hass.async_add_executor_job(partial(
+                            build_lines, self._options, self._omm, rollup.p_rows, rollup.r_rows, self._conv,
+                            tz=tz, rollup=rollup))
+                        await self._exporter.async_export(self._options, session, lines)
+                except Exception as ex:
+                    _LOGGER.warning("Influx export of imported month %s failed: %s", m, ex)
+
+        writer = asyncio.create_task(_export_writer())
+        try:
+            await asyncio.gather(*[_fetch_worker() for _ in range(max(1, self._max_concurrency))])
+        finally:
+            await queue.put(None)
+            await writer
+        with cyc.phase("checkpoint"):
+            await self._checkpoint_import()
+        # One recorder job per direction for the whole backfill
+        with cyc.phase("statistics"):
+            await self._push_statistics()
+        if paused:
+            _LOGGER.warning("HEP import for %s paused (%d of %d months done); resuming after the portal recovers",
+                            self._omm, job.done, job.total)
+        else:
+            _LOGGER.info("HEP import for %s finished: %d months, %d rows, %d failed", self._omm, job.done, job.rows,
+                         len(job.failed))
+        self._import_task = None
+        self._publish_import_progress()
+        await self.async_request_refresh()
+
+    async def async_shutdown(self) -> None:
+        # The checkpoint stays behind; the job resumes after the next start
+        if self._import_task is not None and not self._import_task.done():
+            self._import_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._import_task
+            try:
+                await self._checkpoint_import()
+            except Exception as ex:
+                _LOGGER.warning("Could not checkpoint the HEP import for %s: %s", self._omm, ex)
+        await super().async_shutdown()
+
+    async def reexport_range(self, start: date, end: date) -> int:
+        """Rewrite [start, end] to Influx regardless of the export watermark."""
+        months = []
+        d = start.replace(day=1)
+        while d <= end:
+            months.append(self._month_string(d))
+            d = (d + timedelta(days=32)).replace(day=1)
+        async with self._lock:
+            await self._client.ensure_login()
+            fetched = await self._fetch_months(months)
+        tz = dt_util.DEFAULT_TIME_ZONE
+        # Readings of the days start..end: end-stamped, so shifted one interval past each midnight
+        lo, hi = midnight_epoch(start, tz) + SLOT, midnight_epoch(end + timedelta(days=1), tz) + SLOT
+
+        def _lines() -> List[str]:
+            lines: List[str] = []
+            for m_str in months:
+                p_m, r_m, _, sk_m, _ = fetched[m_str]
+                if sk_m:
+                    _LOGGER.warning("Re-export: month %s could not be fetched", m_str)
                     continue
-                m, cons, exp = res
-                add_c += cons
-                add_r += exp
-                if not force:
-                    if PERSIST_IMPORTED_MONTHS not in self._persist:
-                        self._persist[PERSIST_IMPORTED_MONTHS] = []
-                    if m not in self._persist[PERSIST_IMPORTED_MONTHS]:
-                        self._persist[PERSIST_IMPORTED_MONTHS].append(m)
-            self._persist['cons_total'] = float(self._persist.get('cons_total', 0.0)) + add_c
-            self._persist['exp_total'] = float(self._persist.get('exp_total', 0.0)) + add_r
-            await self._save_persist()
-            self.async_set_updated_data({
-                KEY_CONS_TOTAL: self._persist['cons_total'],
-                KEY_EXP_TOTAL: self._persist['exp_total'],
-                KEY_CONS_MONTH: 0.0,
-                KEY_EXP_MONTH: 0.0,
-                KEY_CONS_YESTERDAY: 0.0,
-                KEY_EXP_YESTERDAY: 0.0,
-                KEY_CONS_PREV_MONTH: 0.0,
-                KEY_EXP_PREV_MONTH: 0.0,
-                KEY_CONS_YEAR: self._persist['cons_total'],
-                KEY_EXP_YEAR: self._persist['exp_total'],
-                KEY_DIAG_ROWS: 0,
-                KEY_DIAG_CUR_ROWS: 0,
-                KEY_DIAG_PREV_ROWS: 0,
-                KEY_DIAG_LAST_TS_P: None,
-                KEY_DIAG_LAST_TS_R: None,
-                KEY_DIAG_SUM_P: self._persist['cons_total'],
-                KEY_DIAG_SUM_R: self._persist['exp_total'],
-                KEY_DIAG_SKIPPED_MONTHS: None,
-                KEY_DIAG_FALLBACK_USED: False,
-                "last_update": datetime.utcnow().isoformat(),
-            })
-            return {"cons_total_kwh": self._persist['cons_total'], "exp_total_kwh": self._persist['exp_total']}
-
-    async def import_years(self, year_list: List[str], *, force: bool = False) -> Dict:
+                # 15-min and daily points inside the range; monthly totals from the whole month
+                lines += build_lines({**self._options, CONF_EXPORT_SERIES_MONTHLY: False}, self._omm,
+                                     p_m.slice(lo, hi), r_m.slice(lo, hi), self._conv, tz=tz)
+                lines += build_lines({**self._options, CONF_EXPORT_SERIES_15M: False, CONF_EXPORT_SERIES_DAILY: False},
+                                     self._omm, p_m, r_m, self._conv, tz=tz)
+            return lines
+
+        lines = await self.hass.async_add_executor_job(_lines)
+        session = aiohttp_client.async_get_clientsession(self.hass)
+        return await self._exporter.async_export(self._options, session, lines)
+
+    async def import_years(self, year_list: List[str], *, force: bool = False, export: bool = False,
+                           process_pool: bool = False) -> Optional[asyncio.Task]:
         months: List[str] = []
         now_dt = dt_util.utcnow()
         cur_y = now_dt.year
@@ -328,4 +715,4 @@ class HepCoordinator(DataUpdateCoordinator):
                 if y == cur_y and m > cur_m:
                     break
                 months.append(f"{m:02d}.{y}")
-        return await self.import_history(months, force=force)
+        return await self.import_history(months, force=force, export=export, process_pool=process_pool)
@@ -0,0 +1,18 @@
+from __future__ import annotations
+from typing import Any, Dict
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_COORDINATORS, CONF_USERNAME, CONF_PASSWORD, CONF_OIB, CONF_OMM, CONF_INFLUX_TOKEN
+
+TO_REDACT = {CONF_USERNAME, CONF_PASSWORD, CONF_OIB, CONF_OMM, CONF_INFLUX_TOKEN, "title", "unique_id"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    coordinator = hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).get(entry.entry_id)
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "data": coordinator.data if coordinator else None,
+        "metrics": coordinator.diagnostics() if coordinator else None,
+    }
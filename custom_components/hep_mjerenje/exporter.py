@@ -1,67 +1,399 @@
 from __future__ import annotations
-from collections import defaultdict
-from datetime import datetime
-from typing import List, Dict
-from aiohttp import ClientSession, ClientTimeout
+from datetime import date, datetime, timezone, tzinfo
+from functools import partial
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+from aiohttp import ClientError, ClientSession, ClientTimeout
+import asyncio
+import gzip
 import logging
+import os
+import time
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
 from .const import (
     CONF_EXPORTER_ENABLED, CONF_INFLUX_URL, CONF_INFLUX_TOKEN, CONF_INFLUX_ORG, CONF_INFLUX_BUCKET,
     CONF_EXPORT_SERIES_15M, CONF_EXPORT_SERIES_DAILY, CONF_EXPORT_SERIES_MONTHLY,
+    INFLUX_BATCH_MAX_LINES, INFLUX_BATCH_MAX_BYTES, INFLUX_WRITE_TIMEOUT, INFLUX_WRITE_RETRIES,
+    INFLUX_SPOOL_DIR, INFLUX_SPOOL_MAX_BYTES, EXPORT_WATERMARK_SAVE_DELAY,
 )
+from . import metrics
+from .retry import RETRYABLE_STATUSES, RetryPolicy, parse_retry_after
+from .rollup import MonthRollup
+from .series import SLOT, IntervalSeries, midnight_epoch
 
 _LOGGER = logging.getLogger(__name__)
+SPOOL_SUFFIX = ".lp.gz"
 
-async def export_influx(options: Dict, omm: str, p_rows: List[Dict], r_rows: List[Dict], conv_func, session: ClientSession) -> None:
-    """Best-effort InfluxDB v2 export using provided HA aiohttp session."""
-    if not options.get(CONF_EXPORTER_ENABLED, False):
-        return
-    url = options.get(CONF_INFLUX_URL)
-    token = options.get(CONF_INFLUX_TOKEN)
-    org = options.get(CONF_INFLUX_ORG)
-    bucket = options.get(CONF_INFLUX_BUCKET)
-    if not (url and token and org and bucket):
-        return
+
+def _month_days(p_rows: IntervalSeries, r_rows: IntervalSeries, rollup: MonthRollup,
+                tz: Optional[tzinfo]) -> Optional[Tuple[date, Dict[date, float], Dict[date, float]]]:
+    """(first day of the payload's month, its P and R day sums); None for an empty payload.
+
+    The month is taken mid-payload; a stray reading of a neighbouring month would only make a partial day.
+    """
+    rows = p_rows or r_rows
+    if not rows:
+        return None
+    mid = datetime.fromtimestamp(rows.ts[len(rows) // 2] - SLOT, tz or timezone.utc)
+    first = date(mid.year, mid.month, 1)
+    day_c = {d: v for d, v in rollup.days("P").items() if d.replace(day=1) == first}
+    day_r = {d: v for d, v in rollup.days("R").items() if d.replace(day=1) == first}
+    return first, day_c, day_r
+
+
+def build_lines(options: Dict, omm: str, p_rows: IntervalSeries, r_rows: IntervalSeries, conv_func,
+                *, tz: Optional[tzinfo] = None, after: Tuple[Optional[int], Optional[int]] = (None, None),
+                keep_day: Optional[Callable[[date, float, float], bool]] = None,
+                keep_month: Optional[Callable[[date, float, float], bool]] = None,
+                rollup: Optional[MonthRollup] = None) -> List[str]:
+    """Line-protocol points for one month of readings, per the enabled series options.
+
+    ``after`` skips 15-min points at or before a (P, R) epoch; ``keep_day``/``keep_month``
+    decide per aggregate point whether it is emitted. Daily and monthly values come from
+    ``rollup`` (built here when not given) and only cover days of the payload's own month.
+    """
     lines: List[str] = []
     meas = 'hep_energy'
     tag = 'omm=' + str(omm)
     # 15-min points
     if options.get(CONF_EXPORT_SERIES_15M, True):
-        for row in p_rows:
-            ts_ns = int(row['ts'].timestamp()) * 1_000_000_000
-            val = conv_func(row['val'])
-            lines.append(f"{meas},{tag} consumption_kwh={val} {ts_ns}")
-        for row in r_rows:
-            ts_ns = int(row['ts'].timestamp()) * 1_000_000_000
-            val = conv_func(row['val'])
-            lines.append(f"{meas},{tag} export_kwh={val} {ts_ns}")
-    # group by day
-    if options.get(CONF_EXPORT_SERIES_DAILY, True):
-        day_c: Dict = defaultdict(float)
-        day_r: Dict = defaultdict(float)
-        for row in p_rows:
-            day_c[row['ts'].date()] += conv_func(row['val'])
-        for row in r_rows:
-            day_r[row['ts'].date()] += conv_func(row['val'])
-        for d in sorted(set(list(day_c.keys()) + list(day_r.keys()))):
-            ts_ns = int(datetime(d.year, d.month, d.day).timestamp()) * 1_000_000_000
-            c = day_c.get(d, 0.0)
-            r = day_r.get(d, 0.0)
+        p_new = p_rows.slice(after[0] + 1, None) if after[0] is not None else p_rows
+        r_new = r_rows.slice(after[1] + 1, None) if after[1] is not None else r_rows
+        for ts, val in p_new:
+            lines.append(f"{meas},{tag} consumption_kwh={conv_func(val)} {ts * 1_000_000_000}")
+        for ts, val in r_new:
+            lines.append(f"{meas},{tag} export_kwh={conv_func(val)} {ts * 1_000_000_000}")
+    daily = options.get(CONF_EXPORT_SERIES_DAILY, True)
+    monthly = options.get(CONF_EXPORT_SERIES_MONTHLY, True) and p_rows
+    if not (daily or monthly):
+        return lines
+    month = _month_days(p_rows, r_rows, rollup or MonthRollup(p_rows, r_rows, tz), tz)
+    if month is None:
+        return lines
+    first, day_c, day_r = month
+    if daily:
+        for d in sorted(set(day_c) | set(day_r)):
+            c = conv_func(day_c.get(d, 0.0))
+            r = conv_func(day_r.get(d, 0.0))
+            if keep_day is not None and not keep_day(d, c, r):
+                continue
+            ts_ns = midnight_epoch(d, tz) * 1_000_000_000
             lines.append(f"{meas},{tag},granularity=daily consumption_kwh={c},export_kwh={r} {ts_ns}")
     # monthly aggregate (single point at 1st of month)
-    if options.get(CONF_EXPORT_SERIES_MONTHLY, True) and p_rows:
-        dt0 = p_rows[0]['ts']
-        month_ts = int(datetime(dt0.year, dt0.month, 1).timestamp()) * 1_000_000_000
-        c_sum = sum(conv_func(r['val']) for r in p_rows)
-        r_sum = sum(conv_func(r['val']) for r in r_rows)
-        lines.append(f"{meas},{tag},granularity=monthly consumption_kwh={c_sum},export_kwh={r_sum} {month_ts}")
-    write_url = url.rstrip('/') + f"/api/v2/write?org={org}&bucket={bucket}&precision=ns"
-    headers = {
-        'Authorization': 'Token ' + token,
-        'Content-Type': 'text/plain; charset=utf-8',
-    }
-    payload = "\n".join(lines).encode('utf-8')
-    async with session.post(write_url, data=payload, headers=headers, timeout=ClientTimeout(total=20)) as resp:
-        if resp.status >= 400:
-            txt = await resp.text()
-            _LOGGER.debug("Influx payload preview:\n%s", payload.decode("utf-8")[:512])
-            raise RuntimeError(f"Influx write failed: {resp.status} {txt}")
+    if monthly:
+        c_sum = conv_func(sum(day_c.values()))
+        r_sum = conv_func(sum(day_r.values()))
+        if keep_month is None or keep_month(first, c_sum, r_sum):
+            month_ts = midnight_epoch(first, tz) * 1_000_000_000
+            lines.append(f"{meas},{tag},granularity=monthly consumption_kwh={c_sum},export_kwh={r_sum} {month_ts}")
+    return lines
+
+
+def batch_lines(lines: Iterable[str], *, max_lines: int = INFLUX_BATCH_MAX_LINES,
+                max_bytes: int = INFLUX_BATCH_MAX_BYTES) -> List[bytes]:
+    """Split points into newline-joined bodies bounded by line count and uncompressed size."""
+    batches: List[bytes] = []
+    cur: List[bytes] = []
+    size = 0
+    for line in lines:
+        raw = line.encode('utf-8')
+        if cur and (len(cur) >= max_lines or size + len(raw) + 1 > max_bytes):
+            batches.append(b"\n".join(cur))
+            cur, size = [], 0
+        cur.append(raw)
+        size += len(raw) + 1
+    if cur:
+        batches.append(b"\n".join(cur))
+    return batches
+
+
+def _encode(lines: List[str]) -> List[bytes]:
+    return [gzip.compress(b, compresslevel=6) for b in batch_lines(lines)]
+
+
+def _halve(body: bytes) -> List[bytes]:
+    """Two compressed halves of a compressed batch; empty for a single line."""
+    lines = gzip.decompress(body).split(b"\n")
+    if len(lines) < 2:
+        return []
+    mid = len(lines) // 2
+    return [gzip.compress(b"\n".join(half), compresslevel=6) for half in (lines[:mid], lines[mid:])]
+
+
+def _spool_list(path: str) -> List[str]:
+    try:
+        names = sorted(n for n in os.listdir(path) if n.endswith(SPOOL_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(path, n) for n in names]
+
+
+def _spool_read(file: str) -> bytes:
+    with open(file, "rb") as fh:
+        return fh.read()
+
+
+def _spool_remove(file: str) -> None:
+    try:
+        os.remove(file)
+    except FileNotFoundError:
+        pass
+
+
+def _spool_write(path: str, bodies: List[bytes], max_bytes: int) -> Tuple[int, int]:
+    """Append bodies to the spool, then drop the oldest files beyond ``max_bytes``; returns (kept, dropped)."""
+    os.makedirs(path, exist_ok=True)
+    stamp = time.time_ns()
+    for i, body in enumerate(bodies):
+        tmp = os.path.join(path, f"{stamp}_{i:05d}.tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(body)
+        os.replace(tmp, tmp[:-4] + SPOOL_SUFFIX)
+    files = _spool_list(path)
+    sizes = [os.path.getsize(f) for f in files]
+    total = sum(sizes)
+    dropped = 0
+    while files and total > max_bytes:
+        _spool_remove(files.pop(0))
+        total -= sizes.pop(0)
+        dropped += 1
+    return len(files), dropped
+
+
+def _empty_watermark() -> Dict:
+    return {"p_ts": None, "r_ts": None, "final_day": None, "final_month": None, "days": {}, "months": {}}
+
+
+class ExportWatermark:
+    """What already reached Influx for one OMM.
+
+    15-min series advance by last timestamp; daily/monthly aggregates are re-sent
+    only while open and only when their value changed, then frozen once final.
+    """
+
+    def __init__(self, hass: HomeAssistant, omm: str):
+        self._store = Store(hass, 1, f"hep_mjerenje_export_{omm}")
+        self._data: Optional[Dict] = None
+
+    async def async_load(self) -> None:
+        if self._data is not None:
+            return
+        data = await self._store.async_load() or {}
+        self._data = {**_empty_watermark(), **data}
+
+    async def async_reset(self) -> None:
+        self._data = _empty_watermark()
+        await self._store.async_save(self._data)
+
+    def plan(self, options: Dict, omm: str, p_rows: IntervalSeries, r_rows: IntervalSeries, conv_func, *,
+             tz: Optional[tzinfo], month_final: bool,
+             rollup: Optional[MonthRollup] = None) -> Tuple[List[str], Callable[[], None]]:
+        """Delta lines for one month and a callback that advances the watermark once they are delivered."""
+        cur = self._data
+        rollup = rollup or MonthRollup(p_rows, r_rows, tz)
+        final_day, final_month = cur["final_day"], cur["final_month"]
+        days = dict(cur["days"])
+        months = dict(cur["months"])
+        # Days before the latest day present in both directions are complete
+        ends = [s.last_datetime(tz).date() for s in (p_rows, r_rows) if s]
+        day_cut = None if month_final or not ends else min(ends)
+
+        def keep_day(d: date, c: float, r: float) -> bool:
+            key = d.isoformat()
+            if final_day and key <= final_day:
+                return False
+            return days.get(key) != [c, r]
+
+        def keep_month(first: date, c: float, r: float) -> bool:
+            key = first.strftime("%Y-%m")
+            if final_month and key <= final_month:
+                return False
+            return months.get(key) != [c, r]
+
+        lines = build_lines(options, omm, p_rows, r_rows, conv_func, tz=tz,
+                            after=(cur["p_ts"], cur["r_ts"]), keep_day=keep_day, keep_month=keep_month,
+                            rollup=rollup)
+
+        def commit() -> None:
+            nonlocal final_day, final_month
+            # The same days and sums build_lines compared against
+            month = _month_days(p_rows, r_rows, rollup, tz)
+            if month is not None:
+                first, day_c, day_r = month
+                for d in set(day_c) | set(day_r):
+                    key = d.isoformat()
+                    days[key] = [conv_func(day_c.get(d, 0.0)), conv_func(day_r.get(d, 0.0))]
+                    if day_cut is None or d < day_cut:
+                        final_day = max(final_day or key, key)
+                if p_rows:
+                    key = first.strftime("%Y-%m")
+                    months[key] = [conv_func(sum(day_c.values())), conv_func(sum(day_r.values()))]
+                    if month_final:
+                        final_month = max(final_month or key, key)
+            self._data = {
+                "p_ts": max(filter(None, (cur["p_ts"], p_rows.last_ts)), default=None),
+                "r_ts": max(filter(None, (cur["r_ts"], r_rows.last_ts)), default=None),
+                "final_day": final_day,
+                "final_month": final_month,
+                "days": {k: v for k, v in days.items() if not final_day or k > final_day},
+                "months": {k: v for k, v in months.items() if not final_month or k > final_month},
+            }
+            self._store.async_delay_save(lambda: self._data, EXPORT_WATERMARK_SAVE_DELAY)
+
+        return lines, commit
+
+
+class InfluxExporter:
+    """Batched, gzip-compressed InfluxDB v2 writer for one OMM.
+
+    Batches that still fail after retries go to a bounded on-disk spool, which is
+    drained (oldest first) before new data on later cycles.
+    """
+
+    def __init__(self, hass: HomeAssistant, omm: str):
+        self._hass = hass
+        self._omm = omm
+        self._path = hass.config.path(INFLUX_SPOOL_DIR, str(omm))
+        self._lock = asyncio.Lock()
+        self._spooled: Optional[int] = None
+        self.watermark = ExportWatermark(hass, omm)
+
+    @property
+    def spooled(self) -> int:
+        return self._spooled or 0
+
+    def enabled(self, options: Dict) -> bool:
+        return self._target(options) is not None
+
+    @staticmethod
+    def _target(options: Dict) -> Optional[Tuple[str, Dict[str, str]]]:
+        if not options.get(CONF_EXPORTER_ENABLED, False):
+            return None
+        url = options.get(CONF_INFLUX_URL)
+        token = options.get(CONF_INFLUX_TOKEN)
+        org = options.get(CONF_INFLUX_ORG)
+        bucket = options.get(CONF_INFLUX_BUCKET)
+        if not (url and token and org and bucket):
+            return None
+        write_url = url.rstrip('/') + f"/api/v2/write?org={org}&bucket={bucket}&precision=ns"
+        headers = {
+            'Authorization': 'Token ' + token,
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Content-Encoding': 'gzip',
+        }
+        return write_url, headers
+
+    async def _post(self, session: ClientSession, target: Tuple[str, Dict[str, str]], body: bytes) -> bool:
+        """Write one compressed batch; False means it should be spooled for a later cycle.
+
+        A batch Influx finds too large (413) is written in halves, down to single lines.
+        """
+        write_url, headers = target
+        too_large = False
+        policy = RetryPolicy()
+        m = metrics.cycle()
+        m.count("influx_batches")
+        m.count("influx_bytes", len(body))
+        for attempt in range(1, INFLUX_WRITE_RETRIES + 1):
+            hint: Optional[float] = None
+            t0 = time.perf_counter()
+            try:
+                async with session.post(write_url, data=body, headers=headers,
+                                        timeout=ClientTimeout(total=INFLUX_WRITE_TIMEOUT)) as resp:
+                    m.add("influx_post", time.perf_counter() - t0)
+                    metrics.trace("influx", omm=self._omm, status=resp.status, bytes=len(body), attempt=attempt,
+                                  ms=round((time.perf_counter() - t0) * 1000, 1))
+                    if resp.status < 400:
+                        return True
+                    if resp.status == 413:
+                        too_large = True
+                        break
+                    txt = await resp.text()
+                    if resp.status in (400, 422):
+                        # Influx rejected the data itself; retrying or spooling cannot help
+                        _LOGGER.warning("Influx rejected batch for %s (%s): %s", self._omm, resp.status, txt[:200])
+                        return True
+                    if resp.status in RETRYABLE_STATUSES:
+                        hint = parse_retry_after(resp.headers.get("Retry-After"))
+                    err = f"{resp.status} {txt[:200]}"
+            except (ClientError, asyncio.TimeoutError) as ex:
+                err = str(ex) or type(ex).__name__
+            if attempt == INFLUX_WRITE_RETRIES:
+                break
+            delay = policy.next_delay(hint)
+            if delay is None:
+                break
+            _LOGGER.debug("Influx write attempt %d failed: %s; retry in %.1fs", attempt, err, delay)
+            m.count("influx_retries")
+            await asyncio.sleep(delay)
+        if too_large:
+            halves = await self._hass.async_add_executor_job(_halve, body)
+            if not halves:
+                _LOGGER.warning("Influx rejected a single point for %s as too large", self._omm)
+                return True
+            m.count("influx_splits")
+            _LOGGER.debug("Influx batch for %s too large; writing it in halves", self._omm)
+            # If a later half fails the whole batch is spooled; rewriting the points already taken is harmless
+            for half in halves:
+                if not await self._post(session, target, half):
+                    return False
+            return True
+        _LOGGER.debug("Influx write failed for %s: %s", self._omm, err)
+        return False
+
+    async def _drain(self, session: ClientSession, target) -> bool:
+        """Replay spooled batches oldest first; False if Influx is still failing."""
+        files = await self._hass.async_add_executor_job(_spool_list, self._path)
+        self._spooled = len(files)
+        for i, file in enumerate(files):
+            body = await self._hass.async_add_executor_job(_spool_read, file)
+            if not await self._post(session, target, body):
+                return False
+            await self._hass.async_add_executor_job(_spool_remove, file)
+            self._spooled = len(files) - i - 1
+        if files:
+            _LOGGER.info("Influx spool for %s drained (%d batches)", self._omm, len(files))
+        return True
+
+    async def _spool(self, bodies: List[bytes]) -> None:
+        kept, dropped = await self._hass.async_add_executor_job(
+            _spool_write, self._path, bodies, INFLUX_SPOOL_MAX_BYTES)
+        self._spooled = kept
+        if dropped:
+            _LOGGER.warning("Influx spool for %s full; dropped %d oldest batches", self._omm, dropped)
+        _LOGGER.warning("Influx unavailable; spooled %d batches for %s (%d pending)", len(bodies), self._omm, kept)
+
+    async def async_export(self, options: Dict, session: ClientSession, lines: List[str]) -> int:
+        """Drain the spool, then write ``lines`` in batches; returns the number of batches written."""
+        target = self._target(options)
+        if target is None:
+            return 0
+        bodies = await self._hass.async_add_executor_job(_encode, lines) if lines else []
+        written = 0
+        async with self._lock:
+            if not await self._drain(session, target):
+                if bodies:
+                    await self._spool(bodies)
+                return 0
+            for i, body in enumerate(bodies):
+                if not await self._post(session, target, body):
+                    await self._spool(bodies[i:])
+                    break
+                written += 1
+        return written
+
+    async def async_export_delta(self, options: Dict, session: ClientSession, p_rows: IntervalSeries,
+                                 r_rows: IntervalSeries, conv_func, *, tz: Optional[tzinfo],
+                                 month_final: bool, rollup: Optional[MonthRollup] = None) -> int:
+        """Export only what changed since the persisted watermark for one month."""
+        if self._target(options) is None:
+            return 0
+        await self.watermark.async_load()
+        # Formatting a month of line protocol is CPU work; the watermark commit stays on the loop
+        lines, commit = await self._hass.async_add_executor_job(partial(
+            self.watermark.plan, options, self._omm, p_rows, r_rows, conv_func, tz=tz, month_final=month_final,
+            rollup=rollup))
+        written = await self.async_export(options, session, lines)
+        # Delivered or spooled for replay either way
+        commit()
+        return written
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import time
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ImportJob:
+    """Months still to import for one meter, checkpointed every few completed months.
+
+    A restart loses at most the months since the last checkpoint; they are fetched again on resume.
+    """
+
+    def __init__(self, hass: HomeAssistant, omm: str):
+        self._store = Store(hass, 1, f"hep_mjerenje_import_{omm}")
+        self._pending: Dict[str, bool] = {}  # month -> also export to Influx
+        self._in_flight: Set[str] = set()
+        self._loaded = False
+        self.unsaved = 0  # completed months not yet checkpointed
+        self._saved_at = time.monotonic()
+        self.total = 0
+        self.done = 0
+        self.rows = 0
+        self.failed: List[str] = []
+        self.process_pool = False  # parse in worker processes instead of threads
+        self._run_started: Optional[float] = None
+        self._run_rows = 0
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        data = await self._store.async_load() or {}
+        self._pending = {str(m): bool(e) for m, e in (data.get("pending") or {}).items()}
+        self.total = int(data.get("total", len(self._pending)))
+        self.done = int(data.get("done", 0))
+        self.rows = int(data.get("rows", 0))
+        self.failed = list(data.get("failed") or [])
+        self.process_pool = bool(data.get("process_pool", False))
+        if self._pending:
+            _LOGGER.info("Resuming HEP import: %d of %d months left", len(self._pending), self.total)
+
+    @property
+    def active(self) -> bool:
+        return bool(self._pending)
+
+    def add(self, months: Iterable[str], export: bool, process_pool: bool = False) -> int:
+        """Queue months (a running job picks them up too); returns how many were new."""
+        if not self._pending:
+            self.total = self.done = self.rows = 0
+            self.failed = []
+            self.process_pool = False
+        self.process_pool = self.process_pool or process_pool
+        added = 0
+        for m in months:
+            if m in self._pending:
+                self._pending[m] = self._pending[m] or export
+                continue
+            self._pending[m] = export
+            added += 1
+        self.total += added
+        return added
+
+    def take(self) -> Optional[Tuple[str, bool]]:
+        """Next month not yet being fetched, as (month, export)."""
+        for m, export in self._pending.items():
+            if m not in self._in_flight:
+                self._in_flight.add(m)
+                return m, export
+        return None
+
+    def release(self, month: str) -> None:
+        """Give a month back unfinished (it stays in the checkpoint)."""
+        self._in_flight.discard(month)
+
+    def begin_run(self) -> None:
+        self._in_flight.clear()
+        self._run_started = self._saved_at = time.monotonic()
+        self._run_rows = 0
+
+    def complete(self, month: str, rows: int, *, failed: bool = False) -> None:
+        self._in_flight.discard(month)
+        if self._pending.pop(month, None) is None:
+            return
+        self.done += 1
+        self.rows += rows
+        self._run_rows += rows
+        if failed:
+            self.failed.append(month)
+        self.unsaved += 1
+
+    def checkpoint_due(self, months: int, seconds: float) -> bool:
+        if not self.unsaved:
+            return False
+        return self.unsaved >= months or time.monotonic() - self._saved_at >= seconds
+
+    def snapshot(self) -> Dict:
+        self.unsaved = 0
+        self._saved_at = time.monotonic()
+        return {"pending": dict(self._pending), "total": self.total, "done": self.done,
+                "rows": self.rows, "failed": list(self.failed), "process_pool": self.process_pool}
+
+    async def async_save(self, data: Optional[Dict] = None) -> None:
+        """Write ``data`` (an earlier ``snapshot()``) or the current state."""
+        data = data if data is not None else self.snapshot()
+        if data["pending"]:
+            await self._store.async_save(data)
+        else:
+            await self._store.async_remove()
+
+    @property
+    def rows_per_s(self) -> float:
+        if self._run_started is None:
+            return 0.0
+        return self._run_rows / max(time.monotonic() - self._run_started, 1e-6)
+
+    def progress(self, state: str) -> Dict:
+        return {
+            "state": state,
+            "done": self.done,
+            "total": self.total,
+            "rows": self.rows,
+            "rows_per_s": round(self.rows_per_s),
+            "failed": list(self.failed),
+        }
@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import hashlib
+import logging
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .series import IntervalSeries
+from .const import (
+    PERSIST_VERSION, PERSIST_SAVE_DELAY,
+    PERSIST_MONTHS, PERSIST_LEGACY_TOTALS, PERSIST_IMPORTED_MONTHS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def rows_digest(p_rows: IntervalSeries, r_rows: IntervalSeries) -> str:
+    """Content hash of a month's P and R readings."""
+    h = hashlib.sha1()
+    for tag, rows in ((b"P", p_rows), (b"R", r_rows)):
+        h.update(tag)
+        h.update(len(rows).to_bytes(4, "little"))
+        h.update(rows.ts.tobytes())
+        h.update(rows.val.tobytes())
+    return h.hexdigest()
+
+
+def _empty() -> Dict:
+    return {PERSIST_MONTHS: {}, PERSIST_LEGACY_TOTALS: {"cons": 0.0, "exp": 0.0}}
+
+
+class _LedgerStore(Store):
+    async def _async_migrate_func(self, old_major_version, old_minor_version, old_data):
+        if old_major_version == 1:
+            # v1 only kept running totals; they survive as a floor for the lifetime fold
+            _LOGGER.info("Migrating HEP totals (%d imported months) to per-month ledger",
+                         len(old_data.get(PERSIST_IMPORTED_MONTHS) or []))
+            data = _empty()
+            data[PERSIST_LEGACY_TOTALS] = {
+                "cons": float(old_data.get("cons_total", 0.0)),
+                "exp": float(old_data.get("exp_total", 0.0)),
+            }
+            return data
+        return old_data
+
+
+class MonthLedger:
+    """Per-month aggregates (sums, row count, content hash, finalized flag) persisted in a Store.
+
+    YTD, previous month and lifetime totals are folds over the ledger.
+    """
+
+    def __init__(self, hass: HomeAssistant, store_key: str):
+        self._store = _LedgerStore(hass, PERSIST_VERSION, f"hep_mjerenje_totals_{store_key}")
+        self._data: Optional[Dict] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or _empty()
+        if not isinstance(data.get(PERSIST_MONTHS), dict):
+            data[PERSIST_MONTHS] = {}
+        data.setdefault(PERSIST_LEGACY_TOTALS, {"cons": 0.0, "exp": 0.0})
+        self._data = data
+
+    def _schedule_save(self) -> None:
+        self._store.async_delay_save(lambda: self._data, PERSIST_SAVE_DELAY)
+
+    async def async_flush(self) -> None:
+        """Write now instead of after the save delay (import checkpoints rely on it)."""
+        await self._store.async_save(self._data)
+
+    async def async_reset(self) -> None:
+        self._data = _empty()
+        await self._store.async_save(self._data)
+
+    @property
+    def months(self) -> Dict[str, Dict]:
+        return self._data[PERSIST_MONTHS] if self._data else {}
+
+    def get(self, month_str: str) -> Optional[Dict]:
+        return self.months.get(month_str)
+
+    def upsert(self, month_str: str, *, cons: float, exp: float, rows: int, digest: str,
+               final: bool, imported: bool = False, tou: Optional[Dict] = None) -> bool:
+        """Replace a month's entry in place; returns True when anything changed.
+
+        ``tou`` ({"key", "vt", "nt"}) records the month's tariff split and the schedule it used.
+        """
+        prev = self.months.get(month_str) or {}
+        entry = {
+            "cons": float(cons),
+            "exp": float(exp),
+            "rows": int(rows),
+            "hash": digest,
+            "final": bool(final),
+            "imported": bool(imported or prev.get("imported", False)),
+        }
+        if tou is not None:
+            entry["tou"] = dict(tou)
+        if entry == prev:
+            return False
+        self._data[PERSIST_MONTHS][month_str] = entry
+        self._schedule_save()
+        return True
+
+    def clear_flags(self) -> None:
+        for entry in self.months.values():
+            entry["final"] = False
+            entry["imported"] = False
+        self._schedule_save()
+
+    def fold(self, months: Optional[Iterable[str]] = None,
+             where: Optional[Callable[[Dict], bool]] = None) -> Tuple[float, float]:
+        src = self.months
+        entries = src.values() if months is None else (src[m] for m in months if m in src)
+        cons = 0.0
+        exp = 0.0
+        for e in entries:
+            if where is None or where(e):
+                cons += e["cons"]
+                exp += e["exp"]
+        return cons, exp
+
+    def tou_fold(self, months: Iterable[str], key: str) -> Tuple[float, float]:
+        """(VT, NT) over ``months`` split with schedule ``key``."""
+        vt = nt = 0.0
+        for m in months:
+            tou = (self.months.get(m) or {}).get("tou")
+            if tou and tou.get("key") == key:
+                vt += tou["vt"]
+                nt += tou["nt"]
+        return vt, nt
+
+    def year(self, year: int) -> Tuple[float, float]:
+        suffix = f".{year}"
+        return self.fold(m for m in self.months if m.endswith(suffix))
+
+    def lifetime(self, *, include_live: bool = True) -> Tuple[float, float]:
+        cons, exp = self.fold(where=None if include_live else (lambda e: e.get("imported", False)))
+        legacy = self._data[PERSIST_LEGACY_TOTALS] if self._data else {"cons": 0.0, "exp": 0.0}
+        return max(cons, float(legacy.get("cons", 0.0))), max(exp, float(legacy.get("exp", 0.0)))
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional
+import asyncio
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+_TRACE = logging.getLogger(__name__ + ".trace")
+
+METRICS_WINDOW = 50  # cycles kept for percentiles
+LOOP_LAG_INTERVAL = 0.1  # seconds between event-loop lag probes during a cycle
+
+
+class CycleMetrics:
+    """Phase durations and counters for one refresh or import run."""
+
+    __slots__ = ("started", "phases", "counters", "seconds", "loop_lag")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.seconds = 0.0
+        self.loop_lag: List[float] = []
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def finish(self) -> "CycleMetrics":
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def loop_lag_ms(self) -> Optional[Dict[str, float]]:
+        if not self.loop_lag:
+            return None
+        return {"p95": round(_percentile(self.loop_lag, 95) * 1000, 1), "max": round(max(self.loop_lag) * 1000, 1)}
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_ms": round(self.seconds * 1000, 1),
+            "phases_ms": {k: round(v * 1000, 1) for k, v in sorted(self.phases.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "loop_lag_ms": self.loop_lag_ms(),
+        }
+
+
+class _NullCycle(CycleMetrics):
+    """Sink used outside an instrumented cycle (e.g. the config flow login)."""
+
+    def add(self, phase: str, seconds: float) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+
+_NULL = _NullCycle()
+# Set by the coordinator; tasks spawned during a cycle inherit it, so a client shared
+# by several meters still attributes work to the right cycle.
+_CURRENT: ContextVar[Optional[CycleMetrics]] = ContextVar("hep_mjerenje_cycle", default=None)
+
+
+def cycle() -> CycleMetrics:
+    return _CURRENT.get() or _NULL
+
+
+def trace(event: str, **fields) -> None:
+    """Per-request debug trace (enable ``custom_components.hep_mjerenje.metrics.trace``)."""
+    if _TRACE.isEnabledFor(logging.DEBUG):
+        _TRACE.debug("%s %s", event, " ".join(f"{k}={v}" for k, v in fields.items()))
+
+
+async def _probe_loop(samples: List[float]) -> None:
+    """How late the loop wakes a sleeper: the stall any other integration would see."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - t0 - LOOP_LAG_INTERVAL))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Metrics:
+    """Rolling window of finished cycles for one coordinator."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._history: Deque[CycleMetrics] = deque(maxlen=window)
+        self.last: Optional[CycleMetrics] = None
+        self.current: Optional[CycleMetrics] = None
+
+    @contextmanager
+    def measure(self) -> Iterator[CycleMetrics]:
+        """Instrument everything awaited inside the block as one cycle."""
+        current = CycleMetrics()
+        probe = asyncio.get_running_loop().create_task(_probe_loop(current.loop_lag))
+        token = _CURRENT.set(current)
+        self.current = current
+        try:
+            yield current
+        finally:
+            _CURRENT.reset(token)
+            probe.cancel()
+            self.current = None
+            self.last = current.finish()
+            self._history.append(current)
+            _LOGGER.debug("Cycle metrics: %s", current.as_dict())
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95 in ms of the cycle total and of each phase over the window."""
+        if not self._history:
+            return {}
+        series: Dict[str, List[float]] = {"total": [c.seconds for c in self._history]}
+        lags = [max(c.loop_lag) for c in self._history if c.loop_lag]
+        if lags:
+            series["loop_lag_max"] = lags
+        for c in self._history:
+            for name, secs in c.phases.items():
+                series.setdefault(name, []).append(secs)
+        return {name: {"p50": round(_percentile(v, 50) * 1000, 1), "p95": round(_percentile(v, 95) * 1000, 1)}
+                for name, v in series.items()}
+
+    def as_dict(self) -> Dict:
+        return {
+            "last": self.last.as_dict() if self.last else None,
+            "cycles": len(self._history),
+            "percentiles_ms": self.percentiles(),
+        }
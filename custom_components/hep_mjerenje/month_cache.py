@@ -0,0 +1,38 @@
+from __future__ import annotations
+from datetime import date, tzinfo
+from typing import Optional, Tuple
+import logging
+
+from .const import MONTH_FINAL_GRACE_DAYS
+from .series import IntervalSeries
+from .tsdb import IntervalStore
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def month_is_final(month_str: str, today: date, grace_days: int = MONTH_FINAL_GRACE_DAYS) -> bool:
+    """A month is final once it is older than the previous month plus a grace period."""
+    m, y = (int(x) for x in month_str.split("."))
+    age = (today.year - y) * 12 + (today.month - m)
+    if age > 2:
+        return True
+    return age == 2 and today.day > grace_days
+
+
+class MonthCache:
+    """Finalized months served from the local store's readings instead of the portal.
+
+    A month counts once it was written to the store from a finalized payload.
+    """
+
+    def __init__(self, omm: str, tsdb: IntervalStore):
+        self._omm = omm
+        self._tsdb = tsdb
+
+    async def async_get(self, month_str: str, tz: Optional[tzinfo]) -> Optional[Tuple[IntervalSeries, IntervalSeries]]:
+        """Return (p_rows, r_rows) for a finalized month or None when not stored."""
+        return await self._tsdb.async_final_month(self._omm, month_str, tz)
+
+    async def async_clear(self) -> None:
+        """Forget which months are final so they are fetched again."""
+        await self._tsdb.async_clear_final(self._omm)
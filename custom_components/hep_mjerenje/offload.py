@@ -0,0 +1,57 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import tzinfo
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import multiprocessing
+import time
+
+from .parser import HepCsvParser, ParseStats
+from .series import IntervalSeries
+from .stream import JsonBase64LineDecoder
+
+_LOGGER = logging.getLogger(__name__)
+_T = TypeVar("_T")
+
+# Set for the duration of a bulk import that asked for process-pool parsing
+_POOL: ContextVar[Optional[ProcessPoolExecutor]] = ContextVar("hep_mjerenje_pool", default=None)
+
+
+def in_process_pool() -> bool:
+    return _POOL.get() is not None
+
+
+async def run_cpu(func: Callable[..., _T], *args: Any) -> _T:
+    """Run CPU-bound work off the event loop (the process pool when one is active)."""
+    return await asyncio.get_running_loop().run_in_executor(_POOL.get(), func, *args)
+
+
+@contextmanager
+def process_pool(workers: int) -> Iterator[ProcessPoolExecutor]:
+    # spawn, not fork: forking Home Assistant's threads is unsafe
+    pool = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+    token = _POOL.set(pool)
+    _LOGGER.debug("Parsing in a %d-process pool", workers)
+    try:
+        yield pool
+    finally:
+        _POOL.reset(token)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_payload(body: bytes, layout: Dict, tz: Optional[tzinfo]) -> Tuple[IntervalSeries, bool, ParseStats, int, float]:
+    """Decode and parse one buffered JSON/base64 payload in a worker process.
+
+    Returns (rows, fallback used, parse stats, decoded bytes, decode seconds).
+    """
+    t0 = time.perf_counter()
+    decoder = JsonBase64LineDecoder("data")
+    lines = decoder.feed(body) + decoder.close()
+    decode_s = time.perf_counter() - t0
+    session = HepCsvParser(**layout).session(tz)
+    session.feed(lines)
+    rows, fallback = session.finish()
+    return rows, fallback, session.stats, decoder.bytes_out, decode_s
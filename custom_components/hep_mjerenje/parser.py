@@ -0,0 +1,272 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timedelta, tzinfo
+from typing import Dict, Iterable, List, Optional, Tuple
+import csv
+import logging
+import time
+
+from .series import IntervalSeries, local_epoch, midnight_epoch
+
+_LOGGER = logging.getLogger(__name__)
+
+_SLOW_FORMATS = ("%d.%m.%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+
+
+@dataclass
+class CsvSchema:
+    """Column layout detected from a payload header."""
+    delim: str
+    date_idx: Optional[int]
+    time_idx: Optional[int]
+    value_idx: List[int]
+    status_idx: Optional[int]
+    prefer_auto: bool = False
+
+
+@dataclass
+class ParseStats:
+    rows: int = 0
+    seconds: float = 0.0
+    slow_rows: int = 0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def pad_time_hms(t: str) -> str:
+    parts = t.split(":")
+    if len(parts) == 3:
+        h, m, s = parts
+        if len(h) == 1:
+            h = h.rjust(2, '0')
+        return f"{h}:{m}:{s}"
+    return t
+
+
+def _fast_hms(t: str) -> Optional[int]:
+    """Seconds since midnight for ``%H:%M:%S`` (hour may be one digit), else None."""
+    try:
+        if len(t) == 8 and t[2] == ':' and t[5] == ':':
+            h, mi, se = int(t[0:2]), int(t[3:5]), int(t[6:8])
+        elif len(t) == 7 and t[1] == ':' and t[4] == ':':
+            h, mi, se = int(t[0]), int(t[2:4]), int(t[5:7])
+        else:
+            return None
+    except ValueError:
+        return None
+    if h > 23 or mi > 59 or se > 59:
+        return None
+    return h * 3600 + mi * 60 + se
+
+
+def _fast_date(d: str) -> Optional[datetime]:
+    """Naive midnight for ``%d.%m.%Y``, else None."""
+    if len(d) != 10 or d[2] != '.' or d[5] != '.':
+        return None
+    try:
+        return datetime(int(d[6:10]), int(d[3:5]), int(d[0:2]))
+    except ValueError:
+        return None
+
+
+class ParseSession:
+    """Incremental parse of one payload; fed line by line, header first."""
+
+    def __init__(self, parser: "HepCsvParser", tz: Optional[tzinfo]):
+        self._parser = parser
+        self._tz = tz
+        self._schema: Optional[CsvSchema] = None
+        # date string -> (naive midnight, midnight epoch, day is exactly 24h) or None
+        self._days: Dict[str, Optional[Tuple[datetime, int, bool]]] = {}
+        self._last: Optional[int] = None
+        self._fixed_rows = 0
+        self._auto_rows = 0
+        self.stats = ParseStats()
+        self.series = IntervalSeries()
+
+    def feed(self, lines: Iterable[str]) -> None:
+        # Only time spent parsing counts towards throughput, not time waiting for chunks
+        t0 = time.perf_counter()
+        for line in lines:
+            if not line.strip():
+                continue
+            if self._schema is None:
+                self._schema = self._parser.schema_for(line)
+                continue
+            self._row(line)
+        self.stats.seconds += time.perf_counter() - t0
+
+    def _split(self, line: str) -> List[str]:
+        line = line.rstrip("\r\n")
+        if '"' in line:
+            return next(csv.reader([line], delimiter=self._schema.delim), [])
+        return line.split(self._schema.delim)
+
+    def _day(self, d: str) -> Optional[Tuple[datetime, int, bool]]:
+        if d in self._days:
+            return self._days[d]
+        midnight = _fast_date(d)
+        day = None
+        if midnight is not None:
+            base = midnight_epoch(midnight.date(), self._tz)
+            nxt = midnight_epoch(midnight.date() + timedelta(days=1), self._tz)
+            day = (midnight, base, nxt - base == 86400)
+        self._days[d] = day
+        return day
+
+    def _epoch(self, d: str, t: str) -> Optional[int]:
+        day = self._day(d)
+        secs = _fast_hms(t) if day is not None else None
+        if secs is not None:
+            if day[2]:
+                return day[1] + secs
+            # DST transition day: let zoneinfo resolve the gap/fold
+            return local_epoch(day[0] + timedelta(seconds=secs), self._tz, self._last)
+        # Slow path: anything that does not match the fixed layout
+        self.stats.slow_rows += 1
+        p = self._parser
+        t = pad_time_hms(t)
+        for fmt in (f"{p.date_fmt} {p.time_fmt}",) + _SLOW_FORMATS:
+            try:
+                return local_epoch(datetime.strptime(f"{d} {t}", fmt), self._tz, self._last)
+            except ValueError:
+                continue
+        return None
+
+    def _fixed(self, row: List[str]) -> Optional[Tuple[int, float]]:
+        p = self._parser
+        try:
+            ts = self._epoch(row[p.date_col].strip(), row[p.time_col].strip())
+            if ts is None:
+                return None
+            return ts, float(row[p.kw_col].replace(',', '.'))
+        except (IndexError, ValueError):
+            return None
+
+    def _auto(self, row: List[str]) -> Optional[Tuple[int, float]]:
+        sc = self._schema
+        if sc.date_idx is None or sc.time_idx is None:
+            return None
+        try:
+            ts = self._epoch(row[sc.date_idx].strip(), row[sc.time_idx].strip())
+        except IndexError:
+            return None
+        if ts is None:
+            return None
+        for idx in sc.value_idx:
+            try:
+                return ts, float(row[idx].replace(',', '.'))
+            except (IndexError, ValueError):
+                pass
+        for idx in range(len(row) - 1, -1, -1):
+            if idx == sc.status_idx:
+                continue
+            try:
+                return ts, float(row[idx].replace(',', '.'))
+            except ValueError:
+                pass
+        return None
+
+    def _row(self, line: str) -> None:
+        row = self._split(line)
+        if not row:
+            return
+        if self._schema.prefer_auto:
+            got = self._auto(row)
+            if got is not None:
+                self._auto_rows += 1
+            else:
+                got = self._fixed(row)
+                self._fixed_rows += got is not None
+        else:
+            got = self._fixed(row)
+            if got is not None:
+                self._fixed_rows += 1
+            else:
+                got = self._auto(row)
+                self._auto_rows += got is not None
+        if got is None:
+            return
+        self._last = got[0]
+        self.series.append(got[0], got[1])
+
+    def finish(self) -> Tuple[IntervalSeries, bool]:
+        t0 = time.perf_counter()
+        self.series.ensure_sorted()
+        self.stats.rows = len(self.series)
+        self.stats.seconds += time.perf_counter() - t0
+        if self._schema is not None:
+            # Remember which layout actually worked so the next payload starts with it
+            self._schema.prefer_auto = self._auto_rows > self._fixed_rows
+        self._parser.record(self.stats)
+        return self.series, self._auto_rows > 0
+
+
+class HepCsvParser:
+    """HEP CSV parser that caches the detected layout per account.
+
+    Timestamps in the fixed ``%d.%m.%Y %H:%M:%S`` layout are sliced directly;
+    ``strptime`` and header-based column detection run only for rows that do not match.
+    """
+
+    def __init__(self, *, date_col: int, time_col: int, kw_col: int, time_fmt: str, date_fmt: str,
+                 prefer_auto: bool = False):
+        self.date_col = date_col
+        self.time_col = time_col
+        self.kw_col = kw_col
+        self.time_fmt = time_fmt
+        self.date_fmt = date_fmt
+        self._prefer_auto = prefer_auto
+        self._schemas: Dict[str, CsvSchema] = {}
+        self.last_stats = ParseStats()
+
+    @property
+    def layout(self) -> Dict:
+        """Constructor arguments, for rebuilding the parser in a worker process."""
+        return {"date_col": self.date_col, "time_col": self.time_col, "kw_col": self.kw_col,
+                "time_fmt": self.time_fmt, "date_fmt": self.date_fmt, "prefer_auto": self._prefer_auto}
+
+    @staticmethod
+    def detect_schema(header_line: str) -> CsvSchema:
+        delim = '\t' if '\t' in header_line else ';'
+        header = next(csv.reader([header_line.rstrip("\r\n")], delimiter=delim), [])
+        date_idx = time_idx = energy_idx = power_idx = status_idx = None
+        for i, h in enumerate(x.strip().lower() for x in header):
+            if h in ("datum", "date"): date_idx = i
+            elif h in ("vrijeme", "time"): time_idx = i
+            elif "energ" in h: energy_idx = i
+            elif "snaga" in h or "power" in h: power_idx = i
+            elif h == "status": status_idx = i
+        value_idx = [i for i in (energy_idx, power_idx) if i is not None]
+        return CsvSchema(delim, date_idx, time_idx, value_idx, status_idx)
+
+    def schema_for(self, header_line: str) -> CsvSchema:
+        key = header_line.strip()
+        schema = self._schemas.get(key)
+        if schema is None:
+            schema = self.detect_schema(header_line)
+            schema.prefer_auto = self._prefer_auto
+            self._schemas[key] = schema
+            _LOGGER.debug("Detected CSV layout %s", schema)
+        return schema
+
+    def record(self, stats: ParseStats) -> None:
+        self.last_stats = stats
+        if stats.rows:
+            _LOGGER.debug("Parsed %d rows in %.1f ms (%.0f rows/s, %d slow)",
+                          stats.rows, stats.seconds * 1000, stats.rows_per_s, stats.slow_rows)
+
+    def session(self, tz: Optional[tzinfo] = None) -> ParseSession:
+        return ParseSession(self, tz)
+
+    def parse_lines(self, lines: Iterable[str], tz: Optional[tzinfo] = None) -> Tuple[IntervalSeries, bool]:
+        sess = self.session(tz)
+        sess.feed(lines)
+        return sess.finish()
+
+    def parse_bytes(self, raw: bytes, tz: Optional[tzinfo] = None) -> Tuple[IntervalSeries, bool]:
+        if not raw:
+            return IntervalSeries(), False
+        return self.parse_lines(raw.decode("utf-8", errors="replace").splitlines(), tz)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional
+import asyncio
+import logging
+import random
+import time
+
+from .const import (
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN,
+    LIMIT_INITIAL_WINDOW, LIMIT_LATENCY_TOLERANCE, LIMIT_DECREASE_FACTOR,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"HEP portal {host} unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Decorrelated-jitter backoff (``min(cap, uniform(base, prev * 3))``) that honours Retry-After.
+
+    One instance per request, so concurrent fetches spread out instead of retrying in lockstep.
+    """
+
+    def __init__(self, *, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY):
+        self._base = base
+        self._cap = cap
+        self._prev = base
+
+    def next_delay(self, hint: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the server asks for longer than the cap."""
+        if hint is not None and hint > self._cap:
+            return None
+        delay = min(self._cap, random.uniform(self._base, self._prev * 3))
+        self._prev = delay
+        return max(delay, hint or 0.0)
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after consecutive failures, lets one probe through after a cooldown."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, *, threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.host = host
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._retry_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() >= self._reopen_at():
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def _reopen_at(self) -> float:
+        reopen = self._opened_at + self._cooldown
+        return max(reopen, self._retry_at or 0.0)
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if ``before_request`` would; takes no probe."""
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight):
+            raise CircuitOpenError(self.host, max(0.0, self._reopen_at() - time.monotonic()))
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError while the portal is considered down.
+
+        Every call that returns must be followed by ``record_success`` or ``record_failure``;
+        in the half-open state it holds the single probe until then.
+        """
+        self.check()
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            _LOGGER.info("HEP portal %s healthy again; closing circuit", self.host)
+        self._failures = 0
+        self._opened_at = None
+        self._retry_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if retry_after is not None:
+            self._retry_at = time.monotonic() + retry_after
+        if self._opened_at is not None or self._failures >= self._threshold:
+            if self._opened_at is None:
+                _LOGGER.warning("HEP portal %s failing (%d errors); opening circuit for %.0fs",
+                                self.host, self._failures, self._cooldown)
+            self._opened_at = time.monotonic()
+
+    def as_dict(self) -> Dict:
+        return {"state": self.state, "failures": self._failures}
+
+
+class AdaptiveLimiter:
+    """AIMD bound on in-flight requests.
+
+    The window grows by one slot per window's worth of fast responses while it is fully
+    used, and is halved on 429/5xx/timeouts (once per round trip, not per failed request).
+    """
+
+    def __init__(self, ceiling: int, *, initial: int = LIMIT_INITIAL_WINDOW):
+        self._ceiling = max(1, int(ceiling))
+        self.window = float(min(initial, self._ceiling))
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._baseline: Optional[float] = None
+        self._last_cut = float("-inf")
+        self.cuts = 0
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.window))
+
+    @property
+    def ceiling(self) -> int:
+        return self._ceiling
+
+    def set_ceiling(self, ceiling: int) -> None:
+        self._ceiling = max(1, int(ceiling))
+        self.window = min(self.window, self._ceiling)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def succeeded(self, latency: float) -> None:
+        """A response arrived after ``latency`` seconds (time to headers)."""
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            # Drifts up slowly so a permanently slower portal becomes the new normal
+            self._baseline += (latency - self._baseline) * 0.02
+        if latency <= self._baseline * LIMIT_LATENCY_TOLERANCE and self._in_flight >= self.limit:
+            self.window = min(self._ceiling, self.window + 1 / self.window)
+
+    def throttled(self, started: float) -> None:
+        """The portal pushed back on a request sent at ``started`` (perf_counter)."""
+        if started <= self._last_cut:
+            return  # already in flight when the window was last cut
+        self._last_cut = time.perf_counter()
+        self.window = max(1.0, self.window * LIMIT_DECREASE_FACTOR)
+        self.cuts += 1
+        _LOGGER.debug("HEP throttling: request window cut to %d", self.limit)
+
+    def as_dict(self) -> Dict:
+        return {
+            "window": round(self.window, 2),
+            "ceiling": self._ceiling,
+            "in_flight": self._in_flight,
+            "baseline_ms": round(self._baseline * 1000, 1) if self._baseline is not None else None,
+            "cuts": self.cuts,
+        }
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """Breaker shared by every client talking to ``host``."""
+    breaker = _BREAKERS.get(host)
+    if breaker is None:
+        breaker = _BREAKERS[host] = CircuitBreaker(host)
+    return breaker
@@ -0,0 +1,133 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, tzinfo
+from typing import Dict, List, Optional, Tuple
+
+from .series import SLOT, IntervalSeries, midnight_epoch, np
+from .tariff import TariffSplit, TouSchedule
+
+ROLLUP_CACHE_SIZE = 16  # months; a refresh touches the current year plus the previous month
+
+
+def _reduce(values: array, starts: List[int]) -> List[float]:
+    """Sums of ``values`` between consecutive start indexes (the last span runs to the end)."""
+    if not starts:
+        return []
+    if np is not None:
+        return np.add.reduceat(np.frombuffer(values, dtype=np.float64), starts).tolist()
+    bounds = starts[1:] + [len(values)]
+    return [sum(values[lo:hi]) for lo, hi in zip(starts, bounds)]
+
+
+class _Levels:
+    """Hour, day and month sums of one direction."""
+
+    __slots__ = ("hour_ts", "hour_kwh", "days", "total")
+
+    def __init__(self, rows: IntervalSeries, bounds: List[Tuple[date, int, int]], tz: Optional[tzinfo]):
+        # Hours from the readings (the only pass over the rows), days from hours, month from days.
+        # Readings are end-stamped: the one at HH:00 closes the hour before.
+        ts = rows.ts
+        if np is not None and ts:
+            hours = np.frombuffer(ts, dtype=np.int64) - SLOT
+            hours = hours - hours % 3600
+            starts = [0] + (np.flatnonzero(np.diff(hours)) + 1).tolist()
+        else:
+            starts = []
+            prev = None
+            for i, t in enumerate(ts):
+                h = (t - SLOT) - (t - SLOT) % 3600
+                if h != prev:
+                    starts.append(i)
+                    prev = h
+        self.hour_ts = array("q", ((ts[i] - SLOT) - (ts[i] - SLOT) % 3600 for i in starts))
+        self.hour_kwh = array("d", _reduce(rows.val, starts))
+        self.days: Dict[date, float] = {}
+        for d, lo, hi in bounds:
+            # Local midnights fall on whole hours in HEP's time zone; otherwise sum the readings
+            mid = midnight_epoch(d, tz)
+            if mid % 3600 == 0:
+                h_lo = bisect_left(self.hour_ts, mid)
+                h_hi = bisect_left(self.hour_ts, midnight_epoch(date.fromordinal(d.toordinal() + 1), tz), h_lo)
+                self.days[d] = sum(self.hour_kwh[h_lo:h_hi])
+            else:
+                self.days[d] = sum(rows.val[lo:hi])
+        self.total = sum(self.days.values())
+
+
+class MonthRollup:
+    """Hourly, daily and monthly P/R sums for one month's payload.
+
+    Built once per payload and shared by the ledger, the local store and the exporter.
+    With a tariff schedule it also carries the consumption's VT/NT split and peak demand.
+    """
+
+    __slots__ = ("p_rows", "r_rows", "schedule", "tariff", "_levels")
+
+    def __init__(self, p_rows: IntervalSeries, r_rows: IntervalSeries, tz: Optional[tzinfo],
+                 schedule: Optional[TouSchedule] = None):
+        self.p_rows = p_rows
+        self.r_rows = r_rows
+        self.schedule = schedule
+        p_bounds = p_rows.day_bounds(tz)
+        self._levels = {"P": _Levels(p_rows, p_bounds, tz), "R": _Levels(r_rows, r_rows.day_bounds(tz), tz)}
+        self.tariff: Optional[TariffSplit] = schedule.split(p_rows, p_bounds, tz) if schedule else None
+
+    def total(self, direction: str) -> float:
+        return self._levels[direction].total
+
+    def days(self, direction: str) -> Dict[date, float]:
+        return self._levels[direction].days
+
+    def day_list(self) -> List[date]:
+        return sorted(set(self._levels["P"].days) | set(self._levels["R"].days))
+
+    def hourly(self, direction: str) -> List[Tuple[int, float]]:
+        lv = self._levels[direction]
+        return list(zip(lv.hour_ts, lv.hour_kwh))
+
+    def tou_day(self, d: date) -> Tuple[float, float]:
+        """(VT, NT) consumption of one local day."""
+        vt = self.tariff.vt_days.get(d, 0.0) if self.tariff else 0.0
+        return vt, self._levels["P"].days.get(d, 0.0) - vt
+
+    def tou_range(self, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[float, float]:
+        """(VT, NT) consumption of the local days start <= d < end (all of the payload by default)."""
+        vt = nt = 0.0
+        for d in self._levels["P"].days:
+            if (start is None or d >= start) and (end is None or d < end):
+                v, n = self.tou_day(d)
+                vt += v
+                nt += n
+        return vt, nt
+
+
+class RollupCache:
+    """Rollups by month, valid while the month's rows (and tariff schedule) are the same objects.
+
+    The client and month cache hand back the very same series for unchanged payloads,
+    so identity is enough to tell a repeat from a new fetch.
+    """
+
+    def __init__(self, size: int = ROLLUP_CACHE_SIZE):
+        self._size = size
+        self._items: "OrderedDict[str, MonthRollup]" = OrderedDict()
+
+    def get(self, month_str: str, p_rows: IntervalSeries, r_rows: IntervalSeries,
+            schedule: Optional[TouSchedule] = None) -> Optional[MonthRollup]:
+        hit = self._items.get(month_str)
+        if hit is None or hit.p_rows is not p_rows or hit.r_rows is not r_rows or hit.schedule != schedule:
+            return None
+        self._items.move_to_end(month_str)
+        return hit
+
+    def put(self, month_str: str, rollup: MonthRollup) -> None:
+        self._items[month_str] = rollup
+        self._items.move_to_end(month_str)
+        while len(self._items) > self._size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
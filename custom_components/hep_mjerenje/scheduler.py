@@ -0,0 +1,83 @@
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import logging
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    SCHED_DEFAULT_WINDOW_START, SCHED_WINDOW_MARGIN, SCHED_WINDOW_LENGTH,
+    SCHED_MIN_BACKOFF, SCHED_MAX_BACKOFF, SCHED_HISTORY,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """Picks the next refresh delay from when HEP usually publishes yesterday's data.
+
+    Outside the learned window it sleeps (up to the configured interval); inside it,
+    until yesterday is complete, it polls on a short doubling backoff.
+    """
+
+    def __init__(self, hass: HomeAssistant, omm: str):
+        self._store = Store(hass, 1, f"hep_mjerenje_schedule_{omm}")
+        self._seen: Optional[List[int]] = None  # minute of day yesterday first appeared complete
+        self._complete_for: Optional[date] = None
+        self._missing_on: Optional[date] = None
+        self._backoff = SCHED_MIN_BACKOFF
+
+    async def async_load(self) -> None:
+        if self._seen is not None:
+            return
+        data = await self._store.async_load() or {}
+        self._seen = [int(m) for m in data.get("seen", [])][-SCHED_HISTORY:]
+
+    def window_start(self) -> int:
+        """Minute of day from which new data is expected."""
+        if not self._seen:
+            return SCHED_DEFAULT_WINDOW_START
+        ordered = sorted(self._seen)
+        return max(0, ordered[len(ordered) // 4] - SCHED_WINDOW_MARGIN)
+
+    @property
+    def window(self) -> str:
+        start = self.window_start()
+        return f"{start // 60:02d}:{start % 60:02d}"
+
+    def _record(self, minute: int) -> None:
+        self._seen = (self._seen or [])[-(SCHED_HISTORY - 1):] + [max(0, minute)]
+        self._store.async_delay_save(lambda: {"seen": self._seen}, 10)
+
+    def observe(self, now: datetime, complete: bool) -> None:
+        """Learn from a refresh whether/when yesterday's data was published."""
+        today = now.date()
+        if not complete:
+            self._missing_on = today
+            return
+        if self._complete_for == today:
+            return
+        self._complete_for = today
+        self._backoff = SCHED_MIN_BACKOFF
+        minute = now.hour * 60 + now.minute
+        if self._missing_on == today:
+            # Missing earlier today, present now: it appeared since the previous poll
+            self._record(minute)
+            _LOGGER.debug("HEP data for %s appeared by %02d:%02d", today - timedelta(days=1), now.hour, now.minute)
+        elif minute <= self.window_start() + 2 * SCHED_WINDOW_MARGIN:
+            # Already there at the window start: probe a little earlier next time
+            self._record(self.window_start() - SCHED_WINDOW_MARGIN)
+
+    def next_interval(self, now: datetime, complete: bool, ceiling: timedelta) -> timedelta:
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = midnight + timedelta(minutes=self.window_start())
+        if complete:
+            wait = start + timedelta(days=1) - now
+        elif now < start:
+            wait = start - now
+        elif now < start + timedelta(minutes=SCHED_WINDOW_LENGTH):
+            wait = timedelta(minutes=self._backoff)
+            self._backoff = min(self._backoff * 2, SCHED_MAX_BACKOFF)
+        else:
+            wait = ceiling
+        return max(timedelta(minutes=1), min(wait, ceiling))
@@ -1,9 +1,9 @@
 from __future__ import annotations
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
-from homeassistant.const import UnitOfEnergy
+from homeassistant.const import UnitOfEnergy, UnitOfPower
 from homeassistant.helpers.entity import DeviceInfo
 from .const import (
     DOMAIN,
@@ -12,8 +12,15 @@ from .const import (
     KEY_CONS_YESTERDAY, KEY_EXP_YESTERDAY,
     KEY_CONS_PREV_MONTH, KEY_EXP_PREV_MONTH,
     KEY_CONS_YEAR, KEY_EXP_YEAR,
-    CONF_OMM,
+    KEY_CONS_MONTH_VT, KEY_CONS_MONTH_NT,
+    KEY_CONS_YESTERDAY_VT, KEY_CONS_YESTERDAY_NT,
+    KEY_CONS_YEAR_VT, KEY_CONS_YEAR_NT,
+    KEY_PEAK_MONTH, KEY_PEAK_MONTH_AT,
+    CONF_OMM, CONF_USERNAME,
+    DATA_COORDINATORS,
+    KEY_DIAG_BREAKER, KEY_DIAG_STALE, VOLATILE_DIAG_KEYS,
 )
+from . import account_identifier
 
 ENERGY_SPECS = [
     ("Consumption Total", KEY_CONS_TOTAL, SensorStateClass.TOTAL_INCREASING),
@@ -28,10 +35,20 @@ ENERGY_SPECS = [
     ("Export Year", KEY_EXP_YEAR, SensorStateClass.TOTAL),
 ]
 
+# Only with the VT/NT split enabled in the options
+TARIFF_SPECS = [
+    ("Consumption This Month VT", KEY_CONS_MONTH_VT, SensorStateClass.TOTAL),
+    ("Consumption This Month NT", KEY_CONS_MONTH_NT, SensorStateClass.TOTAL),
+    ("Consumption Yesterday VT", KEY_CONS_YESTERDAY_VT, SensorStateClass.TOTAL),
+    ("Consumption Yesterday NT", KEY_CONS_YESTERDAY_NT, SensorStateClass.TOTAL),
+    ("Consumption Year VT", KEY_CONS_YEAR_VT, SensorStateClass.TOTAL),
+    ("Consumption Year NT", KEY_CONS_YEAR_NT, SensorStateClass.TOTAL),
+]
+
 async def async_setup_entry(hass: HomeAssistant, entry, async_add_entities: AddEntitiesCallback):
-    coordinator = hass.data[DOMAIN]["coordinator"]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
     omm = entry.data[CONF_OMM]
-    parent_ident = (DOMAIN, "hep_account")
+    parent_ident = account_identifier(entry.data[CONF_USERNAME])
     child_device_info = DeviceInfo(
         identifiers={(DOMAIN, omm)},
         name=f"HEP {omm}",
@@ -39,7 +56,10 @@ async def async_setup_entry(hass: HomeAssistant, entry, async_add_entities: AddE
         model="Smart Meter",
         via_device=parent_ident,
     )
-    energy_entities = [HepEnergySensor(coordinator, name, key, state_class, child_device_info, omm) for (name, key, state_class) in ENERGY_SPECS]
+    specs = ENERGY_SPECS + (TARIFF_SPECS if coordinator.tou_enabled else [])
+    energy_entities = [HepEnergySensor(coordinator, name, key, state_class, child_device_info, omm) for (name, key, state_class) in specs]
+    if coordinator.tou_enabled:
+        energy_entities.append(HepPeakSensor(coordinator, "Peak Demand This Month", child_device_info, omm))
     diag_entity = HepDiagSensor(coordinator, "Diagnostics", child_device_info, omm)
     async_add_entities(energy_entities + [diag_entity])
 
@@ -53,19 +73,51 @@ class HepEnergySensor(CoordinatorEntity, SensorEntity):
         self._attr_state_class = state_class
         self._attr_unique_id = f"hep_mjerenje_{omm}_{key}"
         self._attr_device_info = device_info
+        self._last_available: bool | None = None
 
     @property
     def native_value(self):
         data = self.coordinator.data or {}
         return data.get(self._key)
 
+    @property
+    def available(self) -> bool:
+        # Stale-while-revalidate: a slow or failing portal keeps the last good values visible
+        return super().available or self.coordinator.serving_stale
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        # Only write when this sensor's own value (or availability) changed
+        available = self.available
+        if self._key not in self.coordinator.changed_keys and available == self._last_available:
+            return
+        self._last_available = available
+        self.async_write_ha_state()
+
+class HepPeakSensor(HepEnergySensor):
+    """Highest 15-minute average demand of the month, with when it started."""
+
+    def __init__(self, coordinator, name, device_info: DeviceInfo, omm: str):
+        super().__init__(coordinator, name, KEY_PEAK_MONTH, SensorStateClass.MEASUREMENT, device_info, omm)
+        self._attr_native_unit_of_measurement = UnitOfPower.KILO_WATT
+        self._attr_device_class = SensorDeviceClass.POWER
+
+    @property
+    def extra_state_attributes(self):
+        data = self.coordinator.data or {}
+        return {"peak_at": data.get(KEY_PEAK_MONTH_AT)}
+
 class HepDiagSensor(CoordinatorEntity, SensorEntity):
+    # Change on (almost) every refresh: shown, but neither recorded nor a reason to write state
+    _unrecorded_attributes = frozenset(VOLATILE_DIAG_KEYS)
+
     def __init__(self, coordinator, name, device_info: DeviceInfo, omm: str):
         super().__init__(coordinator)
         self._attr_name = name
         self._attr_unique_id = f"hep_mjerenje_diag_{omm}"
         self._attr_device_info = device_info
         self._attr_icon = "mdi:information-outline"
+        self._attr_extra_state_attributes = self._build_attributes()
 
     @property
     def native_value(self):
@@ -73,6 +125,23 @@ class HepDiagSensor(CoordinatorEntity, SensorEntity):
         return data.get('diag_rows_total')
 
     @property
-    def extra_state_attributes(self):
+    def available(self) -> bool:
+        # Diagnostics stay readable while refreshes fail (e.g. circuit open)
+        return True
+
+    def _build_attributes(self):
         data = self.coordinator.data or {}
-        return {k: v for k, v in data.items() if k.startswith('diag_')}
+        attrs = {k: v for k, v in data.items() if k.startswith('diag_') or k in VOLATILE_DIAG_KEYS}
+        attrs[KEY_DIAG_BREAKER] = self.coordinator.breaker_state
+        attrs[KEY_DIAG_STALE] = self.coordinator.serving_stale
+        return attrs
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        changed = {k for k in self.coordinator.changed_keys if k.startswith('diag_') and k not in VOLATILE_DIAG_KEYS}
+        attrs = self._attr_extra_state_attributes
+        if (not changed and self.coordinator.breaker_state == attrs.get(KEY_DIAG_BREAKER)
+                and self.coordinator.serving_stale == attrs.get(KEY_DIAG_STALE)):
+            return
+        self._attr_extra_state_attributes = self._build_attributes()
+        self.async_write_ha_state()
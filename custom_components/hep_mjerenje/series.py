@@ -0,0 +1,144 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:  # optional fast path
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is not a hard requirement
+    np = None
+
+SLOT = 900  # seconds; HEP stamps the end of each interval, so a reading at ts covers [ts - SLOT, ts)
+
+
+def local_epoch(naive: datetime, tz: Optional[tzinfo], after: Optional[int] = None) -> int:
+    """Epoch seconds of a naive wall-clock time in ``tz``.
+
+    During the DST fall-back hour the repeated wall times map to the second
+    occurrence once ``after`` (the previous reading) has already passed the first.
+    """
+    aware = naive.replace(tzinfo=tz or timezone.utc)
+    ts = int(aware.timestamp())
+    if after is not None and ts <= after:
+        ts2 = int(aware.replace(fold=1).timestamp())
+        if ts2 > after:
+            return ts2
+    return ts
+
+
+def midnight_epoch(d: date, tz: Optional[tzinfo]) -> int:
+    return int(datetime(d.year, d.month, d.day, tzinfo=tz or timezone.utc).timestamp())
+
+
+class IntervalSeries:
+    """Columnar 15-minute readings: epoch seconds in array('q'), kWh in array('d')."""
+
+    __slots__ = ("ts", "val")
+
+    def __init__(self, ts: Optional[array] = None, val: Optional[array] = None):
+        self.ts = ts if ts is not None else array("q")
+        self.val = val if val is not None else array("d")
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[int, float]]) -> "IntervalSeries":
+        s = cls()
+        for t, v in pairs:
+            s.ts.append(int(t))
+            s.val.append(float(v))
+        s.ensure_sorted()
+        return s
+
+    def append(self, ts: int, val: float) -> None:
+        self.ts.append(ts)
+        self.val.append(val)
+
+    def ensure_sorted(self) -> None:
+        ts = self.ts
+        if all(ts[i] <= ts[i + 1] for i in range(len(ts) - 1)):
+            return
+        order = sorted(range(len(ts)), key=ts.__getitem__)
+        self.ts = array("q", (ts[i] for i in order))
+        self.val = array("d", (self.val[i] for i in order))
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def __iter__(self) -> Iterator[Tuple[int, float]]:
+        return zip(self.ts, self.val)
+
+    @property
+    def first_ts(self) -> Optional[int]:
+        return self.ts[0] if self.ts else None
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        return self.ts[-1] if self.ts else None
+
+    def first_datetime(self, tz: Optional[tzinfo]) -> Optional[datetime]:
+        first = self.first_ts
+        return datetime.fromtimestamp(first, tz or timezone.utc) if first is not None else None
+
+    def last_datetime(self, tz: Optional[tzinfo]) -> Optional[datetime]:
+        last = self.last_ts
+        return datetime.fromtimestamp(last, tz or timezone.utc) if last is not None else None
+
+    def _sum(self, lo: int, hi: int) -> float:
+        if hi <= lo:
+            return 0.0
+        if np is not None:
+            return float(np.frombuffer(self.val, dtype=np.float64)[lo:hi].sum())
+        return sum(self.val[lo:hi])
+
+    def sum(self) -> float:
+        return self._sum(0, len(self.val))
+
+    def _index_range(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        lo = 0 if start is None else bisect_left(self.ts, start)
+        hi = len(self.ts) if end is None else bisect_left(self.ts, end, lo)
+        return lo, hi
+
+    def sum_range(self, start: Optional[int], end: Optional[int]) -> float:
+        """Sum of readings with start <= ts < end (epoch seconds)."""
+        return self._sum(*self._index_range(start, end))
+
+    def slice(self, start: Optional[int], end: Optional[int]) -> "IntervalSeries":
+        lo, hi = self._index_range(start, end)
+        return IntervalSeries(self.ts[lo:hi], self.val[lo:hi])
+
+    def day_bounds(self, tz: Optional[tzinfo]) -> List[Tuple[date, int, int]]:
+        """(local date, lo, hi) index spans, one per day that has readings.
+
+        Readings belong to the day their interval starts in: the one stamped 00:00 closes the previous day.
+        """
+        if not self.ts:
+            return []
+        tz = tz or timezone.utc
+        d = datetime.fromtimestamp(self.ts[0] - SLOT, tz).date()
+        last = datetime.fromtimestamp(self.ts[-1] - SLOT, tz).date()
+        out: List[Tuple[date, int, int]] = []
+        lo = 0
+        while d <= last:
+            nxt = d + timedelta(days=1)
+            hi = bisect_left(self.ts, midnight_epoch(nxt, tz) + SLOT, lo)
+            if hi > lo:
+                out.append((d, lo, hi))
+            lo = hi
+            d = nxt
+        return out
+
+    def group_by_day(self, tz: Optional[tzinfo]) -> Dict[date, float]:
+        bounds = self.day_bounds(tz)
+        if not bounds:
+            return {}
+        if np is not None:
+            sums = np.add.reduceat(np.frombuffer(self.val, dtype=np.float64), [b[1] for b in bounds])
+            return {b[0]: float(v) for b, v in zip(bounds, sums)}
+        return {d: sum(self.val[lo:hi]) for d, lo, hi in bounds}
+
+    def to_json(self) -> Dict[str, List]:
+        return {"ts": self.ts.tolist(), "val": self.val.tolist()}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "IntervalSeries":
+        return cls(array("q", data.get("ts") or []), array("d", data.get("val") or []))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from datetime import date, datetime
+from typing import Dict, Mapping, Optional, Tuple
+import logging
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    SNAPSHOT_SAVE_DELAY,
+    KEY_CONS_MONTH, KEY_EXP_MONTH,
+    KEY_CONS_YESTERDAY, KEY_EXP_YESTERDAY,
+    KEY_CONS_PREV_MONTH, KEY_EXP_PREV_MONTH,
+    KEY_CONS_YEAR, KEY_EXP_YEAR,
+    KEY_CONS_MONTH_VT, KEY_CONS_MONTH_NT, KEY_CONS_YESTERDAY_VT, KEY_CONS_YESTERDAY_NT,
+    KEY_CONS_YEAR_VT, KEY_CONS_YEAR_NT, KEY_PEAK_MONTH, KEY_PEAK_MONTH_AT,
+    KEY_DIAG_IMPORT, VOLATILE_DIAG_KEYS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Values that only hold for the day / month / year they were computed on
+_SCOPES: Dict[str, str] = {
+    **dict.fromkeys((KEY_CONS_YESTERDAY, KEY_EXP_YESTERDAY, KEY_CONS_YESTERDAY_VT, KEY_CONS_YESTERDAY_NT), "day"),
+    **dict.fromkeys((KEY_CONS_MONTH, KEY_EXP_MONTH, KEY_CONS_PREV_MONTH, KEY_EXP_PREV_MONTH,
+                     KEY_CONS_MONTH_VT, KEY_CONS_MONTH_NT, KEY_PEAK_MONTH, KEY_PEAK_MONTH_AT), "month"),
+    **dict.fromkeys((KEY_CONS_YEAR, KEY_EXP_YEAR, KEY_CONS_YEAR_VT, KEY_CONS_YEAR_NT), "year"),
+}
+
+
+def _same(scope: str, a: date, b: date) -> bool:
+    if scope == "day":
+        return a == b
+    if scope == "month":
+        return (a.year, a.month) == (b.year, b.month)
+    return a.year == b.year
+
+
+class DataSnapshot:
+    """The coordinator's last computed data, restored at setup before any portal request."""
+
+    def __init__(self, hass: HomeAssistant, omm: str):
+        self._store = Store(hass, 1, f"hep_mjerenje_snapshot_{omm}")
+
+    async def async_load(self, today: date) -> Optional[Tuple[Dict, datetime]]:
+        """(data, computed at) with values of a past day, month or year dropped; None if absent."""
+        stored = await self._store.async_load()
+        if not stored or not isinstance(stored.get("data"), dict):
+            return None
+        try:
+            day = date.fromisoformat(stored["day"])
+            saved_at = datetime.fromisoformat(stored["saved_at"])
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.debug("Ignoring malformed data snapshot")
+            return None
+        data = {k: v for k, v in stored["data"].items()
+                if k not in _SCOPES or _same(_SCOPES[k], day, today)}
+        return data, saved_at
+
+    def save(self, data: Mapping, day: date, saved_at: datetime) -> None:
+        # Per-cycle diagnostics and import progress describe the running instance only
+        keep = {k: v for k, v in data.items() if k not in VOLATILE_DIAG_KEYS and k != KEY_DIAG_IMPORT}
+        payload = {"day": day.isoformat(), "saved_at": saved_at.isoformat(), "data": keep}
+        self._store.async_delay_save(lambda: payload, SNAPSHOT_SAVE_DELAY)
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -0,0 +1,53 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Dict
+import logging
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .tsdb import IntervalStore
+
+_LOGGER = logging.getLogger(__name__)
+
+SERIES = {"P": ("consumption", "Consumption"), "R": ("export", "Export")}
+
+
+def statistic_id(omm: str, direction: str) -> str:
+    return f"{DOMAIN}:{SERIES[direction][0]}_{str(omm).lower()}"
+
+
+async def async_push_statistics(hass: HomeAssistant, tsdb: IntervalStore, omm: str) -> Dict[str, int]:
+    """Import new/changed hourly sums from the local store as external long-term statistics.
+
+    Only hours from the earliest changed one onward are sent (their running sums
+    shift), in one recorder job per direction; returns hours pushed per direction.
+    """
+    if "recorder" not in hass.config.components:
+        return {}
+    from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+    from homeassistant.components.recorder.statistics import async_add_external_statistics
+
+    pushed: Dict[str, int] = {}
+    for direction, (key, label) in SERIES.items():
+        base, rows = await hass.async_add_executor_job(tsdb.unpushed_hours, omm, direction)
+        if not rows:
+            continue
+        metadata = StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name=f"HEP {omm} {label}",
+            source=DOMAIN,
+            statistic_id=statistic_id(omm, direction),
+            unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+        )
+        total = base
+        stats = []
+        for ts, kwh in rows:
+            total += kwh
+            stats.append(StatisticData(start=datetime.fromtimestamp(ts, timezone.utc), sum=total))
+        async_add_external_statistics(hass, metadata, stats)
+        await hass.async_add_executor_job(tsdb.mark_pushed, omm, direction, rows)
+        pushed[direction] = len(rows)
+        _LOGGER.debug("Queued %d hourly %s statistics for %s", len(rows), key, omm)
+    return pushed
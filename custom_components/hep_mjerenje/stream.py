@@ -0,0 +1,92 @@
+from __future__ import annotations
+from typing import List
+import base64
+import binascii
+import codecs
+import re
+
+_B64_CHARS = re.compile(rb"[^A-Za-z0-9+/=]")
+
+
+class JsonBase64LineDecoder:
+    """Incrementally pull a base64 string field out of a JSON body and yield decoded text lines.
+
+    Only the current network chunk, an unterminated base64 quartet and the current
+    partial text line are held in memory, regardless of payload size. Invalid base64, or
+    a body that ends inside the field, raises binascii.Error (a ValueError).
+    """
+
+    def __init__(self, field: str = "data"):
+        self._key = re.compile(rb'"' + re.escape(field.encode()) + rb'"\s*:\s*(")?')
+        self._state = 0  # 0 = seeking key, 1 = inside value, 2 = done
+        self._head = b""
+        self._b64 = b""
+        self._padded = False  # a decoded quartet ended in padding; nothing may follow
+        self._text = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._line = ""
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def found(self) -> bool:
+        return self._state > 0
+
+    def feed(self, chunk: bytes) -> List[str]:
+        self.bytes_in += len(chunk)
+        if self._state == 2 or not chunk:
+            return []
+        if self._state == 0:
+            buf = self._head + chunk
+            m = self._key.search(buf)
+            if m is None or (m.group(1) is None and m.end() == len(buf)):
+                # Keep a short tail so a key split across chunks is still found
+                self._head = buf[-64:]
+                return []
+            self._head = b""
+            if m.group(1) is None:  # null / non-string value
+                self._state = 2
+                return []
+            self._state = 1
+            chunk = buf[m.end():]
+        end = chunk.find(b'"')
+        if end >= 0:
+            self._state = 2
+            chunk = chunk[:end]
+        return self._decode(chunk, final=self._state == 2)
+
+    def close(self) -> List[str]:
+        """Flush the last partial line."""
+        if self._state == 1:
+            self._state = 2
+            raise binascii.Error("payload ended inside the base64 field")
+        out = []
+        self._state = 2
+        if self._line:
+            out.append(self._line)
+            self._line = ""
+        return out
+
+    def _decode(self, chunk: bytes, *, final: bool) -> List[str]:
+        # JSON may escape "/" as "\/" and carry escaped line breaks; keep only base64 alphabet
+        if self._b64.endswith(b"\\"):
+            chunk = self._b64[-1:] + chunk
+            self._b64 = self._b64[:-1]
+        held = b""
+        if chunk.endswith(b"\\") and not final:
+            chunk, held = chunk[:-1], b"\\"
+        chunk = chunk.replace(b"\\r", b"").replace(b"\\n", b"")
+        pending = self._b64 + _B64_CHARS.sub(b"", chunk)
+        n = len(pending) if final else len(pending) - len(pending) % 4
+        try:
+            if self._padded and pending:
+                raise binascii.Error("Excess data after padding")
+            raw = base64.b64decode(pending[:n], validate=True) if n else b""
+        except binascii.Error as ex:
+            raise binascii.Error(f"invalid base64 after {self.bytes_out} decoded bytes: {ex}") from None
+        self._padded = self._padded or pending[:n].endswith(b"=")
+        self._b64 = pending[n:] + held
+        self.bytes_out += len(raw)
+        text = self._line + self._text.decode(raw, final=final)
+        lines = text.split("\n")
+        self._line = lines.pop()
+        return lines
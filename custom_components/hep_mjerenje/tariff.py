@@ -0,0 +1,204 @@
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
+import logging
+
+from .const import (
+    CONF_TOU_ENABLED, CONF_TOU_VT_WINTER, CONF_TOU_VT_SUMMER,
+    CONF_TOU_WEEKEND_NT, CONF_TOU_HOLIDAY_NT, CONF_TOU_EXTRA_HOLIDAYS,
+    DEFAULT_TOU_VT_WINTER, DEFAULT_TOU_VT_SUMMER, DEFAULT_TOU_WEEKEND_NT, DEFAULT_TOU_HOLIDAY_NT,
+)
+from .series import SLOT, IntervalSeries, local_epoch, midnight_epoch, np
+
+_LOGGER = logging.getLogger(__name__)
+
+# Croatian public holidays on fixed dates (month, day); Easter-based ones are computed
+_FIXED_HOLIDAYS = ((1, 1), (1, 6), (5, 1), (5, 30), (6, 22), (8, 5), (8, 15), (11, 1), (11, 18), (12, 25), (12, 26))
+
+
+def easter(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month, day = divmod(h + l - 7 * m + 90, 25)
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+def croatian_holidays(year: int) -> FrozenSet[date]:
+    sunday = easter(year)
+    out = {date(year, m, d) for m, d in _FIXED_HOLIDAYS}
+    # Easter, Easter Monday, Corpus Christi
+    out.update(sunday + timedelta(days=n) for n in (0, 1, 60))
+    return frozenset(out)
+
+
+def _parse_window(text: str) -> Tuple[int, int]:
+    """"HH:MM-HH:MM" as (start, end) minutes of the local day."""
+    start, end = (part.strip() for part in str(text).split("-"))
+    out = []
+    for part in (start, end):
+        h, _, m = part.partition(":")
+        minutes = int(h) * 60 + int(m or 0)
+        if not 0 <= minutes <= 24 * 60:
+            raise ValueError(text)
+        out.append(minutes)
+    if out[0] >= out[1]:
+        raise ValueError(text)
+    return out[0], out[1]
+
+
+def _parse_days(text: str) -> Tuple[str, ...]:
+    """Extra NT days: "YYYY-MM-DD" for one date, "MM-DD" for every year."""
+    out = []
+    for part in str(text or "").replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        probe = part if part.count("-") == 2 else f"2000-{part}"
+        date.fromisoformat(probe)
+        out.append(part)
+    return tuple(sorted(set(out)))
+
+
+@dataclass(frozen=True)
+class TouSchedule:
+    """VT (high tariff) windows per local day; everything else is NT.
+
+    HEP's dual tariff: VT 07-21 h in winter time, 08-22 h in summer time.
+    """
+
+    vt_winter: Tuple[int, int]
+    vt_summer: Tuple[int, int]
+    weekend_nt: bool = False
+    holiday_nt: bool = False
+    extra_days: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_options(cls, options: Mapping) -> Optional["TouSchedule"]:
+        if not options.get(CONF_TOU_ENABLED, False):
+            return None
+        try:
+            winter = _parse_window(options.get(CONF_TOU_VT_WINTER, DEFAULT_TOU_VT_WINTER))
+            summer = _parse_window(options.get(CONF_TOU_VT_SUMMER, DEFAULT_TOU_VT_SUMMER))
+            extra = _parse_days(options.get(CONF_TOU_EXTRA_HOLIDAYS, ""))
+        except ValueError as ex:
+            _LOGGER.warning("Invalid tariff schedule (%s); using HEP's default VT windows", ex)
+            winter, summer = _parse_window(DEFAULT_TOU_VT_WINTER), _parse_window(DEFAULT_TOU_VT_SUMMER)
+            extra = ()
+        return cls(winter, summer,
+                   bool(options.get(CONF_TOU_WEEKEND_NT, DEFAULT_TOU_WEEKEND_NT)),
+                   bool(options.get(CONF_TOU_HOLIDAY_NT, DEFAULT_TOU_HOLIDAY_NT)),
+                   extra)
+
+    @property
+    def key(self) -> str:
+        """Stable text form; stored with ledger entries to spot a changed schedule."""
+        fmt = lambda w: f"{w[0] // 60:02d}:{w[0] % 60:02d}-{w[1] // 60:02d}:{w[1] % 60:02d}"
+        return "|".join((fmt(self.vt_winter), fmt(self.vt_summer), f"w{int(self.weekend_nt)}",
+                         f"h{int(self.holiday_nt)}", ",".join(self.extra_days)))
+
+    def all_nt(self, d: date) -> bool:
+        if self.weekend_nt and d.weekday() >= 5:
+            return True
+        if self.holiday_nt and d in croatian_holidays(d.year):
+            return True
+        return d.isoformat() in self.extra_days or d.strftime("%m-%d") in self.extra_days
+
+    def window(self, d: date, tz: Optional[tzinfo]) -> Tuple[int, int]:
+        # Summer time is decided per day (at noon, clear of the switch at 02:00/03:00)
+        noon = datetime(d.year, d.month, d.day, 12, tzinfo=tz or timezone.utc)
+        return self.vt_summer if noon.dst() else self.vt_winter
+
+    def is_vt(self, start: int, tz: Optional[tzinfo]) -> bool:
+        """Tariff of the interval starting at ``start`` (epoch seconds); the slow path for odd rows."""
+        local = datetime.fromtimestamp(start, tz or timezone.utc)
+        d = local.date()
+        if self.all_nt(d):
+            return False
+        lo, hi = self.window(d, tz)
+        return lo <= local.hour * 60 + local.minute < hi
+
+    def mask(self, year: int, month: int, tz: Optional[tzinfo]) -> Tuple[int, bytes]:
+        """(local month start epoch, one VT flag per 15-minute slot of the month)."""
+        return _compile(self, year, month, tz)
+
+    def split(self, rows: IntervalSeries, bounds: List[Tuple[date, int, int]],
+              tz: Optional[tzinfo]) -> "TariffSplit":
+        return TariffSplit(self, rows, bounds, tz)
+
+
+@lru_cache(maxsize=32)
+def _compile(schedule: TouSchedule, year: int, month: int, tz: Optional[tzinfo]) -> Tuple[int, bytes]:
+    # Per local day: the VT window's slots; DST days come out 92 or 100 slots long by construction
+    first = date(year, month, 1)
+    nxt = (first + timedelta(days=32)).replace(day=1)
+    start = midnight_epoch(first, tz)
+    flags = bytearray((midnight_epoch(nxt, tz) - start) // SLOT)
+    d = first
+    while d < nxt:
+        if not schedule.all_nt(d):
+            lo, hi = schedule.window(d, tz)
+            base = datetime(d.year, d.month, d.day)
+            t_lo = local_epoch(base + timedelta(minutes=lo), tz)
+            t_hi = local_epoch(base + timedelta(minutes=hi), tz)
+            i_lo, i_hi = (t_lo - start) // SLOT, (t_hi - start) // SLOT
+            flags[i_lo:i_hi] = b"\x01" * (i_hi - i_lo)
+        d += timedelta(days=1)
+    return start, bytes(flags)
+
+
+class TariffSplit:
+    """VT energy per day and the month's peak 15-minute demand of one direction.
+
+    One pass over the rows: each reading's slot is looked up in the month mask.
+    """
+
+    __slots__ = ("vt_days", "peak_kwh", "peak_ts")
+
+    def __init__(self, schedule: TouSchedule, rows: IntervalSeries, bounds: List[Tuple[date, int, int]],
+                 tz: Optional[tzinfo]):
+        self.vt_days: Dict[date, float] = {}
+        self.peak_kwh: Optional[float] = None
+        self.peak_ts: Optional[int] = None
+        if not rows.ts:
+            return
+        # The payload's month: where its first interval starts
+        local = datetime.fromtimestamp(rows.ts[0] - SLOT, tz or timezone.utc)
+        m_start, flags = schedule.mask(local.year, local.month, tz)
+        n = len(flags)
+        starts = [lo for _, lo, _ in bounds]
+        if np is not None:
+            ts = np.frombuffer(rows.ts, dtype=np.int64)
+            vals = np.frombuffer(rows.val, dtype=np.float64)
+            idx = (ts - SLOT - m_start) // SLOT
+            inside = (idx >= 0) & (idx < n)
+            vt = np.zeros(len(ts), dtype=bool)
+            vt[inside] = np.frombuffer(flags, dtype=np.uint8)[idx[inside]].astype(bool)
+            for i in np.flatnonzero(~inside).tolist():
+                vt[i] = schedule.is_vt(int(ts[i]) - SLOT, tz)
+            sums = np.add.reduceat(np.where(vt, vals, 0.0), starts).tolist()
+            if inside.any():
+                best = int(np.where(inside, vals, -np.inf).argmax())
+                self.peak_kwh, self.peak_ts = float(vals[best]), int(ts[best])
+        else:
+            picked = array("d", bytes(8 * len(rows.ts)))
+            for i, (t, v) in enumerate(rows):
+                j = (t - SLOT - m_start) // SLOT
+                if 0 <= j < n:
+                    if flags[j]:
+                        picked[i] = v
+                    if self.peak_kwh is None or v > self.peak_kwh:
+                        self.peak_kwh, self.peak_ts = v, t
+                elif schedule.is_vt(t - SLOT, tz):
+                    picked[i] = v
+            ends = starts[1:] + [len(picked)]
+            sums = [sum(picked[lo:hi]) for lo, hi in zip(starts, ends)]
+        self.vt_days = {d: float(s) for (d, _, _), s in zip(bounds, sums)}
@@ -0,0 +1,222 @@
+from __future__ import annotations
+from datetime import date, tzinfo
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import sqlite3
+import threading
+from homeassistant.core import HomeAssistant
+
+from .rollup import MonthRollup
+from .series import SLOT, IntervalSeries, midnight_epoch
+
+_LOGGER = logging.getLogger(__name__)
+
+# Hour of the interval a reading closes
+_HOUR = f"(ts - {SLOT}) - (ts - {SLOT}) % 3600"
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS intervals (
+        omm TEXT NOT NULL, direction TEXT NOT NULL, ts INTEGER NOT NULL, kwh REAL NOT NULL,
+        PRIMARY KEY (omm, direction, ts)) WITHOUT ROWID""",
+    # pushed = 0 marks hours new or changed since the last long-term statistics import
+    """CREATE TABLE IF NOT EXISTS hourly (
+        omm TEXT NOT NULL, direction TEXT NOT NULL, ts INTEGER NOT NULL, kwh REAL NOT NULL,
+        pushed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (omm, direction, ts)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS daily (
+        omm TEXT NOT NULL, direction TEXT NOT NULL, day TEXT NOT NULL, kwh REAL NOT NULL,
+        PRIMARY KEY (omm, direction, day)) WITHOUT ROWID""",
+    # Months stored as a whole; final = 1 once written from a finalized payload
+    """CREATE TABLE IF NOT EXISTS months (
+        omm TEXT NOT NULL, month TEXT NOT NULL, rows INTEGER NOT NULL,
+        final INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (omm, month)) WITHOUT ROWID""",
+)
+
+
+class IntervalStore:
+    """SQLite store of 15-min readings per (omm, direction, ts) with hourly and daily rollups.
+
+    ``ts`` is HEP's end stamp; hourly and daily buckets are keyed by where the interval
+    starts, so the reading stamped 00:00 counts for the previous day. Blocking; the
+    ``async_*`` wrappers run every statement in the executor. One connection is shared by
+    all meters and serialized with a lock.
+    """
+
+    def __init__(self, hass: HomeAssistant, path: str):
+        self._hass = hass
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _rebuild_buckets(db: sqlite3.Connection, omm: str, direction: str, days: List[date],
+                         tz: Optional[tzinfo]) -> None:
+        spans = [(d, midnight_epoch(d, tz), midnight_epoch(date.fromordinal(d.toordinal() + 1), tz)) for d in days]
+        lo, hi = spans[0][1], spans[-1][2]
+        db.execute(
+            f"INSERT INTO hourly (omm, direction, ts, kwh) "
+            f"SELECT omm, direction, {_HOUR}, SUM(kwh) FROM intervals "
+            f"WHERE omm = ? AND direction = ? AND ts >= ? AND ts < ? GROUP BY {_HOUR} "
+            f"ON CONFLICT (omm, direction, ts) DO UPDATE SET kwh = excluded.kwh, pushed = 0 "
+            f"WHERE kwh != excluded.kwh",
+            (omm, direction, lo - lo % 3600 + SLOT, hi + SLOT))
+        db.executemany(
+            "INSERT INTO daily (omm, direction, day, kwh) "
+            "SELECT ?, ?, ?, COALESCE(SUM(kwh), 0) FROM intervals "
+            "WHERE omm = ? AND direction = ? AND ts >= ? AND ts < ? "
+            "ON CONFLICT (omm, direction, day) DO UPDATE SET kwh = excluded.kwh",
+            ((omm, direction, d.isoformat(), omm, direction, start + SLOT, end + SLOT) for d, start, end in spans))
+
+    @staticmethod
+    def _write_buckets(db: sqlite3.Connection, omm: str, direction: str, rollup: MonthRollup) -> None:
+        db.executemany(
+            "INSERT INTO hourly (omm, direction, ts, kwh) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (omm, direction, ts) DO UPDATE SET kwh = excluded.kwh, pushed = 0 "
+            "WHERE kwh != excluded.kwh",
+            ((omm, direction, ts, kwh) for ts, kwh in rollup.hourly(direction)))
+        db.executemany(
+            "INSERT INTO daily (omm, direction, day, kwh) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (omm, direction, day) DO UPDATE SET kwh = excluded.kwh",
+            ((omm, direction, d.isoformat(), kwh) for d, kwh in sorted(rollup.days(direction).items())))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def write(self, omm: str, direction: str, rows: IntervalSeries, tz: Optional[tzinfo],
+              rollup: Optional[MonthRollup] = None) -> None:
+        """Upsert readings and the hourly/daily rollups they touch.
+
+        With the payload's ``rollup`` its hour and day sums are written as they are; a
+        whole month's payload holds every reading of its days. Without one the buckets
+        are recomputed from the stored readings.
+        """
+        if not rows:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany(
+                    "INSERT INTO intervals (omm, direction, ts, kwh) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (omm, direction, ts) DO UPDATE SET kwh = excluded.kwh",
+                    ((omm, direction, ts, val) for ts, val in rows))
+                if rollup is not None:
+                    self._write_buckets(db, omm, direction, rollup)
+                else:
+                    self._rebuild_buckets(db, omm, direction, [d for d, _, _ in rows.day_bounds(tz)], tz)
+
+    def sum_days(self, omm: str, start: date, end: date) -> Dict[str, float]:
+        """{direction: kWh} over local days start <= day < end."""
+        with self._lock:
+            cur = self._db().execute(
+                "SELECT direction, SUM(kwh) FROM daily WHERE omm = ? AND day >= ? AND day < ? GROUP BY direction",
+                (omm, start.isoformat(), end.isoformat()))
+            return {direction: kwh or 0.0 for direction, kwh in cur}
+
+    def sum_many(self, omm: str, ranges: Iterable[Tuple[date, date]]) -> List[Dict[str, float]]:
+        return [self.sum_days(omm, start, end) for start, end in ranges]
+
+    def mark_month(self, omm: str, month_str: str, rows: int, final: bool = False) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT INTO months (omm, month, rows, final) VALUES (?, ?, ?, ?) "
+                           "ON CONFLICT (omm, month) DO UPDATE SET rows = excluded.rows, final = excluded.final",
+                           (omm, month_str, rows, int(final)))
+
+    def months_present(self, omm: str, year: int) -> Dict[str, bool]:
+        """{MM.YYYY: written from a finalized payload} for months of ``year`` written as a whole."""
+        with self._lock:
+            cur = self._db().execute("SELECT month, final FROM months WHERE omm = ? AND month LIKE ?",
+                                     (omm, f"%.{year:04d}"))
+            return {m: bool(final) for m, final in cur}
+
+    def final_month(self, omm: str, month_str: str,
+                    tz: Optional[tzinfo]) -> Optional[Tuple[IntervalSeries, IntervalSeries]]:
+        """(P, R) readings of a month written from a finalized payload; None otherwise."""
+        m, y = (int(x) for x in month_str.split("."))
+        first = date(y, m, 1)
+        lo = midnight_epoch(first, tz) + SLOT
+        hi = midnight_epoch(date(y + m // 12, m % 12 + 1, 1), tz) + SLOT
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT final FROM months WHERE omm = ? AND month = ?", (omm, month_str)).fetchone()
+            if not row or not row[0]:
+                return None
+            p_rows, r_rows = (IntervalSeries.from_pairs(db.execute(
+                "SELECT ts, kwh FROM intervals WHERE omm = ? AND direction = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (omm, direction, lo, hi))) for direction in ("P", "R"))
+            return p_rows, r_rows
+
+    def clear_final(self, omm: str) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("UPDATE months SET final = 0 WHERE omm = ?", (omm,))
+
+    def hourly(self, omm: str, direction: str, start: int, end: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            cur = self._db().execute(
+                "SELECT ts, kwh FROM hourly WHERE omm = ? AND direction = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (omm, direction, start, end))
+            return cur.fetchall()
+
+    def unpushed_hours(self, omm: str, direction: str) -> Tuple[float, List[Tuple[int, float]]]:
+        """(cumulative kWh before the first new/changed hour, [(hour ts, kWh)] from that hour on)."""
+        with self._lock:
+            db = self._db()
+            (first,) = db.execute("SELECT MIN(ts) FROM hourly WHERE omm = ? AND direction = ? AND pushed = 0",
+                                  (omm, direction)).fetchone()
+            if first is None:
+                return 0.0, []
+            (base,) = db.execute("SELECT COALESCE(SUM(kwh), 0) FROM hourly WHERE omm = ? AND direction = ? AND ts < ?",
+                                 (omm, direction, first)).fetchone()
+            rows = db.execute("SELECT ts, kwh FROM hourly WHERE omm = ? AND direction = ? AND ts >= ? ORDER BY ts",
+                              (omm, direction, first)).fetchall()
+            return base, rows
+
+    def mark_pushed(self, omm: str, direction: str, rows: Iterable[Tuple[int, float]]) -> None:
+        """Mark the (hour ts, kWh) pairs as pushed; an hour rewritten since it was read stays queued."""
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany("UPDATE hourly SET pushed = 1 WHERE omm = ? AND direction = ? AND ts = ? AND kwh = ?",
+                               ((omm, direction, ts, kwh) for ts, kwh in rows))
+
+    async def async_write_month(self, omm: str, month_str: str, p_rows: IntervalSeries, r_rows: IntervalSeries,
+                                tz: Optional[tzinfo], rollup: Optional[MonthRollup] = None, final: bool = False) -> None:
+        def _job():
+            self.write(omm, "P", p_rows, tz, rollup)
+            self.write(omm, "R", r_rows, tz, rollup)
+            self.mark_month(omm, month_str, len(p_rows) + len(r_rows), final)
+        await self._hass.async_add_executor_job(_job)
+
+    async def async_sum_many(self, omm: str, ranges: List[Tuple[date, date]]) -> List[Dict[str, float]]:
+        return await self._hass.async_add_executor_job(self.sum_many, omm, ranges)
+
+    async def async_months_present(self, omm: str, year: int) -> Dict[str, bool]:
+        return await self._hass.async_add_executor_job(self.months_present, omm, year)
+
+    async def async_final_month(self, omm: str, month_str: str,
+                                tz: Optional[tzinfo]) -> Optional[Tuple[IntervalSeries, IntervalSeries]]:
+        return await self._hass.async_add_executor_job(self.final_month, omm, month_str, tz)
+
+    async def async_clear_final(self, omm: str) -> None:
+        await self._hass.async_add_executor_job(self.clear_final, omm)
+
+    async def async_close(self) -> None:
+        await self._hass.async_add_executor_job(self.close)
@@ -0,0 +1,27 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:  # the integration package imports Home Assistant
+    import homeassistant.core  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+
+
+@pytest.fixture
+def run_hass(tmp_path):
+    """Run ``fn(hass)`` to completion in a throwaway HomeAssistant whose config dir is ``tmp_path``."""
+    def run(fn):
+        async def main():
+            from homeassistant.core import HomeAssistant
+            hass = HomeAssistant(str(tmp_path))
+            try:
+                return await fn(hass)
+            finally:
+                await hass.async_stop(force=True)
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,74 @@
+"""Reading a month's body: streamed decode, and reuse of an unchanged payload."""
+import asyncio
+import base64
+import json
+
+from custom_components.hep_mjerenje import api
+from custom_components.hep_mjerenje.api import HepMjerenjeClient
+from custom_components.hep_mjerenje.parser import ParseSession
+
+CSV = "OMM;Datum;Vrijeme;x;x;x;x;Snaga\n" + "".join(
+    f"1;01.01.2099;{h:02d}:{m:02d}:00;;;;;{h},{m}\n" for h in range(1, 24) for m in (0, 15, 30, 45))
+
+
+class _Resp:
+    headers = {"ETag": "e1"}
+
+    def __init__(self, body):
+        self._body = body
+        self.content = self
+        self.chunks = 0
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), n):
+            self.chunks += 1
+            yield self._body[i:i + n]
+
+
+def _body(csv):
+    return json.dumps({"data": base64.b64encode(csv.encode()).decode()}).encode()
+
+
+def test_unchanged_payload_is_streamed_and_reused(monkeypatch):
+    monkeypatch.setattr(api, "STREAM_CHUNK_SIZE", 97)
+    client = HepMjerenjeClient("u", "p", None)
+    parser = client._get_parser(date_col=1, time_col=2, kw_col=7, time_fmt="%H:%M:%S", date_fmt="%d.%m.%Y")
+    key = ("1", "01.2099", "P")
+
+    async def run():
+        first = _Resp(_body(CSV))
+        rows, _, same = await client._read_payload(first, key, None, parser, None)
+        assert not same and len(rows) == 92 and first.chunks > 1
+        again = _Resp(_body(CSV))
+        reused, _, same = await client._read_payload(again, key, client._payloads[key], parser, None)
+        assert same and reused is rows and client.payloads_reused == 1
+        changed = _Resp(_body(CSV.replace(";23,45", ";9,5")))
+        new, _, same = await client._read_payload(changed, key, client._payloads[key], parser, None)
+        assert not same and new is not rows
+        assert new.val[-1] == 9.5 and list(new.ts) == list(rows.ts)
+
+    asyncio.run(run())
+
+
+def test_reused_payload_parses_no_rows(monkeypatch):
+    client = HepMjerenjeClient("u", "p", None)
+    parser = client._get_parser(date_col=1, time_col=2, kw_col=7, time_fmt="%H:%M:%S", date_fmt="%d.%m.%Y")
+    key = ("1", "01.2099", "P")
+    fed = []
+    feed = ParseSession.feed
+
+    def counting(self, lines):
+        lines = list(lines)
+        fed.extend(lines)
+        feed(self, lines)
+
+    monkeypatch.setattr(ParseSession, "feed", counting)
+
+    async def run():
+        await client._read_payload(_Resp(_body(CSV)), key, None, parser, None)
+        assert len(fed) == 93
+        fed.clear()
+        _, _, same = await client._read_payload(_Resp(_body(CSV)), key, client._payloads[key], parser, None)
+        assert same and fed == []
+
+    asyncio.run(run())
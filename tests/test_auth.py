@@ -0,0 +1,74 @@
+"""Token manager: expiry from the JWT, persistence and single-flight re-login."""
+import asyncio
+import base64
+import json
+import time
+
+from custom_components.hep_mjerenje.auth import TokenManager, jwt_expiry
+
+
+def _jwt(exp: float) -> str:
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"h.{claims}.s"
+
+
+class _Store:
+    def __init__(self, data=None):
+        self.data = data
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+
+class _Login:
+    def __init__(self, lifetime: float = 3600):
+        self.calls = 0
+        self._lifetime = lifetime
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return _jwt(time.time() + self._lifetime)
+
+
+def test_expiry_comes_from_the_jwt_claim():
+    assert jwt_expiry(_jwt(1700000000)) == 1700000000.0
+    assert jwt_expiry("opaque-token") is None
+
+
+def test_concurrent_401s_share_one_login():
+    async def run():
+        login = _Login()
+        tokens = TokenManager(login)
+        stale = await tokens.async_get_token()
+        fresh = await asyncio.gather(*[tokens.async_invalidate(stale) for _ in range(5)])
+        assert login.calls == 2 and set(fresh) == {tokens.token} and tokens.token != stale
+        # A 401 for a token that was already replaced does not log in again
+        assert await tokens.async_invalidate(stale) == tokens.token and login.calls == 2
+
+    asyncio.run(run())
+
+
+def test_token_is_renewed_before_it_expires():
+    async def run():
+        login = _Login(lifetime=30)
+        tokens = TokenManager(login, skew=60)
+        first = await tokens.async_get_token()
+        assert await tokens.async_get_token() != first and login.calls == 2
+
+    asyncio.run(run())
+
+
+def test_stored_token_survives_a_restart():
+    async def run():
+        store = _Store()
+        login = _Login()
+        token = await TokenManager(login, store=store).async_get_token()
+        assert store.data["token"] == token
+        again = TokenManager(login, store=store)
+        assert await again.async_get_token() == token and login.calls == 1
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+"""Benchmark stand-in for the HEP portal: synthetic months and a cold/warm update cycle."""
+import asyncio
+import base64
+import json
+
+import pytest
+
+from benchmarks.scenarios import update_cycle
+from benchmarks.synth import SynthConfig, interval_ends, month_csv, month_payload
+
+OPTS = dict(latency=0.0, p401=0, p429=0, p404=0, concurrency=2, omms=1)
+
+
+@pytest.mark.parametrize("month, extra", [("03.2025", -4), ("10.2025", 4), ("11.2025", 0)])
+def test_synthetic_month_has_every_interval_of_its_days(month, extra):
+    ends = list(interval_ends(month))
+    days = 30 if month == "11.2025" else 31
+    assert len(ends) == days * 96 + extra
+    assert (ends[0].hour, ends[0].minute) == (0, 15)
+    assert (ends[-1].day, ends[-1].hour, ends[-1].minute) == (1, 0, 0)
+
+
+def test_payload_wraps_the_csv_as_the_portal_does():
+    cfg = SynthConfig(missing_rate=0.0, delimiter="\t")
+    body = json.loads(month_payload("1", "10.2025", "R", cfg))
+    assert base64.b64decode(body["data"]).decode() == month_csv("1", "10.2025", "R", cfg)
+
+
+def test_warm_cycle_refetches_only_the_open_months():
+    out = asyncio.run(update_cycle(OPTS))
+    assert out["logins"] == 1
+    # Previous and current month, both directions, and their bodies are unchanged
+    assert out["warm_requests"] == out["payloads_reused"] == 4
+    assert out["cold_requests"] >= out["warm_requests"]
@@ -0,0 +1,237 @@
+"""Influx export: line protocol, batching, the spool for batches Influx could not take, and the delta watermark."""
+from datetime import date, datetime, timedelta
+import functools
+import gzip
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje import exporter
+from custom_components.hep_mjerenje.exporter import ExportWatermark, InfluxExporter, batch_lines, build_lines
+from custom_components.hep_mjerenje.series import SLOT, IntervalSeries, midnight_epoch
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+OPTS = {"influx_enabled": True, "influx_url": "http://influx", "influx_token": "t",
+        "influx_org": "o", "influx_bucket": "b"}
+NO_15M = {"export_series_15m": False}
+
+
+class _Resp:
+    def __init__(self, status):
+        self.status = status
+        self.headers = {}
+
+    async def text(self):
+        return ""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Influx:
+    """Answers every write with ``status``; keeps the lines of the writes it accepted.
+
+    With ``max_lines`` a larger write is answered with 413.
+    """
+
+    def __init__(self, status=204, max_lines=None):
+        self.status = status
+        self.max_lines = max_lines
+        self.bodies = []
+
+    def post(self, url, *, data, headers, timeout):
+        lines = gzip.decompress(data).decode().split("\n")
+        if self.max_lines is not None and len(lines) > self.max_lines:
+            return _Resp(413)
+        if self.status < 400:
+            self.bodies.append(lines)
+        return _Resp(self.status)
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    monkeypatch.setattr(exporter, "INFLUX_WRITE_RETRIES", 1)
+
+
+def test_batches_are_bounded_by_lines_and_bytes():
+    lines = [f"m v={i}" for i in range(10)]
+    assert [b.count(b"\n") + 1 for b in batch_lines(lines, max_lines=4)] == [4, 4, 2]
+    assert batch_lines(lines, max_bytes=16) == [b"m v=0\nm v=1", b"m v=2\nm v=3", b"m v=4\nm v=5",
+                                                 b"m v=6\nm v=7", b"m v=8\nm v=9"]
+    assert batch_lines([]) == []
+
+
+def test_failed_batches_are_spooled_and_replayed_first(run_hass, monkeypatch):
+    monkeypatch.setattr(exporter, "batch_lines", functools.partial(batch_lines, max_lines=2))
+
+    async def body(hass):
+        influx = _Influx(503)
+        ex = InfluxExporter(hass, "1")
+        assert await ex.async_export(OPTS, influx, ["m v=1", "m v=2", "m v=3"]) == 0
+        assert ex.spooled == 2
+        # Still down: new data goes behind the spooled batches
+        assert await ex.async_export(OPTS, influx, ["m v=4"]) == 0
+        assert ex.spooled == 3
+        influx.status = 204
+        assert await ex.async_export(OPTS, influx, ["m v=5"]) == 1
+        assert ex.spooled == 0
+        assert influx.bodies == [["m v=1", "m v=2"], ["m v=3"], ["m v=4"], ["m v=5"]]
+        assert await ex.async_export(OPTS, influx, []) == 0 and len(influx.bodies) == 4
+
+    run_hass(body)
+
+
+def test_full_spool_drops_the_oldest_batches(run_hass, monkeypatch):
+    monkeypatch.setattr(exporter, "batch_lines", functools.partial(batch_lines, max_lines=1))
+
+    async def body(hass):
+        influx = _Influx(503)
+        ex = InfluxExporter(hass, "1")
+        await ex.async_export(OPTS, influx, [f"m v={i}" for i in range(6)])
+        size = len(gzip.compress(b"m v=0", compresslevel=6))
+        monkeypatch.setattr(exporter, "INFLUX_SPOOL_MAX_BYTES", 3 * size)
+        await ex.async_export(OPTS, influx, ["m v=6"])
+        assert ex.spooled == 3
+        influx.status = 204
+        await ex.async_export(OPTS, influx, [])
+        assert influx.bodies == [["m v=4"], ["m v=5"], ["m v=6"]]
+
+    run_hass(body)
+
+
+def test_rejected_batches_are_not_spooled(run_hass):
+    async def body(hass):
+        influx = _Influx(400)
+        ex = InfluxExporter(hass, "1")
+        assert await ex.async_export(OPTS, influx, ["m v=1"]) == 1
+        assert ex.spooled == 0
+        assert await ex.async_export({}, influx, ["m v=1"]) == 0
+
+    run_hass(body)
+
+
+def test_too_large_batches_are_written_in_halves(run_hass):
+    async def body(hass):
+        influx = _Influx(max_lines=2)
+        ex = InfluxExporter(hass, "1")
+        assert await ex.async_export(OPTS, influx, [f"m v={i}" for i in range(5)]) == 1
+        assert influx.bodies == [["m v=0", "m v=1"], ["m v=2"], ["m v=3", "m v=4"]]
+        assert ex.spooled == 0
+        # A single point that is still too large is dropped, not spooled
+        influx.max_lines = 0
+        assert await ex.async_export(OPTS, influx, ["m v=5"]) == 1
+        assert ex.spooled == 0 and len(influx.bodies) == 3
+
+    run_hass(body)
+
+
+def _readings(until: datetime) -> IntervalSeries:
+    """1 kWh per 15 minutes from the start of October 2025 up to ``until``."""
+    start = int(datetime(2025, 10, 1, tzinfo=TZ).timestamp())
+    return IntervalSeries.from_pairs((ts, 1.0) for ts in range(start + 900, int(until.timestamp()) + 1, 900))
+
+
+def _kinds(lines):
+    out = {"15m": 0, "daily": [], "monthly": 0}
+    for line in lines:
+        if "granularity=daily" in line:
+            out["daily"].append(datetime.fromtimestamp(int(line.split(" ")[-1]) // 10 ** 9, TZ).date())
+        elif "granularity=monthly" in line:
+            out["monthly"] += 1
+        else:
+            out["15m"] += 1
+    return out
+
+
+def test_watermark_sends_only_new_intervals_and_changed_aggregates(run_hass):
+    async def body(hass):
+        wm = ExportWatermark(hass, "1")
+        await wm.async_load()
+
+        def plan(rows, final=False):
+            lines, commit = wm.plan({}, "1", rows, rows, lambda v: v, tz=TZ, month_final=final)
+            commit()
+            return _kinds(lines)
+
+        rows = _readings(datetime(2025, 10, 10, 12, 0, tzinfo=TZ))
+        first = plan(rows)
+        assert first["15m"] == 2 * len(rows) and first["monthly"] == 1
+        assert min(first["daily"]) == date(2025, 10, 1) and max(first["daily"]) == date(2025, 10, 10)
+        # Unchanged data sends nothing
+        assert plan(rows) == {"15m": 0, "daily": [], "monthly": 0}
+        # Six more hours: their intervals, the open day and the month
+        more = _readings(datetime(2025, 10, 10, 18, 0, tzinfo=TZ))
+        assert plan(more) == {"15m": 2 * 24, "daily": [date(2025, 10, 10)], "monthly": 1}
+        # Complete days are frozen; a revised reading there only moves the month
+        revised = IntervalSeries(more.ts, more.val[:])
+        revised.val[300] = 2.0
+        assert plan(revised) == {"15m": 0, "daily": [], "monthly": 1}
+        # Once the month is final nothing of it is sent again
+        plan(revised, final=True)
+        revised.val[-1] = 5.0
+        assert plan(revised) == {"15m": 0, "daily": [], "monthly": 0}
+        await wm.async_reset()
+        assert plan(revised)["15m"] == 2 * len(revised)
+
+    run_hass(body)
+
+
+def _rows(start: date, end: date) -> IntervalSeries:
+    """1 kWh per 15 minutes over the local days start <= d < end, end-stamped."""
+    lo, hi = midnight_epoch(start, TZ), midnight_epoch(end, TZ)
+    return IntervalSeries.from_pairs((ts, 1.0) for ts in range(lo + SLOT, hi + SLOT, SLOT))
+
+
+def _points(lines, granularity):
+    out = {}
+    for line in lines:
+        if f"granularity={granularity}" in line:
+            fields, ts = line.split(" ")[1:]
+            day = datetime.fromtimestamp(int(ts) // 1_000_000_000, TZ).date()
+            out[day] = dict(f.split("=") for f in fields.split(","))
+    return out
+
+
+def test_daily_points_cover_the_payload_month_only():
+    rows = _rows(date(2025, 10, 1), date(2025, 11, 1))
+    lines = build_lines(NO_15M, "1", rows, rows, lambda v: v, tz=TZ)
+    daily = _points(lines, "daily")
+    assert sorted(daily) == [date(2025, 10, 1) + timedelta(days=n) for n in range(31)]
+    assert daily[date(2025, 10, 26)]["consumption_kwh"] == "100.0"
+    assert daily[date(2025, 10, 31)]["consumption_kwh"] == "96.0"
+    monthly = _points(lines, "monthly")
+    assert list(monthly) == [date(2025, 10, 1)]
+    assert float(monthly[date(2025, 10, 1)]["consumption_kwh"]) == len(rows)
+
+
+def test_neighbouring_month_readings_make_no_partial_day():
+    # A payload that also carries the last reading of the previous month and the first of the next
+    rows = _rows(date(2025, 3, 1), date(2025, 4, 1))
+    ts = [rows.ts[0] - SLOT] + list(rows.ts) + [rows.ts[-1] + SLOT]
+    padded = IntervalSeries.from_pairs((t, 1.0) for t in ts)
+    lines = build_lines(NO_15M, "1", padded, padded, lambda v: v, tz=TZ)
+    daily = _points(lines, "daily")
+    assert min(daily) == date(2025, 3, 1) and max(daily) == date(2025, 3, 31)
+    assert daily[date(2025, 3, 30)]["consumption_kwh"] == "92.0"
+    assert float(_points(lines, "monthly")[date(2025, 3, 1)]["export_kwh"]) == len(rows)
+
+
+def test_replanning_unchanged_data_sends_nothing(run_hass):
+    async def body(hass):
+        wm = ExportWatermark(hass, "1")
+        await wm.async_load()
+        # Uneven values and a reading of each neighbouring month, as a payload may carry
+        rows = _rows(date(2025, 3, 1), date(2025, 4, 1))
+        ts = [rows.ts[0] - SLOT] + list(rows.ts) + [rows.ts[-1] + SLOT]
+        padded = IntervalSeries.from_pairs((t, round(0.1 + (t // SLOT) % 7 * 0.013, 3)) for t in ts)
+        lines, commit = wm.plan(NO_15M, "1", padded, padded, lambda v: v, tz=TZ, month_final=False)
+        assert _kinds(lines)["monthly"] == 1
+        commit()
+        lines, _ = wm.plan(NO_15M, "1", padded, padded, lambda v: v, tz=TZ, month_final=False)
+        assert lines == []
+
+    run_hass(body)
@@ -0,0 +1,124 @@
+"""History import job: months stream to Influx while later ones are fetched, failures stay per month."""
+import asyncio
+from datetime import datetime, timezone
+
+from benchmarks.scenarios import _integration
+from custom_components.hep_mjerenje import coordinator as coordinator_mod
+from custom_components.hep_mjerenje.coordinator import HepCoordinator
+from custom_components.hep_mjerenje.series import IntervalSeries
+from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+INFLUX = {"influx_enabled": True, "influx_url": "http://influx", "influx_token": "t",
+          "influx_org": "o", "influx_bucket": "b", "max_concurrency": 2}
+PORTAL = dict(latency=0.0, p401=0, p429=0, p404=0, concurrency=2)
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+
+    async def ensure_login(self):
+        pass
+
+    async def get_month(self, month_str, **kw):
+        self.calls.append(month_str)
+        await asyncio.sleep(0.01)
+        m, y = (int(x) for x in month_str.split("."))
+        ts = int(datetime(y, m, 2, tzinfo=timezone.utc).timestamp())
+        rows = IntervalSeries.from_pairs([(ts, 1.0), (ts + 900, 2.0)])
+        return rows, rows, False, False
+
+
+def test_imported_months_stream_to_influx(run_hass, tmp_path):
+    async def body(hass):
+        client = _Client()
+        tsdb = IntervalStore(hass, str(tmp_path / "hep.db"))
+        c = HepCoordinator(hass, client, "1", "x", oib="0", tsdb=tsdb)
+        c.set_options(INFLUX)
+        exported = []
+
+        async def export(options, session, lines):
+            exported.append((len(client.calls), lines))
+            return 1
+
+        c._exporter.async_export = export
+        months = ["01.2024", "02.2024", "03.2024", "04.2024", "05.2024"]
+        await (await c.import_history(months, export=True))
+        assert c._lifetime()[0] == 15.0 and c._import_progress()["done"] == 5
+        assert len(exported) == 5 and all(lines for _, lines in exported)
+        # The first month went out before the last one was fetched
+        assert exported[0][0] < len(months)
+        assert sorted(client.calls) == months
+        tsdb.close()
+
+    run_hass(body)
+
+
+def test_failed_month_is_recorded_and_the_job_moves_on():
+    async def run():
+        async with _integration(PORTAL, ["0000000001"]) as (fake, client, (c,)):
+            write = c._tsdb.async_write_month
+
+            async def flaky(omm, month_str, *args):
+                if month_str == "03.2023":
+                    raise OSError("disk full")
+                return await write(omm, month_str, *args)
+
+            c._tsdb.async_write_month = flaky
+            await (await c.import_years(["2023"], force=True))
+            progress = c._import_progress()
+            assert progress["state"] == "idle" and progress["done"] == 12
+            assert progress["failed"] == ["03.2023"]
+            assert "02.2023" in c._ledger.months and "04.2023" in c._ledger.months
+
+    asyncio.run(run())
+
+
+def test_crashed_job_waits_for_import_history():
+    async def run():
+        async with _integration(PORTAL, ["0000000001"]) as (fake, client, (c,)):
+            c._max_concurrency = 1
+
+            async def broken():
+                raise RuntimeError("storage gone")
+
+            c._checkpoint_import_if_due = broken
+            await (await c.import_history(["01.2023", "02.2023", "03.2023"], force=True))
+            progress = c._import_progress()
+            assert progress["state"] == "failed" and progress["error"] == "storage gone"
+            # A refresh does not restart it...
+            del c._checkpoint_import_if_due
+            await c._async_update_data()
+            assert c._import_task.done() and c._import.active
+            # ...a new import_history call does
+            await (await c.import_history(["02.2023"], force=True))
+            progress = c._import_progress()
+            assert progress["state"] == "idle" and progress["done"] == 3 and progress["error"] is None
+
+    asyncio.run(run())
+
+
+def test_checkpoints_are_batched_ledger_first(monkeypatch):
+    monkeypatch.setattr(coordinator_mod, "IMPORT_CHECKPOINT_MONTHS", 5)
+
+    async def run():
+        async with _integration(PORTAL, ["0000000001"]) as (fake, client, (c,)):
+            c._max_concurrency = 1
+            saves = []
+            flush, save = c._ledger.async_flush, c._import.async_save
+
+            async def flush_ledger():
+                saves.append(("ledger", len(c._ledger.months)))
+                await flush()
+
+            async def save_job(data=None):
+                saves.append(("job", c._import.done))
+                await save(data)
+
+            c._ledger.async_flush, c._import.async_save = flush_ledger, save_job
+            await (await c.import_years(["2023"], force=True))
+            # Queued, after months 5 and 10, then once at the end
+            assert saves == [("job", 0), ("ledger", 5), ("job", 5), ("ledger", 10), ("job", 10),
+                             ("ledger", 12), ("job", 12)]
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+"""Per-month ledger: migration of the v1 running totals, and replacing months in place."""
+import json
+
+from custom_components.hep_mjerenje.ledger import MonthLedger
+
+
+def _month(ledger, month, cons, exp=0.0, digest="h", **kw):
+    return ledger.upsert(month, cons=cons, exp=exp, rows=96, digest=digest, final=False, **kw)
+
+
+def test_v1_totals_become_the_lifetime_floor(run_hass, tmp_path):
+    (tmp_path / ".storage").mkdir()
+    (tmp_path / ".storage" / "hep_mjerenje_totals_x").write_text(json.dumps({
+        "version": 1, "minor_version": 1, "key": "hep_mjerenje_totals_x",
+        "data": {"cons_total": 1000.0, "exp_total": 50.0, "imported_months": ["01.2024", "02.2024"]},
+    }))
+
+    async def body(hass):
+        ledger = MonthLedger(hass, "x")
+        await ledger.async_load()
+        assert ledger.months == {}
+        assert ledger.lifetime() == (1000.0, 50.0)
+        # Months imported since count once they pass the old totals
+        _month(ledger, "01.2025", 600.0, 30.0)
+        _month(ledger, "02.2025", 500.0, 10.0)
+        assert ledger.lifetime() == (1100.0, 50.0)
+
+    run_hass(body)
+
+
+def test_upsert_replaces_a_month_instead_of_adding_to_it(run_hass):
+    async def body(hass):
+        ledger = MonthLedger(hass, "x")
+        await ledger.async_load()
+        assert _month(ledger, "01.2025", 100.0, 5.0, imported=True)
+        assert _month(ledger, "02.2025", 80.0)
+        # The same payload again is no change; a re-import of a corrected month replaces it
+        assert not _month(ledger, "01.2025", 100.0, 5.0, imported=True)
+        assert _month(ledger, "01.2025", 120.0, 5.0, digest="h2", imported=True)
+        assert ledger.fold() == (200.0, 5.0)
+        assert ledger.year(2025) == (200.0, 5.0) and ledger.year(2024) == (0.0, 0.0)
+        # A refresh does not take back the imported flag; imported-only lifetime skips live months
+        _month(ledger, "01.2025", 120.0, 5.0, digest="h2")
+        assert ledger.get("01.2025")["imported"]
+        assert ledger.lifetime(include_live=False) == (120.0, 5.0)
+        ledger.clear_flags()
+        assert not ledger.get("01.2025")["imported"]
+        await ledger.async_reset()
+        assert ledger.months == {} and ledger.lifetime() == (0.0, 0.0)
+
+    run_hass(body)
@@ -0,0 +1,55 @@
+"""Per-cycle phase timings, counters and percentiles."""
+import asyncio
+import time
+
+from custom_components.hep_mjerenje import metrics
+from custom_components.hep_mjerenje.metrics import Metrics
+
+
+def test_work_in_spawned_tasks_counts_for_its_own_cycle():
+    refresh, other = Metrics(), Metrics()
+
+    async def request():
+        await asyncio.sleep(0)
+        metrics.cycle().count("requests")
+
+    async def run():
+        with refresh.measure() as cyc:
+            with cyc.phase("fetch"):
+                await asyncio.gather(request(), request())
+        with other.measure():
+            await asyncio.create_task(request())
+        metrics.cycle().count("requests")  # outside any cycle: dropped
+
+    asyncio.run(run())
+    assert refresh.last.counters == {"requests": 2} and "fetch" in refresh.last.phases
+    assert other.last.counters == {"requests": 1}
+
+
+def test_percentiles_over_the_window():
+    m = Metrics(window=4)
+
+    async def run():
+        for ms in (10, 20, 30, 40, 50):
+            with m.measure() as cyc:
+                cyc.add("parse", ms / 1000)
+
+    asyncio.run(run())
+    pct = m.percentiles()
+    assert m.as_dict()["cycles"] == 4
+    assert pct["parse"] == {"p50": 40.0, "p95": 50.0}
+
+
+def test_loop_lag_is_sampled():
+    m = Metrics()
+
+    async def run():
+        with m.measure():
+            await asyncio.sleep(metrics.LOOP_LAG_INTERVAL / 2)
+            busy = time.perf_counter() + 0.25
+            while time.perf_counter() < busy:  # CPU work on the loop, past a probe
+                pass
+            await asyncio.sleep(metrics.LOOP_LAG_INTERVAL * 1.5)
+
+    asyncio.run(run())
+    assert m.last.loop_lag_ms()["max"] >= 100
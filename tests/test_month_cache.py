@@ -0,0 +1,45 @@
+"""Finalized months: when a month counts as final, and serving it from the local store."""
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje.month_cache import MonthCache, month_is_final
+from custom_components.hep_mjerenje.series import IntervalSeries
+from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+
+@pytest.mark.parametrize("month, today, final", [
+    ("10.2025", date(2025, 10, 17), False),  # current month
+    ("09.2025", date(2025, 10, 17), False),  # previous month
+    ("08.2025", date(2025, 10, 5), False),  # grace period still running
+    ("08.2025", date(2025, 10, 6), True),
+    ("12.2024", date(2025, 2, 6), True),  # across the year boundary
+    ("12.2024", date(2025, 1, 30), False),
+])
+def test_month_is_final_after_previous_month_and_grace(month, today, final):
+    assert month_is_final(month, today) is final
+
+
+def test_final_months_are_served_from_the_store_until_cleared(run_hass, tmp_path):
+    p = IntervalSeries.from_pairs([(1735690500, 1.5), (1735691400, 2.0)])
+    r = IntervalSeries.from_pairs([(1735690500, 0.25)])
+
+    async def body(hass):
+        tsdb = IntervalStore(hass, str(tmp_path / "hep.db"))
+        cache = MonthCache("1", tsdb)
+        assert await cache.async_get("01.2025", TZ) is None
+        # Stored, but not from a finalized payload yet
+        await tsdb.async_write_month("1", "01.2025", p, r, TZ)
+        assert await cache.async_get("01.2025", TZ) is None
+        await tsdb.async_write_month("1", "01.2025", p, r, TZ, final=True)
+        p_back, r_back = await cache.async_get("01.2025", TZ)
+        assert list(p_back) == list(p) and list(r_back) == list(r)
+        assert await cache.async_get("02.2025", TZ) is None
+        await cache.async_clear()
+        assert await cache.async_get("01.2025", TZ) is None
+        await tsdb.async_close()
+
+    run_hass(body)
@@ -0,0 +1,57 @@
+"""Parsing off the event loop: executor threads and the optional process pool agree."""
+import asyncio
+import threading
+from zoneinfo import ZoneInfo
+
+from benchmarks.synth import SynthConfig, month_payload
+from custom_components.hep_mjerenje import offload
+from custom_components.hep_mjerenje.api import HepMjerenjeClient
+from custom_components.hep_mjerenje.const import (
+    FIXED_DATE_COL, FIXED_DATE_FMT, FIXED_KW_COL, FIXED_TIME_COL, FIXED_TIME_FMT,
+)
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+
+class _Resp:
+    headers = {}
+
+    def __init__(self, body):
+        self._body = body
+        self.content = self
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+
+def _parser(client):
+    return client._get_parser(date_col=FIXED_DATE_COL, time_col=FIXED_TIME_COL, kw_col=FIXED_KW_COL,
+                              time_fmt=FIXED_TIME_FMT, date_fmt=FIXED_DATE_FMT)
+
+
+def test_run_cpu_leaves_the_loop_thread():
+    async def run():
+        return threading.get_ident(), await offload.run_cpu(threading.get_ident)
+
+    loop_thread, worker = asyncio.run(run())
+    assert worker != loop_thread
+
+
+def test_process_pool_parses_like_the_stream():
+    body = month_payload("0000000001", "10.2025", "P", SynthConfig())
+
+    async def read(pooled):
+        client = HepMjerenjeClient("u", "p", None)
+        key = ("0000000001", "10.2025", "P")
+        if not pooled:
+            return await client._read_payload(_Resp(body), key, None, _parser(client), TZ)
+        with offload.process_pool(1):
+            assert offload.in_process_pool()
+            return await client._read_payload(_Resp(body), key, None, _parser(client), TZ)
+
+    streamed, fb_s, _ = asyncio.run(read(False))
+    pooled, fb_p, _ = asyncio.run(read(True))
+    assert len(streamed) > 2900 and fb_s == fb_p
+    assert list(pooled) == list(streamed)
+    assert not offload.in_process_pool()
@@ -0,0 +1,62 @@
+"""CSV parser: the sliced timestamp fast path against strptime, and layout fallbacks."""
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje.parser import HepCsvParser
+from custom_components.hep_mjerenje.series import local_epoch
+
+TZ = ZoneInfo("Europe/Zagreb")
+HEADER = "OMM;Datum;Vrijeme;x;x;x;x;Energija"
+
+
+def _parser(**kw):
+    return HepCsvParser(date_col=1, time_col=2, kw_col=7, time_fmt="%H:%M:%S", date_fmt="%d.%m.%Y", **kw)
+
+
+def _day(d: date, fall_back: bool = False):
+    """HEP's rows for one local day; the repeated hour of the October switch comes twice."""
+    times = [(h, m) for h in range(24) for m in (0, 15, 30, 45)]
+    if fall_back:
+        times[12:12] = [(2, m) for m in (0, 15, 30, 45)]
+    return [f"1;{d:%d.%m.%Y};{h:02d}:{m:02d}:00;;;;;{h},{m}" for h, m in times]
+
+
+def _reference(lines):
+    out, last = [], None
+    for line in lines:
+        _, d, t, *_, v = line.split(";")
+        last = local_epoch(datetime.strptime(f"{d} {t}", "%d.%m.%Y %H:%M:%S"), TZ, last)
+        out.append((last, float(v.replace(",", "."))))
+    return sorted(out)
+
+
+@pytest.mark.parametrize("day, fall_back", [
+    (date(2025, 3, 30), False), (date(2025, 10, 26), True), (date(2025, 6, 1), False)])
+def test_fast_path_matches_strptime(day, fall_back):
+    lines = _day(day, fall_back) + _day(day + timedelta(days=1))
+    rows, fallback = _parser().parse_lines([HEADER] + lines, TZ)
+    assert list(rows) == _reference(lines)
+    assert not fallback
+
+
+def test_other_layouts_fall_back_per_row():
+    parser = _parser()
+    lines = _day(date(2025, 6, 1))[:4]
+    # A one-digit hour still takes the fast path; an ISO timestamp needs strptime
+    odd = ["1;01.06.2025;1:00:00;;;;;7,5", "1;2025-06-01;01:15:00;;;;;8"]
+    rows, fallback = parser.parse_lines([HEADER] + lines + odd, TZ)
+    assert len(rows) == 6 and parser.last_stats.slow_rows == 1 and not fallback
+    assert rows.val[-2:].tolist() == [7.5, 8.0]
+    # Columns found from the header when the fixed positions do not hold numbers
+    moved = ["Datum\tVrijeme\tStatus\tSnaga", "01.06.2025\t00:15:00\tOK\t1,25", "01.06.2025\t00:30:00\tOK\t2"]
+    rows, fallback = parser.parse_lines(moved, TZ)
+    assert fallback and rows.val.tolist() == [1.25, 2.0]
+
+
+def test_layout_is_detected_once_per_header():
+    parser = _parser()
+    first = parser.schema_for(HEADER)
+    assert parser.schema_for(HEADER + "\r\n") is first
+    assert (first.delim, first.date_idx, first.time_idx, first.value_idx) == (";", 1, 2, [7])
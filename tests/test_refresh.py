@@ -0,0 +1,33 @@
+"""The refresh fetches each planned month once, all months at the same time."""
+import asyncio
+
+from custom_components.hep_mjerenje.coordinator import HepCoordinator
+from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+        self.in_flight = self.peak = 0
+
+    async def get_month(self, month_str, **kw):
+        self.calls.append(month_str)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return [], [], False, False
+
+
+def test_months_are_fetched_once_and_concurrently(run_hass, tmp_path):
+    async def body(hass):
+        client = _Client()
+        tsdb = IntervalStore(hass, str(tmp_path / "hep.db"))
+        coordinator = HepCoordinator(hass, client, "1", "x", oib="0", tsdb=tsdb)
+        months = ["10.2099", "09.2099", "01.2099", "09.2099", "10.2099"]
+        fetched = await coordinator._fetch_months(months)
+        assert list(fetched) == ["10.2099", "09.2099", "01.2099"]
+        assert sorted(client.calls) == sorted(fetched) and client.peak == 3
+        tsdb.close()
+
+    run_hass(body)
@@ -0,0 +1,263 @@
+"""Retry delays, Retry-After parsing, the per-host circuit breaker and the request window."""
+import asyncio
+import base64
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import json
+import time
+import types
+
+import aiohttp
+import pytest
+from yarl import URL
+
+from custom_components.hep_mjerenje import retry
+from custom_components.hep_mjerenje.api import HepMjerenjeClient
+from custom_components.hep_mjerenje.retry import (
+    AdaptiveLimiter, CircuitBreaker, CircuitOpenError, RetryPolicy, parse_retry_after,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only the breaker's clock; the event loop keeps the real one
+    c = _Clock()
+    monkeypatch.setattr(retry, "time", types.SimpleNamespace(monotonic=c, perf_counter=time.perf_counter))
+    return c
+
+
+def test_breaker_opens_after_threshold(clock):
+    b = CircuitBreaker("h", threshold=3, cooldown=60)
+    for _ in range(2):
+        b.before_request()
+        b.record_failure()
+    assert b.state == CircuitBreaker.CLOSED
+    b.before_request()
+    b.record_failure()
+    assert b.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        b.before_request()
+
+
+def test_breaker_single_probe_then_close(clock):
+    b = CircuitBreaker("h", threshold=1, cooldown=60)
+    b.record_failure()
+    clock.now += 61
+    assert b.state == CircuitBreaker.HALF_OPEN
+    b.before_request()
+    with pytest.raises(CircuitOpenError):
+        b.before_request()  # the probe is taken
+    b.record_success()
+    assert b.state == CircuitBreaker.CLOSED
+    b.before_request()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    b = CircuitBreaker("h", threshold=1, cooldown=60)
+    b.record_failure()
+    clock.now += 61
+    b.before_request()
+    b.record_failure()
+    assert b.state == CircuitBreaker.OPEN
+    clock.now += 61
+    b.before_request()
+
+
+def test_breaker_retry_after_extends_cooldown(clock):
+    b = CircuitBreaker("h", threshold=1, cooldown=60)
+    b.record_failure(retry_after=300)
+    clock.now += 61
+    assert b.state == CircuitBreaker.OPEN
+    clock.now += 240
+    assert b.state == CircuitBreaker.HALF_OPEN
+
+
+def test_check_takes_no_probe(clock):
+    b = CircuitBreaker("h", threshold=1, cooldown=60)
+    b.record_failure()
+    clock.now += 61
+    b.check()
+    b.check()
+    b.before_request()
+    with pytest.raises(CircuitOpenError):
+        b.check()
+
+
+def test_limiter_grows_only_while_the_window_is_full():
+    async def run():
+        lim = AdaptiveLimiter(8)
+        lim.succeeded(0.1)  # nothing in flight: the window is not the bottleneck
+        assert lim.window == 2
+        async with lim.slot(), lim.slot():
+            lim.succeeded(0.5)  # far slower than the baseline
+            assert lim.window == 2
+            for _ in range(3):
+                lim.succeeded(0.1)
+            assert lim.limit == 3
+            lim.succeeded(0.1)  # two in flight no longer fill a window of three
+            assert lim.limit == 3
+
+    asyncio.run(run())
+
+
+def test_limiter_cuts_once_per_round_trip():
+    lim = AdaptiveLimiter(8, initial=8)
+    sent = time.perf_counter()
+    lim.throttled(sent)
+    lim.throttled(sent)  # sent before the first cut: same overload
+    assert lim.limit == 4 and lim.cuts == 1
+    for _ in range(4):
+        lim.throttled(time.perf_counter() + 1)  # each sent after the previous cut
+    assert lim.limit == 1 and lim.cuts == 5
+    lim.set_ceiling(0)
+    assert lim.ceiling == 1
+
+
+def test_limiter_bounds_in_flight_requests():
+    async def run():
+        lim = AdaptiveLimiter(8)
+        peak = running = 0
+
+        async def request():
+            nonlocal peak, running
+            async with lim.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[request() for _ in range(6)])
+        assert peak == 2
+
+    asyncio.run(run())
+
+
+def test_retry_after_seconds_or_http_date():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after(" -5 ") == 0.0
+    when = datetime.now(timezone.utc) + timedelta(seconds=90)
+    assert 80 < parse_retry_after(format_datetime(when, usegmt=True)) <= 90
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+
+
+def test_policy_delays_stay_within_base_and_cap():
+    policy = RetryPolicy(base=1.0, cap=20.0)
+    delays = [policy.next_delay() for _ in range(50)]
+    assert all(1.0 <= d <= 20.0 for d in delays) and max(delays) > 3.0
+    # The server's hint is a floor, unless it asks for longer than the cap
+    assert RetryPolicy(base=1.0, cap=20.0).next_delay(15.0) >= 15.0
+    assert RetryPolicy(base=1.0, cap=20.0).next_delay(60.0) is None
+
+
+class _Resp:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.request_info = aiohttp.RequestInfo(URL("http://hep.test"), "GET", {}, URL("http://hep.test"))
+        self.history = ()
+        self._body = body
+        self.content = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(self.request_info, (), status=self.status)
+
+    async def json(self):
+        return json.loads(self._body)
+
+
+class _Session:
+    """Scripted responses: one status per login / GET, repeating the last."""
+
+    def __init__(self, logins, gets):
+        self.logins = list(logins)
+        self.gets = list(gets)
+        self.login_calls = 0
+        self.get_calls = 0
+
+    def post(self, url, **kw):
+        self.login_calls += 1
+        status = self.logins.pop(0) if len(self.logins) > 1 else self.logins[0]
+        return _Resp(status, json.dumps({"Token": "t"}).encode())
+
+    def get(self, url, **kw):
+        self.get_calls += 1
+        status = self.gets.pop(0) if len(self.gets) > 1 else self.gets[0]
+        csv = "OMM;Datum;Vrijeme;x;x;x;x;Snaga\n1;01.01.2024;00:15:00;;;;;1,0\n"
+        body = json.dumps({"data": base64.b64encode(csv.encode()).decode()}).encode()
+        return _Resp(status, body)
+
+
+def _client(session, clock):
+    client = HepMjerenjeClient("u", "p", session, max_retries=1)
+    client._breaker = CircuitBreaker("h", threshold=1, cooldown=60)
+    return client
+
+
+async def _get(client):
+    parser = client._get_parser(date_col=1, time_col=2, kw_col=7, time_fmt="%H:%M:%S", date_fmt="%d.%m.%Y")
+    return await client._stream_month("1", "2", "01.2024", "P", parser, None)
+
+
+def test_login_failure_does_not_hold_the_probe(clock):
+    # Circuit open, cooldown over, and the login answers 503 once
+    session = _Session(logins=[503, 200], gets=[200])
+
+    async def run():
+        client = _client(session, clock)
+        client.breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            await _get(client)
+        assert session.login_calls == 0
+        clock.now += 61
+        with pytest.raises(aiohttp.ClientResponseError):
+            await _get(client)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        rows, _, _ = await _get(client)  # login tried again, the probe goes out and closes the circuit
+        assert session.login_calls == 2 and session.get_calls == 1
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        assert len(rows) == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_is_released(clock):
+    async def run():
+        client = _client(_Session(logins=[200], gets=[200]), clock)
+        client.breaker.record_failure()
+        clock.now += 61
+        gate = asyncio.Event()
+
+        class _Stuck(_Resp):
+            async def __aenter__(self):
+                await gate.wait()
+
+        client._session.get = lambda *a, **kw: _Stuck(200)
+        task = asyncio.ensure_future(_get(client))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.wait([task])
+        assert task.cancelled()
+        assert client.breaker.state == CircuitBreaker.OPEN
+        clock.now += 61
+        client.breaker.before_request()  # a new probe is available
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+"""Rollup and tariff split of end-stamped month payloads, with and without numpy."""
+from datetime import date, datetime, timedelta
+import random
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje import rollup, tariff
+from custom_components.hep_mjerenje.rollup import MonthRollup
+from custom_components.hep_mjerenje.series import SLOT, IntervalSeries, midnight_epoch
+from custom_components.hep_mjerenje.tariff import TouSchedule
+
+TZ = ZoneInfo("Europe/Zagreb")
+MONTHS = [(2025, 3), (2025, 10), (2024, 12)]
+
+
+def _month(year: int, month: int, seed: int) -> IntervalSeries:
+    rnd = random.Random(seed)
+    start = midnight_epoch(date(year, month, 1), TZ)
+    end = midnight_epoch((date(year, month, 1) + timedelta(days=32)).replace(day=1), TZ)
+    return IntervalSeries.from_pairs((ts, round(rnd.uniform(0, 1), 3)) for ts in range(start + SLOT, end + SLOT, SLOT))
+
+
+def _start(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts - SLOT, TZ)
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "pure"])
+def use_numpy(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(rollup, "np", None)
+        monkeypatch.setattr(tariff, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("year, month", MONTHS)
+def test_levels_match_per_reading_sums(use_numpy, year, month):
+    p, r = _month(year, month, 1), _month(year, month, 2)
+    ru = MonthRollup(p, r, TZ)
+    for direction, rows in (("P", p), ("R", r)):
+        days, hours = {}, {}
+        for ts, kwh in rows:
+            days[_start(ts).date()] = days.get(_start(ts).date(), 0.0) + kwh
+            hour = (ts - SLOT) - (ts - SLOT) % 3600
+            hours[hour] = hours.get(hour, 0.0) + kwh
+        assert set(ru.days(direction)) == set(days)
+        assert all(ru.days(direction)[d] == pytest.approx(kwh) for d, kwh in days.items())
+        assert [ts for ts, _ in ru.hourly(direction)] == sorted(hours)
+        assert all(kwh == pytest.approx(hours[ts]) for ts, kwh in ru.hourly(direction))
+        assert ru.total(direction) == pytest.approx(rows.sum())
+    # A payload holds exactly its own month's days
+    assert {(d.year, d.month) for d in ru.day_list()} == {(year, month)}
+
+
+@pytest.mark.parametrize("year, month", MONTHS)
+def test_tariff_split_matches_slow_path(use_numpy, year, month):
+    schedule = TouSchedule.from_options({"tou_enabled": True, "tou_holiday_nt": True})
+    p, r = _month(year, month, 3), _month(year, month, 4)
+    ru = MonthRollup(p, r, TZ, schedule)
+    vt = {}
+    for ts, kwh in p:
+        vt[_start(ts).date()] = vt.get(_start(ts).date(), 0.0) + (kwh if schedule.is_vt(ts - SLOT, TZ) else 0.0)
+    assert set(ru.tariff.vt_days) == set(vt)
+    assert all(ru.tariff.vt_days[d] == pytest.approx(kwh) for d, kwh in vt.items())
+    month_vt, month_nt = ru.tou_range()
+    assert month_vt + month_nt == pytest.approx(p.sum())
+    assert ru.tariff.peak_kwh == max(kwh for _, kwh in p)
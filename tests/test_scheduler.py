@@ -0,0 +1,43 @@
+"""Refresh timing around HEP's publication window."""
+from datetime import datetime, timedelta
+
+from custom_components.hep_mjerenje.scheduler import PollScheduler
+
+CEILING = timedelta(hours=12)
+
+
+def _at(hour, minute=0, day=10):
+    return datetime(2025, 10, day, hour, minute)
+
+
+def test_sleeps_until_the_window_then_backs_off(run_hass):
+    async def body(hass):
+        s = PollScheduler(hass, "1")
+        await s.async_load()
+        assert s.window == "06:00"
+        assert s.next_interval(_at(3), False, CEILING) == timedelta(hours=3)
+        waits = [s.next_interval(_at(6, 10), False, CEILING) for _ in range(3)]
+        assert waits == [timedelta(minutes=15), timedelta(minutes=30), timedelta(minutes=30)]
+        # Yesterday complete: quiet until tomorrow's window, never past the ceiling
+        assert s.next_interval(_at(23), True, CEILING) == timedelta(hours=7)
+        assert s.next_interval(_at(9), True, CEILING) == CEILING
+        # Long past the window without data: the configured interval
+        assert s.next_interval(_at(19), False, timedelta(hours=2)) == timedelta(hours=2)
+
+    run_hass(body)
+
+
+def test_window_follows_observed_publication_times(run_hass):
+    async def body(hass):
+        s = PollScheduler(hass, "1")
+        await s.async_load()
+        for day in range(1, 6):
+            s.observe(_at(7, day=day), False)
+            s.observe(_at(7, 45, day=day), True)
+        assert s.window == "07:15"
+        # Already complete at the first polls of the window: probe earlier
+        for day in (6, 7):
+            s.observe(_at(7, 20, day=day), True)
+        assert s.window == "06:15"
+
+    run_hass(body)
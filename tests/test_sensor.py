@@ -0,0 +1,62 @@
+"""Entities write state only when their own value, or availability, changed."""
+import types
+
+from homeassistant.components.sensor import SensorStateClass
+
+from custom_components.hep_mjerenje.const import (
+    KEY_CONS_MONTH, KEY_DIAG_BREAKER, KEY_DIAG_PARSE_RATE, KEY_DIAG_ROWS, KEY_EXP_MONTH,
+)
+from custom_components.hep_mjerenje.sensor import HepDiagSensor, HepEnergySensor
+
+
+def _coordinator(data):
+    return types.SimpleNamespace(data=data, changed_keys=set(data), last_update_success=True,
+                                 breaker_state="closed", serving_stale=False)
+
+
+def _counting(entity):
+    entity.writes = 0
+
+    def write():
+        entity.writes += 1
+
+    entity.async_write_ha_state = write
+    return entity
+
+
+def _update(coordinator, data):
+    old = coordinator.data
+    coordinator.data = {**old, **data}
+    coordinator.changed_keys = {k for k, v in coordinator.data.items() if old.get(k) != v}
+
+
+def test_energy_sensor_skips_unchanged_values():
+    c = _coordinator({KEY_CONS_MONTH: 1.0, KEY_EXP_MONTH: 0.5})
+    sensor = _counting(HepEnergySensor(c, "Month", KEY_CONS_MONTH, SensorStateClass.TOTAL, None, "1"))
+    sensor._handle_coordinator_update()
+    _update(c, {KEY_EXP_MONTH: 0.75})
+    sensor._handle_coordinator_update()
+    assert sensor.writes == 1
+    _update(c, {KEY_CONS_MONTH: 2.0})
+    sensor._handle_coordinator_update()
+    assert sensor.writes == 2 and sensor.native_value == 2.0
+    # A failed refresh changes no values, but the lost availability is written once
+    c.changed_keys, c.last_update_success = set(), False
+    sensor._handle_coordinator_update()
+    sensor._handle_coordinator_update()
+    assert sensor.writes == 3
+
+
+def test_diagnostics_ignore_volatile_keys():
+    c = _coordinator({KEY_DIAG_ROWS: 10, KEY_DIAG_PARSE_RATE: 100, "last_update": "t0"})
+    diag = _counting(HepDiagSensor(c, "Diagnostics", None, "1"))
+    _update(c, {KEY_DIAG_PARSE_RATE: 120, "last_update": "t1"})
+    diag._handle_coordinator_update()
+    assert diag.writes == 0 and diag.extra_state_attributes["last_update"] == "t0"
+    # Refreshed alongside a real change
+    _update(c, {KEY_DIAG_ROWS: 11, "last_update": "t2"})
+    diag._handle_coordinator_update()
+    assert diag.writes == 1 and diag.extra_state_attributes["last_update"] == "t2"
+    c.changed_keys, c.breaker_state = set(), "open"
+    diag._handle_coordinator_update()
+    assert diag.writes == 2 and diag.extra_state_attributes[KEY_DIAG_BREAKER] == "open"
@@ -0,0 +1,44 @@
+"""Columnar readings: ordering, range sums and per-day sums, with and without numpy."""
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje import series
+from custom_components.hep_mjerenje.series import IntervalSeries, local_epoch, midnight_epoch
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "pure"])
+def use_numpy(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(series, "np", None)
+    return request.param
+
+
+def test_repeated_wall_time_maps_to_the_second_pass():
+    first = local_epoch(datetime(2025, 10, 26, 2, 30), TZ)
+    assert local_epoch(datetime(2025, 10, 26, 2, 30), TZ, after=first) == first + 3600
+    # Before the first pass the earlier occurrence stands
+    assert local_epoch(datetime(2025, 10, 26, 2, 30), TZ, after=first - 900) == first
+
+
+def test_pairs_are_sorted_and_ranges_are_half_open(use_numpy):
+    s = IntervalSeries.from_pairs([(300, 3.0), (100, 1.0), (200, 2.0), (400, 4.0)])
+    assert list(s.ts) == [100, 200, 300, 400] and s.sum() == 10.0
+    assert s.sum_range(200, 400) == 5.0
+    assert s.sum_range(None, 200) == 1.0 and s.sum_range(300, None) == 7.0
+    assert s.sum_range(250, 250) == 0.0
+    assert list(s.slice(150, 350)) == [(200, 2.0), (300, 3.0)]
+    assert list(IntervalSeries.from_json(s.to_json())) == list(s)
+
+
+def test_days_follow_local_midnight(use_numpy):
+    # Noon readings on three local days around the spring DST switch
+    days = [date(2025, 3, 29), date(2025, 3, 30), date(2025, 3, 31)]
+    s = IntervalSeries.from_pairs((midnight_epoch(d, TZ) + 12 * 3600 + k * 900, 0.5 + k)
+                                  for d in days for k in range(4))
+    assert s.group_by_day(TZ) == {d: 8.0 for d in days}
+    assert [(d, hi - lo) for d, lo, hi in s.day_bounds(TZ)] == [(d, 4) for d in days]
+    assert IntervalSeries().group_by_day(TZ) == {} and IntervalSeries().sum() == 0.0
@@ -0,0 +1,49 @@
+"""Data snapshot restored at setup: values of a past period are dropped, recent ones shown while stale."""
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from homeassistant.util import dt as dt_util
+
+from custom_components.hep_mjerenje.const import (
+    KEY_CONS_MONTH, KEY_CONS_TOTAL, KEY_CONS_YEAR, KEY_CONS_YESTERDAY, KEY_DIAG_CYCLE_MS, KEY_DIAG_IMPORT,
+    KEY_DIAG_RESTORED,
+)
+from custom_components.hep_mjerenje.coordinator import HepCoordinator
+from custom_components.hep_mjerenje.snapshot import DataSnapshot
+from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+DATA = {KEY_CONS_YESTERDAY: 1.0, KEY_CONS_MONTH: 2.0, KEY_CONS_YEAR: 3.0, KEY_CONS_TOTAL: 4.0,
+        KEY_DIAG_CYCLE_MS: 5.0, KEY_DIAG_IMPORT: {"state": "idle"}}
+SAVED = datetime(2025, 3, 31, 7, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("today, keys", [
+    (date(2025, 3, 31), {KEY_CONS_YESTERDAY, KEY_CONS_MONTH, KEY_CONS_YEAR, KEY_CONS_TOTAL}),
+    (date(2025, 4, 1), {KEY_CONS_YEAR, KEY_CONS_TOTAL}),
+    (date(2026, 1, 1), {KEY_CONS_TOTAL}),
+], ids=["same-day", "next-month", "next-year"])
+def test_values_of_a_past_period_are_dropped(run_hass, today, keys):
+    async def body(hass):
+        snapshot = DataSnapshot(hass, "1")
+        snapshot.save(DATA, SAVED.date(), SAVED)
+        data, saved_at = await snapshot.async_load(today)
+        assert set(data) == keys and saved_at == SAVED
+
+    run_hass(body)
+
+
+@pytest.mark.parametrize("age, stale", [(timedelta(hours=1), True), (timedelta(days=2), False)])
+def test_restored_values_are_served_while_refreshes_fail(run_hass, tmp_path, age, stale):
+    async def body(hass):
+        tsdb = IntervalStore(hass, str(tmp_path / "hep.db"))
+        coordinator = HepCoordinator(hass, None, "1", "x", oib="0", tsdb=tsdb)
+        assert not await coordinator.async_restore_snapshot()
+        now = dt_util.now()
+        coordinator._snapshot.save(DATA, now.date(), now - age)
+        assert await coordinator.async_restore_snapshot()
+        assert coordinator.data[KEY_CONS_TOTAL] == 4.0 and KEY_DIAG_RESTORED in coordinator.data
+        coordinator.last_update_success = False
+        assert coordinator.serving_stale is stale
+        tsdb.close()
+
+    run_hass(body)
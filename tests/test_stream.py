@@ -0,0 +1,61 @@
+"""Streaming base64 decode of month payloads, split at every possible chunk boundary.
+
+Lines are split on LF only; the parser drops the CR of CRLF lines.
+"""
+import base64
+import binascii
+import json
+
+import pytest
+
+from custom_components.hep_mjerenje.stream import JsonBase64LineDecoder
+
+TEXT = "OMM;Datum;Vrijeme;a;b;c;d;Energija\r\n" + "".join(
+    f"1;01.10.2025;{h:02d}:{m:02d}:00;x;x;x;x;{h},{m}\r\n" for h in range(3) for m in (0, 15, 30, 45)) + "Čćž ??? ~~~"
+B64 = base64.b64encode(TEXT.encode()).decode()
+
+
+def _decode(body: bytes, size: int) -> str:
+    dec = JsonBase64LineDecoder("data")
+    lines = []
+    for i in range(0, len(body), size):
+        lines += dec.feed(body[i:i + size])
+    lines += dec.close()
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("body", [
+    json.dumps({"data": B64}),
+    json.dumps({"meta": {"data_format": "csv"}, "data": B64, "x": "y"}),
+    # Escaped slashes and line breaks inside the string
+    json.dumps({"data": "\n".join(B64[i:i + 76] for i in range(0, len(B64), 76))}).replace("/", "\\/"),
+], ids=["plain", "surrounded", "escaped"])
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 7, 64, 4096])
+def test_any_chunking_gives_the_same_lines(body, size):
+    assert _decode(body.encode(), size) == TEXT
+
+
+def test_split_at_each_offset():
+    # Two chunks, cut everywhere: inside the key, the base64 quartets, a UTF-8 character and an escape
+    body = json.dumps({"data": B64}).replace("/", "\\/").encode()
+    for cut in range(1, len(body)):
+        dec = JsonBase64LineDecoder("data")
+        lines = dec.feed(body[:cut]) + dec.feed(body[cut:]) + dec.close()
+        assert "\n".join(lines) == TEXT, cut
+
+
+@pytest.mark.parametrize("body", ['{"data": null}', '{"data": ""}', '{"other": "AAAA"}'])
+def test_missing_or_empty_field_gives_no_lines(body):
+    assert _decode(body.encode(), 3) == ""
+
+
+@pytest.mark.parametrize("body", [
+    json.dumps({"data": B64})[:-10],  # cut off inside the string
+    json.dumps({"data": B64[:-3]}),  # truncated mid-quartet
+    json.dumps({"data": B64[:-2] + "A"}),
+    json.dumps({"data": "AA==" + B64}),  # padding in the middle
+], ids=["unterminated", "tail-1", "tail-3", "inner-padding"])
+@pytest.mark.parametrize("size", [3, 4096])
+def test_broken_base64_raises(body, size):
+    with pytest.raises(binascii.Error):
+        _decode(body.encode(), size)
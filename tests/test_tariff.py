@@ -0,0 +1,59 @@
+"""Time-of-use schedule: holidays, VT windows per summer/winter day and the month mask."""
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje.series import SLOT, midnight_epoch
+from custom_components.hep_mjerenje.tariff import TouSchedule, croatian_holidays, easter
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+
+@pytest.mark.parametrize("year, sunday", [(2019, date(2019, 4, 21)), (2024, date(2024, 3, 31)),
+                                          (2025, date(2025, 4, 20)), (2038, date(2038, 4, 25))])
+def test_easter(year, sunday):
+    assert easter(year) == sunday
+
+
+def test_holidays_include_movable_feasts():
+    days = croatian_holidays(2025)
+    assert {date(2025, 4, 21), date(2025, 6, 19), date(2025, 5, 30), date(2025, 12, 26)} <= days
+    assert date(2025, 4, 22) not in days
+
+
+def test_disabled_or_invalid_options():
+    assert TouSchedule.from_options({}) is None
+    bad = TouSchedule.from_options({"tou_enabled": True, "tou_vt_winter": "21-7", "tou_extra_holidays": "x"})
+    assert bad.vt_winter == (7 * 60, 21 * 60) and bad.vt_summer == (8 * 60, 22 * 60) and bad.extra_days == ()
+
+
+@pytest.mark.parametrize("year, month", [(2025, 3), (2025, 10), (2025, 1)])
+def test_mask_matches_per_slot_lookup(year, month):
+    schedule = TouSchedule.from_options({"tou_enabled": True, "tou_weekend_nt": True, "tou_holiday_nt": True,
+                                         "tou_extra_holidays": "03-10, 2025-10-27"})
+    start, flags = schedule.mask(year, month, TZ)
+    nxt = (date(year, month, 1) + timedelta(days=32)).replace(day=1)
+    assert start == midnight_epoch(date(year, month, 1), TZ)
+    assert len(flags) * SLOT == midnight_epoch(nxt, TZ) - start
+    assert [bool(f) for f in flags] == [schedule.is_vt(start + i * SLOT, TZ) for i in range(len(flags))]
+
+
+def test_summer_and_winter_windows():
+    schedule = TouSchedule.from_options({"tou_enabled": True})
+
+    def vt(*args):
+        return schedule.is_vt(int(datetime(*args, tzinfo=TZ).timestamp()), TZ)
+
+    assert vt(2025, 1, 15, 7, 0) and not vt(2025, 1, 15, 21, 0) and not vt(2025, 1, 15, 6, 45)
+    assert vt(2025, 7, 15, 21, 45) and not vt(2025, 7, 15, 7, 45)
+    # Weekends are VT unless weekend_nt is set
+    assert vt(2025, 1, 18, 12, 0)
+
+
+def test_key_tracks_every_setting():
+    base = {"tou_enabled": True}
+    keys = {TouSchedule.from_options({**base, **extra}).key for extra in (
+        {}, {"tou_weekend_nt": True}, {"tou_holiday_nt": True}, {"tou_vt_summer": "07:30-21:30"},
+        {"tou_extra_holidays": "12-24"})}
+    assert len(keys) == 5
@@ -0,0 +1,122 @@
+"""Hour and day buckets of end-stamped readings, including the DST switch days."""
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.hep_mjerenje.rollup import MonthRollup
+from custom_components.hep_mjerenje.series import SLOT, IntervalSeries, midnight_epoch
+from custom_components.hep_mjerenje.tsdb import IntervalStore
+
+TZ = ZoneInfo("Europe/Zagreb")
+
+
+def _month(year: int, month: int) -> IntervalSeries:
+    """One reading of 1 kWh per 15 minutes, stamped at the interval end, as HEP sends a month."""
+    start = midnight_epoch(date(year, month, 1), TZ)
+    end = midnight_epoch((date(year, month, 1) + timedelta(days=32)).replace(day=1), TZ)
+    return IntervalSeries.from_pairs((ts, 1.0) for ts in range(start + SLOT, end + SLOT, SLOT))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IntervalStore(None, str(tmp_path / "hep.db"))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("year, month, switch, slots", [(2025, 3, 30, 92), (2025, 10, 26, 100)])
+def test_day_bounds_follow_interval_start(year, month, switch, slots):
+    rows = _month(year, month)
+    bounds = rows.day_bounds(TZ)
+    assert [d for d, _, _ in bounds] == [date(year, month, n) for n in range(1, len(bounds) + 1)]
+    sizes = {d.day: hi - lo for d, lo, hi in bounds}
+    assert sizes[switch] == slots
+    assert all(n == 96 for day, n in sizes.items() if day != switch)
+    # The month's last reading (stamped 00:00 on the 1st) closes its last day
+    assert bounds[-1][2] == len(rows)
+
+
+def test_midnight_reading_counts_for_previous_day(store):
+    store.write("1", "P", _month(2025, 3), TZ)
+    store.write("1", "P", _month(2025, 4), TZ)
+    assert store.sum_days("1", date(2025, 3, 31), date(2025, 4, 1)) == {"P": 96.0}
+    assert store.sum_days("1", date(2025, 4, 1), date(2025, 4, 2)) == {"P": 96.0}
+    assert store.sum_days("1", date(2025, 3, 30), date(2025, 3, 31)) == {"P": 92.0}
+
+
+@pytest.mark.parametrize("year, month", [(2025, 3), (2025, 10)])
+def test_hours_start_at_the_interval_start(store, year, month):
+    rows = _month(year, month)
+    store.write("1", "P", rows, TZ)
+    hours = store.hourly("1", "P", 0, 2 ** 40)
+    assert all(kwh == 4.0 for _, kwh in hours)
+    assert sum(kwh for _, kwh in hours) == len(rows)
+    first = datetime.fromtimestamp(hours[0][0], TZ)
+    assert (first.day, first.hour, first.minute) == (1, 0, 0)
+    last = datetime.fromtimestamp(hours[-1][0], TZ)
+    assert (last.hour, last.minute) == (23, 0)
+    # One bucket per UTC hour, so the repeated 02:00 in October is two hours
+    assert [b - a for (a, _), (b, _) in zip(hours, hours[1:])] == [3600] * (len(hours) - 1)
+
+
+def test_hours_from_the_first_changed_one_are_queued(store):
+    rows = _month(2025, 3)
+    store.write("1", "P", rows, TZ)
+    base, hours = store.unpushed_hours("1", "P")
+    assert base == 0.0 and len(hours) == len(rows) // 4
+    store.mark_pushed("1", "P", hours)
+    assert store.unpushed_hours("1", "P") == (0.0, [])
+    # Rewriting the same readings queues nothing; a revised one queues from its hour on
+    store.write("1", "P", rows, TZ)
+    assert store.unpushed_hours("1", "P") == (0.0, [])
+    store.write("1", "P", IntervalSeries.from_pairs([(rows.ts[40], 3.0)]), TZ)
+    base, queued = store.unpushed_hours("1", "P")
+    assert base == 40.0 and queued[0] == (hours[10][0], 6.0) and len(queued) == len(hours) - 10
+
+
+def test_hour_rewritten_while_pushing_stays_queued(store):
+    rows = _month(2025, 3)
+    store.write("1", "P", rows, TZ)
+    base, hours = store.unpushed_hours("1", "P")
+    # A newer payload revises the second hour before the push is marked
+    changed = IntervalSeries.from_pairs([(rows.ts[4], 2.0)])
+    store.write("1", "P", changed, TZ)
+    store.mark_pushed("1", "P", hours)
+    base, queued = store.unpushed_hours("1", "P")
+    assert queued[0] == (hours[1][0], 5.0)
+    assert base == 4.0 and len(queued) == len(hours) - 1
+
+
+def test_final_month_is_served_from_the_readings(store):
+    p, r = _month(2025, 10), _month(2025, 10)
+    store.write("1", "P", _month(2025, 9), TZ)
+    store.write("1", "P", p, TZ)
+    store.write("1", "R", r, TZ)
+    store.mark_month("1", "10.2025", len(p) + len(r))
+    assert store.final_month("1", "10.2025", TZ) is None
+    store.mark_month("1", "10.2025", len(p) + len(r), final=True)
+    assert store.months_present("1", 2025) == {"10.2025": True}
+    p_back, r_back = store.final_month("1", "10.2025", TZ)
+    assert list(p_back) == list(p) and list(r_back) == list(r)
+    store.clear_final("1")
+    assert store.final_month("1", "10.2025", TZ) is None
+
+
+def test_buckets_are_taken_from_the_rollup(store):
+    rows = _month(2025, 10)
+    store.write("1", "P", rows, TZ)
+    hours, days = store.hourly("1", "P", 0, 2 ** 40), store.sum_days("1", date(2025, 10, 1), date(2025, 11, 1))
+    # Same buckets as recomputing them from the readings
+    other = IntervalStore(None, store._path + ".2")
+    other.write("1", "P", rows, TZ, MonthRollup(rows, IntervalSeries(), TZ))
+    assert other.hourly("1", "P", 0, 2 ** 40) == hours
+    assert other.sum_days("1", date(2025, 10, 1), date(2025, 11, 1)) == days
+    # Written as summed, not regrouped in SQL: a rollup of other values wins over the readings
+    doubled = IntervalSeries.from_pairs((ts, 2.0) for ts in rows.ts)
+    store.mark_pushed("1", "P", hours)
+    store.write("1", "P", rows, TZ, MonthRollup(doubled, IntervalSeries(), TZ))
+    assert all(kwh == 8.0 for _, kwh in store.hourly("1", "P", 0, 2 ** 40))
+    assert store.sum_days("1", date(2025, 10, 26), date(2025, 10, 27)) == {"P": 200.0}
+    assert len(store.unpushed_hours("1", "P")[1]) == len(hours)
+    other.close()